@@ -0,0 +1,76 @@
+"""sync legacy schema
+
+Columns and tables that used to be added at boot (create_all + ALTER TABLE in
+main.py) or by /admin/repair-production. Every statement is idempotent so the
+revision also applies cleanly to databases that were built that way.
+
+Revision ID: 3c9e5b7a1d20
+Revises: aaf548e60ea1
+Create Date: 2026-10-19 09:12:40.118231
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e5b7a1d20'
+down_revision: Union[str, Sequence[str], None] = 'aaf548e60ea1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+ADD_COLUMNS = [
+    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS logo_url VARCHAR DEFAULT NULL",
+    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS primary_color VARCHAR DEFAULT '#2D5F6D'",
+    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS secondary_color VARCHAR DEFAULT '#EF4835'",
+    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS navbar_bg VARCHAR",
+    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS navbar_text_color VARCHAR",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR DEFAULT 'admin'",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN DEFAULT FALSE",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS setup_token VARCHAR UNIQUE",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMP WITH TIME ZONE DEFAULT now()",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login TIMESTAMP WITH TIME ZONE DEFAULT NULL",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS accessible_assets JSON DEFAULT '[\"*\"]'",
+    # New users have no password until they finish the setup link
+    "ALTER TABLE users ALTER COLUMN hashed_password DROP NOT NULL",
+    "ALTER TABLE devices ADD COLUMN IF NOT EXISTS driver_name VARCHAR DEFAULT NULL",
+]
+
+# Index create_all adds for the index=True column. The table is small.
+ADD_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_device_data_device_id ON device_data (device_id)",
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for stmt in ADD_COLUMNS + ADD_INDEXES:
+        op.execute(stmt)
+
+    if not sa.inspect(op.get_bind()).has_table("audit_logs"):
+        op.create_table(
+            'audit_logs',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=True),
+            sa.Column('tenant_id', sa.Integer, sa.ForeignKey('tenants.id'), nullable=True),
+            sa.Column('action', sa.String, nullable=False),
+            sa.Column('details', sa.JSON),
+            sa.Column('ip_address', sa.String, nullable=True),
+            sa.Column('timestamp', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_audit_logs_action', 'audit_logs', ['action'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('audit_logs')
+    op.execute("DROP INDEX IF EXISTS ix_device_data_device_id")
+    op.drop_column('devices', 'driver_name')
+    for column in ('accessible_assets', 'last_login', 'updated_at', 'created_at', 'setup_token', 'is_active', 'role'):
+        op.drop_column('users', column)
+    for column in ('navbar_text_color', 'navbar_bg', 'secondary_color', 'primary_color', 'logo_url'):
+        op.drop_column('tenants', column)
@@ -0,0 +1,101 @@
+"""positions geom column, alerts, tracks and email outbox
+
+Revision ID: 7f2a4c6e8b31
+Revises: 3c9e5b7a1d20
+Create Date: 2026-10-19 09:31:05.402817
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f2a4c6e8b31'
+down_revision: Union[str, Sequence[str], None] = '3c9e5b7a1d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS postgis")
+    # Nullable, no default: a catalog-only change, no table rewrite. Backfilled in the next revision.
+    op.execute("ALTER TABLE positions ADD COLUMN IF NOT EXISTS geom geography(POINT, 4326)")
+
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table("alert_rules"):
+        op.create_table(
+            'alert_rules',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('tenant_id', sa.Integer, sa.ForeignKey('tenants.id')),
+            sa.Column('device_id', sa.Integer, sa.ForeignKey('devices.id'), nullable=True),
+            sa.Column('rule_type', sa.String, nullable=False),
+            sa.Column('threshold', sa.Float, nullable=True),
+            sa.Column('duration_seconds', sa.Integer),
+            sa.Column('is_active', sa.Boolean),
+            sa.Column('created_by', sa.Integer, sa.ForeignKey('users.id'), nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_alert_rules_tenant_id', 'alert_rules', ['tenant_id'])
+
+    if not inspector.has_table("alerts"):
+        op.create_table(
+            'alerts',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('rule_id', sa.Integer, sa.ForeignKey('alert_rules.id', ondelete='SET NULL'), nullable=True),
+            sa.Column('device_id', sa.Integer, sa.ForeignKey('devices.id', ondelete='CASCADE')),
+            sa.Column('tenant_id', sa.Integer, sa.ForeignKey('tenants.id')),
+            sa.Column('alert_type', sa.String, nullable=False),
+            sa.Column('message', sa.String),
+            sa.Column('details', sa.JSON),
+            sa.Column('triggered_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index('ix_alerts_tenant_id', 'alerts', ['tenant_id'])
+        op.create_index('ix_alerts_alert_type', 'alerts', ['alert_type'])
+
+    if not inspector.has_table("device_tracks"):
+        op.create_table(
+            'device_tracks',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('device_id', sa.Integer, sa.ForeignKey('devices.id', ondelete='CASCADE')),
+            sa.Column('day', sa.Date, nullable=False),
+            sa.Column('distance_km', sa.Float),
+            sa.Column('moving_seconds', sa.Integer),
+            sa.Column('stop_count', sa.Integer),
+            sa.Column('stops', sa.JSON),
+            sa.Column('points', sa.JSON),
+            sa.Column('raw_points', sa.Integer),
+            sa.Column('rejected_points', sa.Integer),
+            sa.Column('processed_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.UniqueConstraint('device_id', 'day', name='uq_device_tracks_device_day'),
+        )
+        op.create_index('ix_device_tracks_device_id', 'device_tracks', ['device_id'])
+
+    if not inspector.has_table("email_outbox"):
+        op.create_table(
+            'email_outbox',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('to_email', sa.String, nullable=False),
+            sa.Column('subject', sa.String, nullable=False),
+            sa.Column('html_content', sa.Text, nullable=False),
+            sa.Column('status', sa.String),
+            sa.Column('attempts', sa.Integer),
+            sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('last_error', sa.String, nullable=True),
+            sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column('sent_at', sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index('ix_email_outbox_status', 'email_outbox', ['status'])
+        op.create_index('ix_email_outbox_next_attempt_at', 'email_outbox', ['next_attempt_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('email_outbox')
+    op.drop_table('device_tracks')
+    op.drop_table('alerts')
+    op.drop_table('alert_rules')
+    op.execute("ALTER TABLE positions DROP COLUMN IF EXISTS geom")
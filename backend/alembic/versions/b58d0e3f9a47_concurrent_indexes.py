@@ -0,0 +1,68 @@
+"""backfill positions.geom, build GiST and audit indexes concurrently
+
+positions and audit_logs are the hot tables, so nothing here holds a lock
+longer than one batch: the backfill commits every BACKFILL_BATCH ids and the
+indexes are built with CREATE INDEX CONCURRENTLY (outside a transaction).
+
+Revision ID: b58d0e3f9a47
+Revises: 7f2a4c6e8b31
+Create Date: 2026-10-19 09:48:57.760954
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b58d0e3f9a47'
+down_revision: Union[str, Sequence[str], None] = '7f2a4c6e8b31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH = 50000
+
+INDEXES = [
+    ("idx_positions_geom", "positions USING GIST (geom)"),
+    ("ix_audit_logs_ts_id", "audit_logs (timestamp, id)"),
+    ("ix_audit_logs_tenant_ts_id", "audit_logs (tenant_id, timestamp, id)"),
+    ("ix_audit_logs_tenant_action_ts_id", "audit_logs (tenant_id, action, timestamp, id)"),
+    ("ix_audit_logs_tenant_user_ts_id", "audit_logs (tenant_id, user_id, timestamp, id)"),
+]
+
+
+def create_index_concurrently(bind, name: str, definition: str):
+    # An interrupted concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+    invalid = bind.execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).first()
+    if invalid:
+        bind.execute(sa.text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    bind.execute(sa.text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+
+        # Backfill in id ranges, one short transaction each
+        max_id = bind.execute(sa.text("SELECT max(id) FROM positions")).scalar() or 0
+        for start in range(0, max_id + 1, BACKFILL_BATCH):
+            bind.execute(sa.text(
+                "UPDATE positions SET geom = ST_SetSRID(ST_MakePoint(longitude, latitude), 4326)::geography "
+                "WHERE id >= :start AND id < :end AND geom IS NULL "
+                "AND latitude IS NOT NULL AND longitude IS NOT NULL"
+            ), {"start": start, "end": start + BACKFILL_BATCH})
+
+        for name, definition in INDEXES:
+            create_index_concurrently(bind, name, definition)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, _ in reversed(INDEXES):
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,41 @@
+"""position_archives manifest of the Parquet cold archive
+
+Revision ID: c41d7a2f9e63
+Revises: b58d0e3f9a47
+Create Date: 2026-10-19 14:12:40.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d7a2f9e63'
+down_revision: Union[str, Sequence[str], None] = 'b58d0e3f9a47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'position_archives',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('tenant_id', sa.Integer, sa.ForeignKey('tenants.id'), nullable=False),
+        sa.Column('month', sa.Date, nullable=False),
+        sa.Column('path', sa.String, nullable=False),
+        sa.Column('row_count', sa.Integer),
+        sa.Column('size_bytes', sa.BigInteger),
+        sa.Column('device_count', sa.Integer),
+        sa.Column('first_timestamp', sa.DateTime(timezone=True)),
+        sa.Column('last_timestamp', sa.DateTime(timezone=True)),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index('ix_position_archives_tenant_month', 'position_archives', ['tenant_id', 'month'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('position_archives')
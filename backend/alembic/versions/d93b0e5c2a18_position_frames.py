@@ -0,0 +1,43 @@
+"""position_frames side table and per-tenant raw frame settings
+
+Revision ID: d93b0e5c2a18
+Revises: c41d7a2f9e63
+Create Date: 2026-10-19 16:05:21.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd93b0e5c2a18'
+down_revision: Union[str, Sequence[str], None] = 'c41d7a2f9e63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable, no default: catalog-only changes (NULL = the RAW_FRAME_* settings)
+    op.execute("ALTER TABLE tenants ADD COLUMN IF NOT EXISTS raw_frames VARCHAR")
+    op.execute("ALTER TABLE tenants ADD COLUMN IF NOT EXISTS raw_frame_retention_days INTEGER")
+
+    op.create_table(
+        'position_frames',
+        sa.Column('position_id', sa.Integer, primary_key=True),
+        sa.Column('tenant_id', sa.Integer, nullable=True),
+        sa.Column('received_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('codec', sa.String, nullable=False),
+        sa.Column('size', sa.Integer),
+        sa.Column('payload', sa.LargeBinary, nullable=False),
+    )
+    op.create_index('ix_position_frames_tenant_received', 'position_frames', ['tenant_id', 'received_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('position_frames')
+    op.execute("ALTER TABLE tenants DROP COLUMN IF EXISTS raw_frame_retention_days")
+    op.execute("ALTER TABLE tenants DROP COLUMN IF EXISTS raw_frames")
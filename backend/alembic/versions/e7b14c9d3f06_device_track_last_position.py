@@ -0,0 +1,28 @@
+"""device_tracks.last_position_id, to reprocess days that received late fixes
+
+Revision ID: e7b14c9d3f06
+Revises: d93b0e5c2a18
+Create Date: 2026-10-19 18:42:07.114208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b14c9d3f06'
+down_revision: Union[str, Sequence[str], None] = 'd93b0e5c2a18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable, no default: catalog-only change (NULL = processed before this column, done once more)
+    op.execute("ALTER TABLE device_tracks ADD COLUMN IF NOT EXISTS last_position_id INTEGER")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("ALTER TABLE device_tracks DROP COLUMN IF EXISTS last_position_id")
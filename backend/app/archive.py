@@ -0,0 +1,266 @@
+"""
+Parquet cold archive for old positions.
+
+    python -m app.archive              # archive every closed month older than ARCHIVE_AFTER_DAYS
+    python -m app.archive --dry-run    # list what would move
+    python -m app.archive --tenant 3
+
+Each run moves one tenant's fixes of one UTC month out of PostgreSQL into
+a zstd-compressed Parquet file, hive-partitioned so external tools can
+read the archive too:
+
+    <ARCHIVE_URI>/positions/tenant_id=3/month=2026-05/part-20261019T021500.parquet
+
+Rows are sorted by (device_id, timestamp) and written in row groups of
+ARCHIVE_ROW_GROUP_SIZE, so the min/max statistics of each row group let a
+reader skip straight to one device and time range (predicate pushdown).
+Export, manifest row (position_archives) and deletion run in one
+REPEATABLE READ transaction, so exactly the exported rows are deleted and
+a failed run leaves at most an orphan file that nothing references.
+Fixes that arrive late for an archived month stay hot until the next run
+archives them into another part. Each device's newest fix always stays
+hot, so /positions/snapshot, /positions/latest and the cluster warm-up
+keep vehicles that have been silent for longer than ARCHIVE_AFTER_DAYS;
+once the device reports again, a later run archives that old fix too.
+
+Route, trip and playback reads merge the archive back in through
+app.services.position_store.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import Text, cast, delete, func, literal_column, select
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Device, Position, PositionArchive
+
+try:
+    import pyarrow
+    import pyarrow.dataset
+    import pyarrow.fs
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNS = ("id", "device_id", "timestamp", "latitude", "longitude", "altitude", "speed", "course", "raw")
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise RuntimeError("The position archive needs pyarrow (pip install pyarrow)")
+
+
+def schema():
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("device_id", pyarrow.int32()),
+        ("timestamp", pyarrow.timestamp("us", tz="UTC")),
+        ("latitude", pyarrow.float64()),
+        ("longitude", pyarrow.float64()),
+        ("altitude", pyarrow.float64()),
+        ("speed", pyarrow.float64()),
+        ("course", pyarrow.float64()),
+        ("raw", pyarrow.string()),  # the JSON payload as text
+    ])
+
+
+def filesystem():
+    """(pyarrow FileSystem, root path) for ARCHIVE_URI"""
+    _require_pyarrow()
+    if not settings.ARCHIVE_URI:
+        raise RuntimeError("ARCHIVE_URI is not set")
+    uri = settings.ARCHIVE_URI
+    if "://" not in uri:
+        uri = os.path.abspath(uri)
+    return pyarrow.fs.FileSystem.from_uri(uri)
+
+
+def month_bounds(month: date):
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=timezone.utc)
+    return start, end
+
+
+def archive_cutoff(now: datetime = None):
+    """Start of the month holding now - ARCHIVE_AFTER_DAYS: every month before it is closed and old enough"""
+    edge = (now or datetime.now(timezone.utc)) - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    return datetime(edge.year, edge.month, 1, tzinfo=timezone.utc)
+
+
+def utc(value: datetime):
+    """Naive timestamps in this codebase are UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def latest_fix_ids(tenant_id: int = None):
+    """ids of each device's newest fix (DISTINCT ON), which the archive leaves in positions"""
+    query = (
+        select(Position.id)
+        .distinct(Position.device_id)
+        .order_by(Position.device_id, Position.timestamp.desc(), Position.id.desc())
+        .correlate(None)  # used inside queries on positions: must not correlate to the outer row
+    )
+    if tenant_id is not None:
+        query = query.join(Device, Device.id == Position.device_id).where(Device.tenant_id == tenant_id)
+    return query
+
+
+async def pending_months(tenant_id: int = None):
+    """[(tenant_id, month, rows)] still in positions and old enough to archive"""
+    # Literals, not bind parameters, so GROUP BY matches the select list expression
+    month = func.date_trunc(literal_column("'month'"), func.timezone(literal_column("'UTC'"), Position.timestamp))
+    query = (
+        select(Device.tenant_id, month, func.count())
+        .select_from(Position).join(Device, Device.id == Position.device_id)
+        .where(Position.timestamp < archive_cutoff(), Device.tenant_id.isnot(None),
+               Position.id.notin_(latest_fix_ids(tenant_id)))
+        .group_by(Device.tenant_id, month)
+        .order_by(month, Device.tenant_id)
+    )
+    if tenant_id is not None:
+        query = query.where(Device.tenant_id == tenant_id)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        return [(tenant, value.date(), rows) for tenant, value, rows in result.all()]
+
+
+async def archive_month(tenant_id: int, month: date):
+    """Move one tenant-month to a new Parquet part; returns its PositionArchive row"""
+    _require_pyarrow()
+    fs, root = filesystem()
+    start, end = month_bounds(month)
+    directory = f"positions/tenant_id={tenant_id}/month={month:%Y-%m}"
+    path = f"{directory}/part-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.parquet"
+    full_path = f"{root.rstrip('/')}/{path}"
+    fs.create_dir(f"{root.rstrip('/')}/{directory}", recursive=True)
+
+    query = (
+        select(Position.id, Position.device_id, Position.timestamp, Position.latitude, Position.longitude,
+               Position.altitude, Position.speed, Position.course, cast(Position.raw, Text))
+        .join(Device, Device.id == Position.device_id)
+        .where(Device.tenant_id == tenant_id, Position.timestamp >= start, Position.timestamp < end,
+               Position.id.notin_(latest_fix_ids(tenant_id)))
+        .order_by(Position.device_id, Position.timestamp)
+        .execution_options(yield_per=settings.ARCHIVE_ROW_GROUP_SIZE)
+    )
+    target = schema()
+    count, devices = 0, set()
+    first = last = None
+    async with AsyncSessionLocal() as db:
+        # One snapshot for the export and the delete: rows inserted meanwhile are neither
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        writer = pyarrow.parquet.ParquetWriter(full_path + ".tmp", target, filesystem=fs,
+                                               compression=settings.ARCHIVE_COMPRESSION)
+        try:
+            # Server-side cursor: one row group per partition, never the whole month in memory
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                columns = list(zip(*rows))
+                batch = pyarrow.record_batch(
+                    [pyarrow.array(values, type=field.type) for values, field in zip(columns, target)],
+                    schema=target,
+                )
+                await asyncio.to_thread(writer.write_batch, batch)
+                count += len(rows)
+                devices.update(columns[1])
+                stamps = columns[2]
+                first = min(first, min(stamps)) if first else min(stamps)
+                last = max(last, max(stamps)) if last else max(stamps)
+        finally:
+            await asyncio.to_thread(writer.close)
+
+        if not count:
+            fs.delete_file(full_path + ".tmp")
+            return None
+        fs.move(full_path + ".tmp", full_path)
+        entry = PositionArchive(
+            tenant_id=tenant_id, month=month, path=path, row_count=count,
+            size_bytes=fs.get_file_info(full_path).size, device_count=len(devices),
+            first_timestamp=first, last_timestamp=last,
+        )
+        # Manifest and delete commit together: the rows are either hot or archived, never both
+        db.add(entry)
+        deleted = await db.execute(
+            delete(Position)
+            .where(Position.device_id.in_(select(Device.id).where(Device.tenant_id == tenant_id)),
+                   Position.timestamp >= start, Position.timestamp < end,
+                   Position.id.notin_(latest_fix_ids(tenant_id)))
+            .execution_options(synchronize_session=False)
+        )
+        if deleted.rowcount != count:
+            await db.rollback()
+            fs.delete_file(full_path)
+            raise RuntimeError(f"tenant {tenant_id} {month:%Y-%m}: exported {count} rows but would delete "
+                               f"{deleted.rowcount}; nothing was archived")
+        await db.commit()
+        return entry
+
+
+async def archived_parts(db, tenant_id: int, start: datetime = None, end: datetime = None):
+    """Manifest paths of a tenant's parts overlapping [start, end]"""
+    query = select(PositionArchive.path).where(PositionArchive.tenant_id == tenant_id)
+    if start is not None:
+        query = query.where(PositionArchive.last_timestamp >= utc(start))
+    if end is not None:
+        query = query.where(PositionArchive.first_timestamp <= utc(end))
+    result = await db.execute(query.order_by(PositionArchive.first_timestamp))
+    return result.scalars().all()
+
+
+def read_track(paths, device_id: int, start: datetime = None, end: datetime = None, columns=None):
+    """
+    One device's archived fixes in [start, end] as a pyarrow Table sorted by timestamp.
+    Blocking: run it in a thread.
+    """
+    fs, root = filesystem()
+    dataset = pyarrow.dataset.dataset([f"{root.rstrip('/')}/{path}" for path in paths],
+                                      filesystem=fs, format="parquet", schema=schema())
+    condition = pyarrow.dataset.field("device_id") == device_id
+    if start is not None:
+        condition &= pyarrow.dataset.field("timestamp") >= utc(start)
+    if end is not None:
+        condition &= pyarrow.dataset.field("timestamp") <= utc(end)
+    table = dataset.to_table(columns=list(columns or COLUMNS), filter=condition)
+    return table.sort_by("timestamp")
+
+
+async def run(tenant_id: int = None, dry_run: bool = False):
+    pending = await pending_months(tenant_id)
+    if not pending:
+        print(f"Nothing to archive before {archive_cutoff():%Y-%m-%d}")
+        return 0
+    moved = 0
+    for tenant, month, rows in pending:
+        if dry_run:
+            print(f"tenant {tenant} {month:%Y-%m}: {rows:,} positions")
+            continue
+        started = time.perf_counter()
+        entry = await archive_month(tenant, month)
+        if entry is None:
+            continue
+        moved += entry.row_count
+        print(f"tenant {tenant} {month:%Y-%m}: {entry.row_count:,} positions from {entry.device_count} devices "
+              f"-> {entry.path} ({entry.size_bytes / entry.row_count:.1f} B/fix, {time.perf_counter() - started:.1f}s)")
+    if not dry_run:
+        print(f"Archived {moved:,} positions; VACUUM positions to reuse the space")
+    return moved
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Move old positions to the Parquet archive")
+    parser.add_argument("--tenant", type=int, default=None, help="only this tenant")
+    parser.add_argument("--dry-run", action="store_true", help="list the months that would move")
+    args = parser.parse_args(argv)
+    if not args.dry_run:
+        filesystem()  # fail early without pyarrow or ARCHIVE_URI
+    asyncio.run(run(args.tenant, args.dry_run))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
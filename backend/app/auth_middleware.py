@@ -11,7 +11,58 @@ from app.models import User
 security = HTTPBearer(auto_error=False)
 
 from fastapi import Depends, HTTPException, status, Request
+from sqlalchemy.orm import joinedload
 import asyncio
+import time
+
+# Short-lived principal cache: user_id -> (expires_at, detached User with tenant loaded).
+# Lets bursts of dashboard requests skip the per-request user lookup.
+# Routers that change or remove a user/tenant call invalidate_user().
+_principal_cache = {}
+
+def drop_principal(user_id: int = None):
+    """Drop one cached principal of this process, or all of them when user_id is None"""
+    if user_id is None:
+        _principal_cache.clear()
+    else:
+        _principal_cache.pop(user_id, None)
+
+def invalidate_user(user_id: int = None):
+    """
+    drop_principal() here and, with INGEST_MODE=external (where WEB_WORKERS may
+    be > 1), in every other web worker through the position bus.
+    If Redis is unreachable the other workers catch up within AUTH_CACHE_TTL.
+    """
+    drop_principal(user_id)
+    if settings.INGEST_MODE != "external":
+        return
+    from app.services.bus import position_bus
+    async def publish():
+        try:
+            await position_bus.publish([{"type": "principal", "user_id": user_id}])
+        except Exception as e:
+            print(f"Principal invalidation not published: {e}")
+    try:
+        asyncio.get_running_loop().create_task(publish())
+    except RuntimeError:
+        pass
+
+def _cached_principal(user_id: int):
+    entry = _principal_cache.get(user_id)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        _principal_cache.pop(user_id, None)
+        return None
+    return entry[1]
+
+def _cache_principal(user: User):
+    if settings.AUTH_CACHE_TTL <= 0:
+        return
+    # Bounded: evict the oldest entries first (dicts keep insertion order)
+    while len(_principal_cache) >= settings.AUTH_CACHE_MAX_USERS:
+        _principal_cache.pop(next(iter(_principal_cache)))
+    _principal_cache[user.id] = (time.monotonic() + settings.AUTH_CACHE_TTL, user)
 
 async def get_current_user(
     request: Request,
@@ -26,6 +77,16 @@ async def get_current_user(
             detail="System is initializing. Please wait."
         )
 
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await user_from_token(credentials.credentials, db)
+
+async def user_from_token(token: str, db: AsyncSession) -> User:
+    """Active user behind a JWT (principal cache first); raises 401 otherwise"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -33,7 +94,6 @@ async def get_current_user(
     )
     
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
         email: str = payload.get("sub")
         user_id: int = payload.get("user_id")
@@ -44,10 +104,18 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    # 2. Get user from database with strict timeout
+    # 2. Serve from the principal cache when possible (no DB round trip)
+    user = _cached_principal(user_id)
+    if user is not None and user.email == email:
+        return user
+
+    # 3. Get user from database with strict timeout
     try:
         # Python 3.10: Use wait_for instead of timeout context manager
-        result = await asyncio.wait_for(db.execute(select(User).where(User.id == user_id)), timeout=5)
+        result = await asyncio.wait_for(
+            db.execute(select(User).options(joinedload(User.tenant)).where(User.id == user_id)),
+            timeout=5
+        )
         user = result.scalars().first()
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Identity verification timed out")
@@ -57,6 +125,10 @@ async def get_current_user(
     
     if user is None or not user.is_active:
         raise credentials_exception
+
+    # Detach so the cached instance is never tied to (or flushed by) another request's session
+    db.expunge(user)
+    _cache_principal(user)
     
     return user
 
@@ -1,6 +1,11 @@
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import settings
+from app.metrics import DB_POOL_WAIT_SECONDS, DB_POOL_IN_USE, DB_QUERY_SECONDS, route_label
+from app import querystats
 
 # -----------------------------------------
 # DATABASE CONNECTION (PostgreSQL + Async)
@@ -16,9 +21,20 @@ if DATABASE_URL and DATABASE_URL.startswith("postgresql://"):
 elif DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql+asyncpg://", 1)
 
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a free connection"""
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
 # Create async engine with robust connection pooling and strict timeouts
 engine = create_async_engine(
     DATABASE_URL,
+    poolclass=InstrumentedPool,
     echo=False,  # Set to False in production for better performance
     future=True,
     pool_pre_ping=True,  # Check connection liveness before using
@@ -31,6 +47,22 @@ engine = create_async_engine(
     }
 )
 
+DB_POOL_IN_USE.set_function(lambda: engine.pool.checkedout())
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    # Per-statement context: a failed statement simply never records a duration
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    DB_QUERY_SECONDS.labels(route=route_label()).observe(elapsed)
+    querystats.record(statement, elapsed)
+
+
 # Create async session factory
 AsyncSessionLocal = sessionmaker(
     bind=engine,
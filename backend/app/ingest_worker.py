@@ -0,0 +1,220 @@
+"""
+Standalone ingest service: TCP listener + decoders + batch writer.
+
+    INGEST_MODE=external on the API, then run:
+    python -m app.ingest_worker [--workers N]
+
+With more than one worker a supervisor starts N processes that all bind
+TCP_PORT with SO_REUSEPORT; the kernel spreads tracker connections across
+them. Each worker has its own batch writer and reports its counters back
+to the supervisor, which logs the totals and serves the merged Prometheus
+metrics on INGEST_METRICS_PORT (a single worker serves its own).
+
+Fixes are stored in the database and announced on the Redis position bus;
+the API processes subscribe to it for WebSocket, clusters and alerts.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import time
+from app.config import settings
+from app.metrics import REGISTRY, Registry, start_metrics_server
+from app.runtime import install_uvloop, loop_monitor
+from app.services import tcp_server
+from app.services.bus import position_bus
+from app.services.ingest import BatchWriter
+from app.services.tcp_server import start_tcp_server
+from app.tracing import tracer, configure_from_settings
+
+STATS_INTERVAL = 10  # worker -> supervisor
+LOG_INTERVAL = 60
+RESTART_DELAY = 1.0
+STOP_TIMEOUT = 30  # seconds a worker gets to flush its buffer
+
+
+async def publish(events):
+    try:
+        await position_bus.publish(events)
+    except Exception as e:
+        # Already stored; the API only misses the live update
+        print(f"Position bus publish failed ({len(events)} events): {e}")
+
+
+def worker_stats(writer: BatchWriter):
+    return {**tcp_server.stats, **writer.stats, "backlog": writer.backlog,
+            "slow_callbacks": loop_monitor.slow_callbacks}
+
+
+async def report_stats(writer: BatchWriter, stats_queue=None, index: int = 0):
+    last_log = time.monotonic()
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        snapshot = worker_stats(writer)
+        if stats_queue is not None:
+            stats_queue.put((index, os.getpid(), snapshot, REGISTRY.snapshot()))
+        elif time.monotonic() - last_log >= LOG_INTERVAL:
+            last_log = time.monotonic()
+            print(f"Ingest stats: {snapshot}")
+
+
+async def serve(index: int = 0, stats_queue=None, reuse_port: bool = False):
+    configure_from_settings("inferth-ingest")
+    writer = BatchWriter(on_saved=publish)
+    try:
+        await position_bus.connect()
+    except Exception as e:
+        print(f"Warning: position bus not reachable yet ({e}); fixes are still stored")
+    await writer.start()
+    await loop_monitor.start()
+    server = await start_tcp_server(writer, reuse_port=reuse_port or None)
+    if stats_queue is None and settings.INGEST_METRICS_PORT:
+        start_metrics_server(settings.INGEST_METRICS_PORT)
+    print(f"Ingest worker {index} (pid {os.getpid()}) listening on {settings.TCP_LISTEN_ADDR}:{settings.TCP_PORT}")
+    stats = asyncio.create_task(report_stats(writer, stats_queue, index))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    print(f"Ingest worker {index} stopping...")
+    server.close()
+    await server.wait_closed()
+    await writer.stop()  # flush what is buffered
+    stats.cancel()
+    await loop_monitor.stop()
+    if stats_queue is not None:
+        stats_queue.put((index, os.getpid(), worker_stats(writer), REGISTRY.snapshot()))
+    await position_bus.close()
+    tracer.shutdown()
+    print(f"Ingest worker {index} stopped: {worker_stats(writer)}")
+
+
+def worker_process(index: int, stats_queue):
+    install_uvloop()
+    asyncio.run(serve(index, stats_queue, reuse_port=True))
+
+
+class Supervisor:
+    """Keeps N ingest workers running and sums their counters"""
+    GAUGES = ("connections_open", "backlog")  # only meaningful for live processes
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.context = multiprocessing.get_context("spawn")  # no inherited loop or sockets
+        self.stats_queue = self.context.Queue()
+        self.processes = {}  # index -> Process
+        self.latest = {}     # pid -> last snapshot (cumulative per process)
+        self.metrics = {}    # pid -> last REGISTRY snapshot
+        self.restarts = 0
+        self.stopping = False
+
+    def spawn(self, index: int):
+        process = self.context.Process(target=worker_process, args=(index, self.stats_queue),
+                                       name=f"ingest-worker-{index}")
+        process.start()
+        self.processes[index] = process
+
+    def aggregate(self):
+        alive = {p.pid for p in self.processes.values() if p.is_alive()}
+        totals = {}
+        for pid, snapshot in self.latest.items():
+            for key, value in snapshot.items():
+                if key in self.GAUGES and pid not in alive:
+                    continue
+                totals[key] = totals.get(key, 0) + value
+        totals["workers_alive"] = len(alive)
+        totals["restarts"] = self.restarts
+        return totals
+
+    def render_metrics(self):
+        """Prometheus text for all workers: counters keep the totals of exited ones, gauges do not"""
+        alive = {p.pid for p in self.processes.values() if p.is_alive()}
+        snapshots = []
+        for pid, snapshot in list(self.metrics.items()):
+            if pid not in alive:
+                snapshot = {name: values for name, values in snapshot.items()
+                            if REGISTRY.metrics[name].type != "gauge"}
+            snapshots.append(snapshot)
+        return REGISTRY.render(Registry.merge(snapshots))
+
+    def drain_stats(self, timeout: float = 0):
+        while True:
+            try:
+                _, pid, snapshot, metrics = self.stats_queue.get(timeout=timeout)
+            except queue.Empty:
+                return
+            self.latest[pid] = snapshot
+            self.metrics[pid] = metrics
+            timeout = 0
+
+    def _stop(self, *_):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for index in range(self.workers):
+            self.spawn(index)
+        print(f"Ingest supervisor (pid {os.getpid()}) started {self.workers} workers on port {settings.TCP_PORT}")
+        if settings.INGEST_METRICS_PORT:
+            start_metrics_server(settings.INGEST_METRICS_PORT, self.render_metrics)
+
+        last_log = time.monotonic()
+        last_written = 0
+        while not self.stopping:
+            self.drain_stats(timeout=1.0)
+            for index, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stopping:
+                    print(f"Ingest worker {index} exited with code {process.exitcode}; restarting")
+                    self.restarts += 1
+                    time.sleep(RESTART_DELAY)
+                    self.spawn(index)
+            if time.monotonic() - last_log >= LOG_INTERVAL:
+                totals = self.aggregate()
+                rate = (totals.get("written", 0) - last_written) / (time.monotonic() - last_log)
+                last_written, last_log = totals.get("written", 0), time.monotonic()
+                print(f"Ingest totals: {totals} ({rate:.1f} fixes/s)")
+
+        print("Ingest supervisor stopping workers...")
+        for process in self.processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        # Keep reading while they flush: a worker blocked on a full stats pipe would never exit
+        deadline = time.monotonic() + STOP_TIMEOUT
+        while any(p.is_alive() for p in self.processes.values()) and time.monotonic() < deadline:
+            self.drain_stats(timeout=0.5)
+        for process in self.processes.values():
+            if process.is_alive():
+                print(f"Ingest worker {process.name} did not stop in time; killing")
+                process.kill()
+            process.join()
+        self.drain_stats()
+        print(f"Ingest totals: {self.aggregate()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inferth tracker ingest service")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS,
+                        help="worker processes sharing the TCP port (0 = one per CPU core)")
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("Warning: SO_REUSEPORT is not available on this platform; running a single worker")
+        workers = 1
+
+    if workers == 1:
+        install_uvloop()
+        asyncio.run(serve())
+    else:
+        Supervisor(workers).run()
+
+
+if __name__ == "__main__":
+    main()
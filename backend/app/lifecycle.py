@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+# Subsystem states
+PENDING = "pending"
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+SKIPPED = "skipped"  # a dependency never became ready
+
+
+class Subsystem:
+    """
+    One piece of startup work (database, MQTT, TCP listener...) with its own health state.
+    Starts once every subsystem it `requires` is ready; retried `attempts` times.
+    """
+    def __init__(self, name: str, start, stop=None, requires=(), required: bool = False,
+                 attempts: int = 1, retry_delay: float = 5.0, timeout: float = None):
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.requires = tuple(requires)
+        self.required = required  # readiness depends on it
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.state = PENDING
+        self.error = None
+        self.attempt = 0
+        self.duration_ms = None
+        self._done = asyncio.Event()
+
+    async def wait(self):
+        await self._done.wait()
+
+    async def run(self, registry: dict):
+        try:
+            for dependency in self.requires:
+                await registry[dependency].wait()
+                if registry[dependency].state != READY:
+                    self.state = SKIPPED
+                    self.error = f"{dependency} is {registry[dependency].state}"
+                    return
+
+            self.state = STARTING
+            started = time.perf_counter()
+            for attempt in range(1, self.attempts + 1):
+                self.attempt = attempt
+                try:
+                    if self.timeout:
+                        await asyncio.wait_for(self.start(), timeout=self.timeout)
+                    else:
+                        await self.start()
+                    self.state = READY
+                    self.error = None
+                    break
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    print(f"Subsystem {self.name} failed (attempt {attempt}/{self.attempts}): {e}")
+                    if attempt < self.attempts:
+                        await asyncio.sleep(self.retry_delay)
+            else:
+                self.state = FAILED
+            self.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        finally:
+            self._done.set()
+
+    def as_dict(self):
+        return {
+            "state": self.state,
+            "required": self.required,
+            "attempt": self.attempt,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+        }
+
+
+class Lifecycle:
+    """
+    Registry of subsystems started in parallel in the background, so the server
+    accepts connections (and answers liveness probes) while they come up.
+    """
+    def __init__(self, started: float = None):
+        # perf_counter() taken as early as possible in the process
+        self.started = started if started is not None else time.perf_counter()
+        self.subsystems = {}
+        self.ready_ms = None
+        self.first_request_ms = None
+        self._task = None
+
+    def add(self, name: str, start, **options):
+        self.subsystems[name] = Subsystem(name, start, **options)
+        return self.subsystems[name]
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    @property
+    def ready(self):
+        return all(s.state == READY for s in self.subsystems.values() if s.required)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._start_all())
+
+    async def _start_all(self):
+        async def run(subsystem):
+            await subsystem.run(self.subsystems)
+            if self.ready_ms is None and self.ready:
+                self.ready_ms = self.elapsed_ms()
+                print(f"Ready in {self.ready_ms} ms")
+
+        await asyncio.gather(*(run(s) for s in self.subsystems.values()))
+        for s in self.subsystems.values():
+            print(f"  {s.name:<12} {s.state:<8} {s.duration_ms or 0:>8} ms {s.error or ''}")
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Reverse registration order: dependants stop before what they depend on
+        for s in reversed(list(self.subsystems.values())):
+            if s.stop and s.state == READY:
+                try:
+                    await s.stop()
+                except Exception as e:
+                    print(f"Subsystem {s.name} stop error: {e}")
+
+    def request_served(self, status_code: int):
+        """Record cold start: process start to the first request answered without a 5xx"""
+        if self.first_request_ms is None and status_code < 500:
+            self.first_request_ms = self.elapsed_ms()
+            print(f"First request served {self.first_request_ms} ms after start")
+
+    def report(self):
+        return {
+            "ready": self.ready,
+            "uptime_s": round(self.elapsed_ms() / 1000, 1),
+            "ready_ms": self.ready_ms,
+            "first_request_ms": self.first_request_ms,
+            "subsystems": {name: s.as_dict() for name, s in self.subsystems.items()},
+        }
@@ -1,155 +1,189 @@
+import time
+BOOT_STARTED = time.perf_counter()  # cold-start baseline, before the heavy imports
+
 import uvicorn
-from fastapi import FastAPI, WebSocket
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, WebSocket, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.routers import auth, devices, positions, users, audit
+from app.routers import auth, devices, positions, users, audit, alerts, tiles
 from app.services.mqtt_client import start_mqtt
 import asyncio
 from app.config import settings
-from app.services.tcp_server import TCPTrackerProtocol
-from app.services.tcp_server import TCPTrackerProtocol
+from app.services.tcp_server import start_tcp_server
+from app.services.ingest import BatchWriter
+from app.services.bus import position_bus
+from app.services.pipeline import apply_position_events, apply_bus_event
 from app.realtime import ws_listener
+from app.auth_middleware import require_admin
+from app.models import User
 from app.branding import init_branding
+from app.lifecycle import Lifecycle
+from app.runtime import loop_monitor, uvicorn_options
+from app.metrics import REGISTRY, CONTENT_TYPE, SnapshotDir, current_scope, route_label
+from app.querystats import RequestQueries, current_queries, query_stats
+from app.tracing import tracer, configure_from_settings
+from app.services.alerts import alert_engine
+from app.services.clustering import cluster_index
+from app.services.geocoder import geocoder
+from app.services.tracks import run_track_processor
+from app.services.frames import run_frame_sweeper
+from app.services.email import email_worker
+from app.services.audit import audit_sink
 import os
 
-app = FastAPI(title="Inferth Mapping")
-# Production Stability: db_ready flag tracks successful background initialization
-app.state.db_ready = False
+lifecycle = Lifecycle(started=BOOT_STARTED)
+_handles = {}  # running servers/clients/tasks owned by the subsystems below
+# Embedded ingest: fixes from the in-process TCP listener go straight to live state
+ingest_writer = BatchWriter(on_saved=apply_position_events)
+
 
-async def run_migrations_and_branding():
-    print("\n" + "="*50)
-    print("BACKGROUND INITIALIZATION STARTED")
-    print("="*50)
+# --- Subsystems ---
 
-    from app.db import engine, Base, AsyncSessionLocal
-    from app.models import Tenant
+async def start_database():
+    from app.db import engine
+    from app.migrations import check_schema
+    # Schema changes run before boot (python -m app.migrations); here we only verify the revision
+    app.state.schema = await check_schema(engine)
+    print(f"SUCCESS: Database connected (schema revision {app.state.schema['current']}).")
+    if not app.state.schema["up_to_date"]:
+        print(f"WARNING: Database schema is at {app.state.schema['current']}, code expects "
+              f"{app.state.schema['head']}. Run 'python -m app.migrations'.")
+    # Login and authenticated routes answer 503 until this is set
+    app.state.db_ready = True
+
+async def start_branding():
+    from app.db import AsyncSessionLocal
+    from app.models import Tenant, User
+    from app.security import hash_password_async
     from sqlalchemy.future import select
-    from sqlalchemy import text
-    import time
 
-    connection_ready = False
-    max_retries = 10
-    retry_delay = 5 # seconds
+    await init_branding()
+
+    # Ensure Default Tenant & First Admin
+    async with AsyncSessionLocal() as db:
+        res = await db.execute(select(Tenant).where(Tenant.name == "Inferth Mapping"))
+        tenant = res.scalars().first()
+
+        # Check if any users exist
+        user_res = await db.execute(select(User).limit(1))
+        if not user_res.scalars().first():
+            print("No users found. Seeding first administrator...")
+            admin_pwd = os.getenv("ADMIN_PASSWORD", "changeme")
+            new_admin = User(
+                email="adriankwaramba@gmail.com",
+                hashed_password=await hash_password_async(admin_pwd),
+                role="admin",
+                is_admin=True,
+                is_active=True,
+                tenant_id=tenant.id
+            )
+            db.add(new_admin)
+            await db.commit()
+            print(f"SUCCESS: Created admin adriankwaramba@gmail.com (Tenant: {tenant.name})")
+
+async def start_mqtt_client():
+    # paho connects with a blocking socket call; keep it off the event loop
+    _handles["mqtt"] = await asyncio.to_thread(start_mqtt)
+
+async def stop_mqtt_client():
+    client = _handles.pop("mqtt")
+    client.loop_stop()
+    client.disconnect()
+
+async def start_tcp_listener():
+    _handles["tcp"] = await start_tcp_server(ingest_writer)
+    print(f"TCP server listening on {settings.TCP_LISTEN_ADDR}:{settings.TCP_PORT}")
+
+async def stop_tcp_server():
+    server = _handles.pop("tcp")
+    server.close()
+    await server.wait_closed()
+
+async def start_bus_listener():
+    # Fixes stored by the standalone ingest workers, and alerts from the elected alert worker
+    await position_bus.start_listening(apply_bus_event)
+
+async def start_geocoder():
+    # Parsing the gazetteer takes a few seconds, keep it off the loop
+    await asyncio.to_thread(geocoder.load)
+
+async def start_track_processor():
+    # Offline track cleaning for closed days
+    _handles["tracks"] = asyncio.create_task(run_track_processor())
+
+async def stop_track_processor():
+    _handles.pop("tracks").cancel()
+
+async def start_frame_sweeper():
+    # Raw frame retention (position_frames)
+    _handles["frames"] = asyncio.create_task(run_frame_sweeper())
+
+async def stop_frame_sweeper():
+    _handles.pop("frames").cancel()
 
-    for attempt in range(1, max_retries + 1):
+shared_metrics = SnapshotDir(settings.METRICS_DIR) if settings.METRICS_DIR else None
+
+async def write_metrics_snapshots():
+    while True:
         try:
-            print(f"Connecting to Database (Attempt {attempt}/{max_retries})...")
-            # Python 3.10 compatibility: use wait_for instead of timeout context manager
-            async def do_db_init():
-                async with engine.begin() as conn:
-                    await conn.run_sync(Base.metadata.create_all)
-            await asyncio.wait_for(do_db_init(), timeout=30)
-            print("SUCCESS: Database connected and tables verified.")
-            connection_ready = True
-            # Set ready immediately after connection/tables are verified
-            # This allows login attempts to start while migrations/branding happen in background
-            app.state.db_ready = True 
-            break
+            await asyncio.to_thread(shared_metrics.write)
         except Exception as e:
-            print(f"FAILED: Database attempt {attempt} failed: {e}")
-            if attempt < max_retries:
-                print(f"Retrying in {retry_delay}s...")
-                await asyncio.sleep(retry_delay)
-            else:
-                print("CRITICAL ERROR: Database unreachable after maximum retries.")
-
-    if connection_ready:
-        async with AsyncSessionLocal() as db:
-            try:
-                print("Checking schema integrity & performing auto-migrations...")
-                # Run these sequentially and commit each to avoid lock issues
-                migration_statements = [
-                    "ALTER TABLE users ADD COLUMN IF NOT EXISTS role VARCHAR DEFAULT 'admin'",
-                    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login TIMESTAMP WITH TIME ZONE DEFAULT NULL",
-                    "ALTER TABLE users ADD COLUMN IF NOT EXISTS accessible_assets JSON DEFAULT '[\"*\"]'",
-                    "ALTER TABLE devices ADD COLUMN IF NOT EXISTS driver_name VARCHAR DEFAULT NULL",
-                    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS logo_url VARCHAR DEFAULT NULL",
-                    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS primary_color VARCHAR DEFAULT '#2D5F6D'",
-                    "ALTER TABLE tenants ADD COLUMN IF NOT EXISTS secondary_color VARCHAR DEFAULT '#EF4835'"
-                ]
-                
-                for stmt in migration_statements:
-                    try:
-                        await db.execute(text(stmt))
-                        await db.commit()
-                    except Exception as inner_e:
-                        print(f"Skipping migration step: {inner_e}")
-                        await db.rollback()
-                
-                print("Schema migrations complete.")
-
-                # Initialize Branding
-                try:
-                    await init_branding()
-                    print("Branding initialization complete.")
-                except Exception as e:
-                    print(f"Branding Init Warning: {e}")
-
-                # 3. Ensure Default Tenant & First Admin
-                from app.models import User
-                from app.security import hash_password
-                
-                res = await db.execute(select(Tenant).where(Tenant.name == "Inferth Mapping"))
-                tenant = res.scalars().first()
-                if not tenant:
-                    print("Seeding 'Inferth Mapping' tenant...")
-                    tenant = Tenant(name="Inferth Mapping")
-                    db.add(tenant)
-                    await db.commit()
-                    await db.refresh(tenant)
-
-                # Check if any users exist
-                user_res = await db.execute(select(User))
-                if not user_res.scalars().first():
-                    print("No users found. Seeding first administrator...")
-                    admin_pwd = os.getenv("ADMIN_PASSWORD", "changeme")
-                    new_admin = User(
-                        email="adriankwaramba@gmail.com",
-                        hashed_password=hash_password(admin_pwd),
-                        role="admin",
-                        is_admin=True,
-                        is_active=True,
-                        tenant_id=tenant.id
-                    )
-                    db.add(new_admin)
-                    await db.commit()
-                    print(f"SUCCESS: Created admin adriankwaramba@gmail.com (Tenant: {tenant.name})")
-
-                # SET READY AGAIN just in case
-                app.state.db_ready = True
-            except Exception as e:
-                print(f"Initialization core error: {e}")
-                app.state.db_ready = True
-
-    print("="*50)
-    print("BACKGROUND INITIALIZATION FINISHED")
-    print("="*50 + "\n")
-
-@app.on_event("startup")
-async def startup_event():
-    # 1. Start Heavy Logic in Background to avoid 502 Gateway Timeouts during boot
-    asyncio.create_task(run_migrations_and_branding())
-
-    # 2. Start Immediate Services
-    print("Starting background services...")
-    
-    # MQTT Client
-    try:
-        start_mqtt()
-        print("MQTT client started successfully")
-    except Exception as e:
-        print(f"Warning: MQTT client not available: {e}")
-    
-    # TCP Tracker Server
-    try:
-        loop = asyncio.get_running_loop()
-        server = await loop.create_server(lambda: TCPTrackerProtocol(app), host=settings.TCP_LISTEN_ADDR, port=settings.TCP_PORT)
-        print(f"TCP server listening on {settings.TCP_LISTEN_ADDR}:{settings.TCP_PORT}")
-    except Exception as e:
-        print(f"Warning: TCP server not available: {e}")
+            print(f"Metrics snapshot error: {e}")
+        await asyncio.sleep(settings.METRICS_SNAPSHOT_INTERVAL)
+
+async def start_metrics_snapshots():
+    # Other workers render this one's counters from its last snapshot
+    _handles["metrics"] = asyncio.create_task(write_metrics_snapshots())
+
+async def stop_metrics_snapshots():
+    _handles.pop("metrics").cancel()
+    shared_metrics.write()  # final counters outlive the process
+
+
+# Registration order is also reverse shutdown order
+lifecycle.add("loop_monitor", loop_monitor.start, stop=loop_monitor.stop)
+lifecycle.add("audit", audit_sink.start, stop=audit_sink.stop)  # buffers until the DB is reachable
+lifecycle.add("database", start_database, required=True, attempts=10, retry_delay=5, timeout=30)
+lifecycle.add("branding", start_branding, requires=("database",), timeout=60)
+lifecycle.add("mqtt", start_mqtt_client, stop=stop_mqtt_client, timeout=15)
+if settings.INGEST_MODE == "external":
+    lifecycle.add("bus", start_bus_listener, stop=position_bus.close, attempts=10, retry_delay=5)
+else:
+    lifecycle.add("ingest", ingest_writer.start, stop=ingest_writer.stop)  # flushes on shutdown
+    lifecycle.add("tcp", start_tcp_listener, stop=stop_tcp_server, requires=("ingest",))
+lifecycle.add("geocoder", start_geocoder)
+# Streaming alert rules (speed / idle / offline)
+lifecycle.add("alerts", alert_engine.start, stop=alert_engine.stop, requires=("database",))
+# Live-state marker clusters
+lifecycle.add("clusters", cluster_index.warm, requires=("database",))
+# Outbound email queue
+lifecycle.add("email", email_worker.start, stop=email_worker.stop, requires=("database",))
+lifecycle.add("tracks", start_track_processor, stop=stop_track_processor, requires=("database",))
+lifecycle.add("frames", start_frame_sweeper, stop=stop_frame_sweeper, requires=("database",))
+if shared_metrics is not None:
+    lifecycle.add("metrics", start_metrics_snapshots, stop=stop_metrics_snapshots)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything starts in the background, in parallel: the server accepts connections
+    # (and answers /health/live) immediately instead of after the slowest dependency
+    print(f"Starting subsystems ({lifecycle.elapsed_ms()} ms after process start)...")
+    configure_from_settings("inferth-api")
+    lifecycle.start()
+    yield
+    # Stops dependants first; the audit sink flushes buffered events last
+    await lifecycle.stop()
+    tracer.shutdown()
+
+
+app = FastAPI(title="Inferth Mapping", lifespan=lifespan)
+# Production Stability: db_ready flag tracks the database subsystem
+app.state.db_ready = False
 
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 
 @app.exception_handler(Exception)
 async def debug_exception_handler(request: Request, exc: Exception):
@@ -195,10 +229,13 @@ async def root():
 async def health_check():
     from app.db import AsyncSessionLocal
     from app.models import Tenant, User
-    from sqlalchemy import func
+    from sqlalchemy import func, select
     
     status = {
         "db_ready": getattr(app.state, "db_ready", False),
+        "schema": getattr(app.state, "schema", None),
+        "startup": lifecycle.report(),
+        "event_loop": loop_monitor.report(),
         "tenants_count": 0,
         "users_count": 0,
         "database_connected": False
@@ -217,6 +254,31 @@ async def health_check():
         
     return status
 
+@app.get("/admin/query-stats")
+async def route_query_stats(current_user: User = Depends(require_admin)):
+    """Routes with the most DB time in this process, with their slowest SQL (global admins only)"""
+    if current_user.tenant_id != 1:
+        raise HTTPException(status_code=403, detail="Only platform administrators can view query statistics")
+    return query_stats.report()
+
+@app.get("/health/live")
+async def liveness():
+    """Process is up and the event loop is serving requests (no dependency checks)"""
+    return {"status": "alive", "uptime_s": round(lifecycle.elapsed_ms() / 1000, 1)}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint: this process, or the totals of every web worker (METRICS_DIR)"""
+    if shared_metrics is not None:
+        return Response(await asyncio.to_thread(shared_metrics.render), media_type=CONTENT_TYPE)
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/health/ready")
+async def readiness():
+    """200 once every required subsystem is ready, 503 (with per-subsystem states) before that"""
+    report = lifecycle.report()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
 @app.get("/admin/repair-production")
 async def repair_production_state():
     """Diagnostic and Repair endpoint to fix DB state remotely"""
@@ -228,16 +290,6 @@ async def repair_production_state():
     results = {"steps": [], "diagnostics": {}}
     
     async with AsyncSessionLocal() as db:
-        # 0. Structural Migration (Auto-add new columns)
-        try:
-            await db.execute(text("ALTER TABLE tenants ADD COLUMN IF NOT EXISTS navbar_bg VARCHAR"))
-            await db.execute(text("ALTER TABLE tenants ADD COLUMN IF NOT EXISTS navbar_text_color VARCHAR"))
-            await db.commit()
-            results["steps"].append("Database structural migration complete (Navbar columns added)")
-        except Exception as e:
-            results["errors"].append(f"Migration error: {str(e)}")
-            await db.rollback()
-
         # 1. Fix Logos
         try:
             # Point all Console Telematics variations to logo.png and set colors (Pure Neon Green #00FF00 / Dark Navbar)
@@ -306,11 +358,30 @@ app.add_middleware(
 # Add explicit CORS headers middleware
 @app.middleware("http")
 async def add_cors_headers(request, call_next):
+    # Lets DB instrumentation label queries with the matched route
+    current_scope.set(request.scope)
     response = await call_next(request)
+    if lifecycle.first_request_ms is None and not request.url.path.startswith("/health"):
+        lifecycle.request_served(response.status_code)
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Credentials"] = "true"
     response.headers["Access-Control-Allow-Methods"] = "*"
     response.headers["Access-Control-Allow-Headers"] = "*"
+    response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
+    response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+@app.middleware("http")
+async def record_queries(request, call_next):
+    """Per-request query count / DB time as Server-Timing, and per-route totals for /admin/query-stats"""
+    queries = RequestQueries()
+    current_queries.set(queries)
+    response = await call_next(request)
+    if queries.count:  # static files and cached responses stay out of the route totals
+        client = request.client.host if request.client else "?"
+        query_stats.add(request.method, route_label(request.scope), client, queries)
+    if settings.SERVER_TIMING:
+        response.headers["Server-Timing"] = queries.server_timing()
     return response
 
 app.include_router(auth.router)
@@ -318,10 +389,13 @@ app.include_router(devices.router)
 app.include_router(positions.router)
 app.include_router(users.router)
 app.include_router(audit.router)
+app.include_router(alerts.router)
+app.include_router(tiles.router)
 
 @app.websocket("/ws/positions")
-async def websocket_endpoint(websocket: WebSocket):
-    await ws_listener(websocket)
+async def websocket_endpoint(websocket: WebSocket, token: str = None):
+    await ws_listener(websocket, token)
     
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    # Development server; production uses `python -m app.serve`
+    uvicorn.run("app.main:app", **uvicorn_options(reload=True, workers=1))
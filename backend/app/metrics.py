@@ -0,0 +1,321 @@
+"""
+Minimal Prometheus instrumentation (text exposition format 0.0.4), stdlib only
+so the gateway and ingest workers can use it without the web stack.
+
+    FRAMES.labels(protocol="gps103", stage="received").inc()
+    DB_QUERY_SECONDS.labels(route="/positions/route/{device_id}").observe(0.012)
+
+The API serves REGISTRY on /metrics. Processes without an HTTP app call
+start_metrics_server(port). Snapshots are plain dicts, so a supervisor can
+merge the registries of its workers. Web workers, which have no supervisor
+of their own, share snapshots through a directory (SnapshotDir).
+"""
+import bisect
+import contextvars
+import os
+import pickle
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ASGI scope of the request being handled (set by the API middleware, read by DB instrumentation)
+current_scope = contextvars.ContextVar("current_scope", default=None)
+
+
+class _Child:
+    __slots__ = ("metric", "key")
+
+    def __init__(self, metric, key):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount: float = 1.0):
+        self.metric._add(self.key, amount)
+
+    def set(self, value: float):
+        self.metric._set(self.key, value)
+
+    def observe(self, value: float):
+        self.metric._observe(self.key, value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, **labels):
+        return _Child(self, tuple(str(labels[name]) for name in self.labelnames))
+
+    # Unlabelled shortcuts
+    def inc(self, amount: float = 1.0):
+        self._add((), amount)
+
+    def set(self, value: float):
+        self._set((), value)
+
+    def observe(self, value: float):
+        self._observe((), value)
+
+    def _add(self, key, amount):
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def _set(self, key, value):
+        with self._lock:
+            self.values[key] = value
+
+    def _observe(self, key, value):
+        raise TypeError(f"{self.name} is not a histogram")
+
+    def snapshot(self):
+        with self._lock:
+            return {key: (list(v) if isinstance(v, list) else v) for key, v in self.values.items()}
+
+
+class Counter(Metric):
+    type = "counter"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def set_function(self, function):
+        """Read the value at scrape time (e.g. a pool size or a connection count)"""
+        self._function = function
+
+    def snapshot(self):
+        if self._function is not None:
+            try:
+                self._set((), float(self._function()))
+            except Exception:
+                pass
+        return super().snapshot()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _observe(self, key, value):
+        # Stored as per-bucket counts (not cumulative) + [sum, count]
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self.labels(**labels) if labels else self)
+
+
+class _Timer:
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self._start)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric):
+        self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        """{metric name: {label values: value}} - picklable, mergeable across processes"""
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    @staticmethod
+    def merge(snapshots):
+        """Sum several snapshots (counters, gauges and histogram buckets all add up)"""
+        merged = {}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                target = merged.setdefault(name, {})
+                for key, value in values.items():
+                    if key not in target:
+                        target[key] = list(value) if isinstance(value, list) else value
+                    elif isinstance(value, list):
+                        target[key] = [a + b for a, b in zip(target[key], value)]
+                    else:
+                        target[key] += value
+        return merged
+
+    def render(self, snapshot=None):
+        snapshot = snapshot if snapshot is not None else self.snapshot()
+        lines = []
+        for name, metric in self.metrics.items():
+            values = snapshot.get(name)
+            if not values:
+                continue
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for key, value in sorted(values.items()):
+                if metric.type != "histogram":
+                    lines.append(f"{name}{_format_labels(metric.labelnames, key)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-2]):
+                    cumulative += count
+                    le = (("le", _format_value(bound) if bound == float("inf") else f"{bound:g}"),)
+                    lines.append(f"{name}_bucket{_format_labels(metric.labelnames, key, le)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(metric.labelnames, key)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(metric.labelnames, key)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class SnapshotDir:
+    """
+    Registry snapshots of sibling processes (uvicorn web workers) in one directory,
+    one file per pid, so whichever worker is scraped renders the totals of all.
+    Counters of exited workers keep counting; their gauges are dropped.
+    """
+    def __init__(self, path: str, registry: Registry = None):
+        self.path = path
+        self.registry = registry or REGISTRY
+
+    def write(self):
+        os.makedirs(self.path, exist_ok=True)
+        target = os.path.join(self.path, f"{os.getpid()}.pickle")
+        with open(target + ".tmp", "wb") as f:
+            pickle.dump(self.registry.snapshot(), f)
+        os.replace(target + ".tmp", target)
+
+    @staticmethod
+    def _alive(pid: int):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def snapshots(self):
+        self.write()  # this process: current values, not the last periodic write
+        found = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".pickle"):
+                continue
+            try:
+                with open(os.path.join(self.path, name), "rb") as f:
+                    snapshot = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if not self._alive(int(name.split(".")[0])):
+                snapshot = {metric: values for metric, values in snapshot.items()
+                            if metric in self.registry.metrics and self.registry.metrics[metric].type != "gauge"}
+            found.append(snapshot)
+        return found
+
+    def render(self):
+        return self.registry.render(Registry.merge(self.snapshots()))
+
+
+def start_metrics_server(port: int, render=None, host: str = "0.0.0.0"):
+    """Serve GET /metrics from a daemon thread (for processes without an HTTP app)"""
+    render = render or REGISTRY.render
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def route_label(scope=None):
+    """Route template of the current request ('/positions/route/{device_id}'), bounded cardinality"""
+    scope = scope if scope is not None else current_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        return getattr(endpoint, "__name__", "unknown")
+    return "unmatched"
+
+
+# --- Metric definitions ---
+
+# Ingest (TCP listener, HTTP ingest endpoint, batch writer)
+FRAMES = Counter("inferth_ingest_frames_total",
+                 "Tracker frames by protocol and stage (received, decoded, rejected, persisted)",
+                 ["protocol", "stage"])
+INGEST_FLUSH_SECONDS = Histogram("inferth_ingest_flush_seconds", "Batch writer INSERT + commit duration")
+INGEST_BATCH_SIZE = Histogram("inferth_ingest_batch_size", "Fixes per batch writer flush",
+                              buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+INGEST_BACKLOG = Gauge("inferth_ingest_backlog", "Decoded fixes waiting for the batch writer")
+
+# Database
+DB_POOL_WAIT_SECONDS = Histogram("inferth_db_pool_checkout_seconds", "Time spent waiting for a pooled connection")
+DB_POOL_IN_USE = Gauge("inferth_db_pool_connections_in_use", "Connections checked out of the pool")
+DB_QUERY_SECONDS = Histogram("inferth_db_query_seconds", "SQL statement latency by API route", ["route"])
+
+# Realtime
+WS_CLIENTS = Gauge("inferth_websocket_clients", "Connected WebSocket clients")
+WS_SEND_SECONDS = Histogram("inferth_websocket_send_seconds", "Time to send one message to one WebSocket client")
+LOOP_LAG_SECONDS = Histogram("inferth_event_loop_lag_seconds", "Event loop scheduling delay",
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+# Gateway (gateway.py)
+GATEWAY_FORWARDS = Counter("inferth_gateway_forwards_total", "Frames forwarded by target and outcome",
+                           ["target", "outcome"])
+GATEWAY_FORWARD_SECONDS = Histogram("inferth_gateway_forward_seconds", "Forwarding latency by target", ["target"])
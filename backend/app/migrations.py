@@ -0,0 +1,105 @@
+"""
+Schema migration runner.
+
+    python -m app.migrations          # upgrade to head (run before starting the API)
+    python -m app.migrations check    # exit 1 if the database is behind
+
+The API never changes the schema itself; at boot it only calls check_schema().
+"""
+import asyncio
+import os
+import sys
+import time
+from sqlalchemy import pool, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.config import settings
+from app.db import DATABASE_URL
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+# Databases built by the old boot-time create_all never recorded a revision.
+# Their tables already match this one; everything later is idempotent.
+BASELINE_REVISION = "aaf548e60ea1"
+
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def alembic_config():
+    from alembic.config import Config
+    return Config(ALEMBIC_INI)
+
+
+def head_revision():
+    from alembic.script import ScriptDirectory
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+async def current_revision(conn):
+    """Revision recorded in alembic_version, or None when the table does not exist"""
+    exists = (await conn.execute(text("SELECT to_regclass('alembic_version')"))).scalar()
+    if not exists:
+        return None
+    return (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+
+
+async def check_schema(engine=None):
+    """Compare the database revision with the code's head. Read-only, takes no locks."""
+    if engine is None:
+        from app.db import engine
+    async with engine.connect() as conn:
+        current = await current_revision(conn)
+    head = head_revision()
+    return {"current": current, "head": head, "up_to_date": current == head}
+
+
+async def _is_unversioned_legacy():
+    engine = create_async_engine(DATABASE_URL, poolclass=pool.NullPool)
+    try:
+        async with engine.connect() as conn:
+            if await current_revision(conn) is not None:
+                return False
+            return bool((await conn.execute(text("SELECT to_regclass('tenants')"))).scalar())
+    finally:
+        await engine.dispose()
+
+
+def _is_lock_timeout(error: DBAPIError):
+    return getattr(error.orig, "sqlstate", None) == LOCK_NOT_AVAILABLE or "lock timeout" in str(error)
+
+
+def upgrade(retries: int = None):
+    """Upgrade to head, retrying with backoff when a statement hits MIGRATION_LOCK_TIMEOUT"""
+    from alembic import command
+    retries = retries if retries is not None else settings.MIGRATION_LOCK_RETRIES
+    config = alembic_config()
+
+    if asyncio.run(_is_unversioned_legacy()):
+        print(f"Unversioned database found, stamping baseline {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+
+    for attempt in range(1, retries + 2):
+        try:
+            command.upgrade(config, "head")
+            return
+        except DBAPIError as e:
+            # Completed revisions stay committed (one transaction each), so a retry resumes
+            if not _is_lock_timeout(e) or attempt > retries:
+                raise
+            delay = min(2 ** attempt, 60)
+            print(f"Migration hit lock timeout (attempt {attempt}/{retries + 1}), retrying in {delay}s")
+            time.sleep(delay)
+
+
+def main(argv):
+    if argv and argv[0] == "check":
+        status = asyncio.run(check_schema(create_async_engine(DATABASE_URL, poolclass=pool.NullPool)))
+        print(f"Schema revision {status['current']} (head {status['head']})")
+        return 0 if status["up_to_date"] else 1
+    upgrade()
+    print(f"Schema is at {head_revision()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
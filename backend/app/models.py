@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Text, LargeBinary, Float, DateTime, Date, Boolean, ForeignKey, JSON, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from geoalchemy2 import Geography
 import datetime
 
 # IMPORTANT: use Base from db.py
@@ -29,6 +30,9 @@ class Tenant(Base):
     secondary_color = Column(String, default="#EF4835") # Default Inferth Orange
     navbar_bg = Column(String, nullable=True) # Will match logo background
     navbar_text_color = Column(String, nullable=True)
+    # Raw tracker frames (app/services/frames.py): compressed, inline or off; None = RAW_FRAME_STORAGE
+    raw_frames = Column(String, nullable=True)
+    raw_frame_retention_days = Column(Integer, nullable=True) # None = RAW_FRAME_RETENTION_DAYS, 0 = forever
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
@@ -52,6 +56,13 @@ class User(Base):
 
 class AuditLog(Base) :
     __tablename__ = "audit_logs"
+    # Composite indexes back the keyset pagination and filters of /audit-logs (newest first)
+    __table_args__ = (
+        Index("ix_audit_logs_ts_id", "timestamp", "id"),
+        Index("ix_audit_logs_tenant_ts_id", "tenant_id", "timestamp", "id"),
+        Index("ix_audit_logs_tenant_action_ts_id", "tenant_id", "action", "timestamp", "id"),
+        Index("ix_audit_logs_tenant_user_ts_id", "tenant_id", "user_id", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index = True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable = True)  # Nullable for system actions
@@ -90,4 +101,98 @@ class Position(Base):
     course = Column(Float, nullable=True)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     raw = Column(JSON, nullable=True)
+    # PostGIS point (GiST indexed) for viewport queries; mirrors latitude/longitude
+    geom = Column(Geography(geometry_type="POINT", srid=4326, spatial_index=True), nullable=True)
     device = relationship("Device")
+
+
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), index=True)
+    device_id = Column(Integer, ForeignKey("devices.id"), nullable=True) # None = every device of the tenant
+    rule_type = Column(String, nullable=False) # speed, idle, offline
+    threshold = Column(Float, nullable=True) # km/h for speed/idle rules
+    duration_seconds = Column(Integer, default=0) # How long the condition must hold before firing
+    is_active = Column(Boolean, default=True)
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class Alert(Base):
+    __tablename__ = "alerts"
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="SET NULL"), nullable=True)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"))
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), index=True)
+    alert_type = Column(String, index=True, nullable=False)
+    message = Column(String)
+    details = Column(JSON, default={})
+    triggered_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class DeviceTrack(Base):
+    """Cleaned (jitter-filtered, smoothed) track and stops for one device and UTC day"""
+    __tablename__ = "device_tracks"
+    __table_args__ = (UniqueConstraint("device_id", "day", name="uq_device_tracks_device_day"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(Integer, ForeignKey("devices.id", ondelete="CASCADE"), index=True)
+    day = Column(Date, nullable=False)
+    distance_km = Column(Float, default=0)
+    moving_seconds = Column(Integer, default=0)
+    stop_count = Column(Integer, default=0)
+    stops = Column(JSON, default=[])
+    points = Column(JSON, default=[]) # [[lat, lng, iso timestamp], ...]
+    raw_points = Column(Integer, default=0)
+    rejected_points = Column(Integer, default=0)
+    last_position_id = Column(Integer, nullable=True) # newest positions.id cleaned; a higher one means late fixes
+    processed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class PositionFrame(Base):
+    """Original tracker frame of one position, compressed, with its own retention window"""
+    __tablename__ = "position_frames"
+    __table_args__ = (Index("ix_position_frames_tenant_received", "tenant_id", "received_at"),)
+
+    position_id = Column(Integer, primary_key=True) # positions.id; no FK so ingest and archiving stay cheap
+    tenant_id = Column(Integer, nullable=True)
+    received_at = Column(DateTime(timezone=True), nullable=False)
+    codec = Column(String, nullable=False) # zstd, zlib or none
+    size = Column(Integer) # uncompressed bytes
+    payload = Column(LargeBinary, nullable=False)
+
+
+class PositionArchive(Base):
+    """One Parquet file of archived positions (app/archive.py): a tenant's fixes from one UTC month"""
+    __tablename__ = "position_archives"
+    __table_args__ = (Index("ix_position_archives_tenant_month", "tenant_id", "month"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(Integer, ForeignKey("tenants.id"), nullable=False)
+    month = Column(Date, nullable=False) # first day of the month
+    path = Column(String, nullable=False) # relative to ARCHIVE_URI
+    row_count = Column(Integer, default=0)
+    size_bytes = Column(BigInteger, default=0)
+    device_count = Column(Integer, default=0)
+    first_timestamp = Column(DateTime(timezone=True))
+    last_timestamp = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class EmailOutbox(Base):
+    """Outbound email queue; rows are delivered by the background email worker"""
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    html_content = Column(Text, nullable=False)
+    status = Column(String, default="pending", index=True) # pending, sending, sent, failed, skipped
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
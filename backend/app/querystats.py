@@ -0,0 +1,130 @@
+"""
+Per-request SQL accounting, fed by the engine's cursor events (app/db.py).
+
+Every API request gets a RequestQueries: statement count, total DB time and
+the slowest statement. The middleware returns it as a Server-Timing header
+(visible in the browser's network panel) and folds it into per-route totals
+shown on /admin/query-stats. Two things are logged:
+
+- slow statements (>= SLOW_QUERY_MS), sampled by SLOW_QUERY_SAMPLE_RATE
+- N+1 suspects: one statement repeated QUERY_REPEAT_WARN times inside a
+  request, or one client calling the same route that often within a second
+  (e.g. a per-vehicle fallback loop in the frontend)
+"""
+import contextvars
+import random
+import re
+import time
+from app.config import settings
+from app.metrics import route_label
+
+current_queries = contextvars.ContextVar("current_queries", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+SQL_PREVIEW = 300
+MAX_CLIENT_KEYS = 10000
+
+
+def compact_sql(statement: str, limit: int = SQL_PREVIEW):
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+class RequestQueries:
+    __slots__ = ("count", "total_s", "slowest_s", "slowest_sql", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.slowest_s = 0.0
+        self.slowest_sql = None
+        self.statements = {}  # statement text -> executions (bind parameters are not part of it)
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.total_s += seconds
+        self.statements[statement] = self.statements.get(statement, 0) + 1
+        if seconds >= self.slowest_s:
+            self.slowest_s = seconds
+            self.slowest_sql = statement
+
+    def most_repeated(self):
+        if not self.statements:
+            return None, 0
+        return max(self.statements.items(), key=lambda item: item[1])
+
+    def server_timing(self):
+        header = f'db;dur={self.total_s * 1000:.1f};desc="{self.count} queries"'
+        if self.count:
+            header += f", db-slowest;dur={self.slowest_s * 1000:.1f}"
+        return header
+
+
+def record(statement: str, seconds: float):
+    """Called once per executed statement"""
+    queries = current_queries.get()
+    if queries is not None:
+        queries.record(statement, seconds)
+    if seconds * 1000 >= settings.SLOW_QUERY_MS and random.random() < settings.SLOW_QUERY_SAMPLE_RATE:
+        print(f"Slow query ({seconds * 1000:.0f} ms, {route_label()}): {compact_sql(statement)}")
+
+
+class RouteQueryStats:
+    """Cumulative per-route totals, plus the repeated-call detector"""
+    def __init__(self):
+        self.routes = {}  # route -> {requests, queries, db_s, max_queries, slowest_s, slowest_sql}
+        self.bursts = {}  # (client, route) -> [window start, calls, reported]
+
+    def add(self, method: str, route: str, client: str, queries: RequestQueries):
+        key = f"{method} {route}"
+        entry = self.routes.get(key)
+        if entry is None:
+            entry = self.routes[key] = {"requests": 0, "queries": 0, "db_s": 0.0, "max_queries": 0,
+                                        "slowest_s": 0.0, "slowest_sql": None}
+        entry["requests"] += 1
+        entry["queries"] += queries.count
+        entry["db_s"] += queries.total_s
+        entry["max_queries"] = max(entry["max_queries"], queries.count)
+        if queries.slowest_s > entry["slowest_s"]:
+            entry["slowest_s"] = queries.slowest_s
+            entry["slowest_sql"] = queries.slowest_sql
+
+        threshold = settings.QUERY_REPEAT_WARN
+        if not threshold:
+            return
+        statement, repeats = queries.most_repeated()
+        if repeats >= threshold:
+            print(f"N+1 suspect: {key} ran the same statement {repeats}x in one request "
+                  f"({queries.count} queries, {queries.total_s * 1000:.0f} ms): {compact_sql(statement)}")
+        self._track_burst(key, client, threshold)
+
+    def _track_burst(self, key: str, client: str, threshold: int):
+        now = time.monotonic()
+        burst = self.bursts.get((client, key))
+        if burst is None or now - burst[0] >= 1.0:
+            if len(self.bursts) >= MAX_CLIENT_KEYS:
+                self.bursts = {k: v for k, v in self.bursts.items() if now - v[0] < 1.0}
+            self.bursts[(client, key)] = burst = [now, 0, False]
+        burst[1] += 1
+        if burst[1] >= threshold and not burst[2]:
+            burst[2] = True
+            print(f"N+1 suspect: {client} called {key} {burst[1]}x within 1 s; use a bulk endpoint")
+
+    def report(self, top: int = 10):
+        """Routes with the most total DB time"""
+        ranked = sorted(self.routes.items(), key=lambda item: item[1]["db_s"], reverse=True)[:top]
+        return {
+            route: {
+                "requests": e["requests"],
+                "queries_per_request": round(e["queries"] / e["requests"], 1),
+                "max_queries": e["max_queries"],
+                "db_ms_per_request": round(e["db_s"] * 1000 / e["requests"], 1),
+                "db_ms_total": round(e["db_s"] * 1000),
+                "slowest_ms": round(e["slowest_s"] * 1000, 1),
+                "slowest_sql": compact_sql(e["slowest_sql"], 160) if e["slowest_sql"] else None,
+            }
+            for route, e in ranked
+        }
+
+
+query_stats = RouteQueryStats()
@@ -1,31 +1,64 @@
-from fastapi import WebSocket
+from fastapi import WebSocket, HTTPException
 import json
 import asyncio
+import time
+from app.metrics import WS_CLIENTS, WS_SEND_SECONDS
+from app.tracing import tracer
+
+# Policy violation: the socket is closed before accept when the token is missing or invalid
+WS_UNAUTHORIZED = 1008
 
 class ConnectionManager:
+    """
+    Live WebSocket clients and the tenant each one may see.
+    Events go to the clients of their tenant and to global admins (scope None).
+    """
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.active_connections: dict[WebSocket, int | None] = {}
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket, tenant_id: int | None):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections[websocket] = tenant_id
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.active_connections.pop(websocket, None)
 
-    async def broadcast(self, message: str):
+    async def broadcast(self, message: str, tenant_id: int = None, traceparent: str = None):
+        """Send to global admins and to clients of tenant_id (no tenant: admins only)"""
+        span = tracer.start_span("ws.send", parent=traceparent, kind="producer") if traceparent else None
         # iterate over copy to avoid modification during iteration issues
-        for connection in self.active_connections[:]:
+        clients = [ws for ws, scope in list(self.active_connections.items())
+                   if scope is None or (tenant_id is not None and scope == tenant_id)]
+        for connection in clients:
+            start = time.perf_counter()
             try:
                 await connection.send_text(message)
             except Exception:
                 self.disconnect(connection)
+                continue
+            WS_SEND_SECONDS.observe(time.perf_counter() - start)
+        if span is not None:
+            span.set_attribute("ws.clients", len(clients))
+            span.end()
 
 manager = ConnectionManager()
+WS_CLIENTS.set_function(lambda: len(manager.active_connections))
 
-async def ws_listener(websocket: WebSocket):
-    await manager.connect(websocket)
+async def ws_listener(websocket: WebSocket, token: str = None):
+    """Browsers cannot set headers on a WebSocket, so the JWT comes as ?token="""
+    from app.auth_middleware import user_from_token
+    from app.db import AsyncSessionLocal
+    if not token:
+        await websocket.close(code=WS_UNAUTHORIZED)
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            user = await user_from_token(token, db)
+    except HTTPException:
+        await websocket.close(code=WS_UNAUTHORIZED)
+        return
+    # Filter by tenant unless global admin
+    await manager.connect(websocket, None if user.tenant_id == 1 else user.tenant_id)
     try:
         while True:
             # Just keep the connection open and wait for disconnect
@@ -35,5 +68,4 @@ async def ws_listener(websocket: WebSocket):
         manager.disconnect(websocket)
 
 async def publish_position(position_dict):
-    await manager.broadcast(json.dumps(position_dict))
-
+    await manager.broadcast(json.dumps(position_dict), position_dict.get("tenant_id"))
@@ -0,0 +1,44 @@
+"""
+Fast JSON rendering for the bulk read endpoints.
+
+Returning a FastJSONResponse instance from a route skips FastAPI's
+jsonable_encoder walk (and any response_model validation): the rows go
+straight to orjson, which handles datetime, date and UUID natively.
+Without orjson the same content is rendered by the stdlib encoder.
+
+    return FastJSONResponse([{"id": row.id, "timestamp": row.timestamp} for row in rows])
+"""
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+
+
+def _default(value):
+    """The stdlib fallback for what orjson serialises natively"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (UUID, Decimal)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        # OPT_NON_STR_KEYS: int keys (e.g. per-device maps) like the stdlib encoder
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,122 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import desc
+from app.db import get_db
+from app.models import Alert, AlertRule, Device, User
+from app.auth_middleware import require_manager, get_current_user
+from app.services.alerts import alert_engine, RULE_TYPES
+from pydantic import BaseModel
+
+router = APIRouter(prefix="/alerts", tags=["Alerts"])
+
+class AlertRuleCreate(BaseModel):
+    rule_type: str
+    device_id: int | None = None
+    threshold: float | None = None
+    duration_seconds: int = 0
+
+def serialize_rule(rule: AlertRule):
+    return {
+        "id": rule.id,
+        "tenant_id": rule.tenant_id,
+        "device_id": rule.device_id,
+        "rule_type": rule.rule_type,
+        "threshold": rule.threshold,
+        "duration_seconds": rule.duration_seconds,
+        "is_active": rule.is_active,
+    }
+
+@router.get("/rules")
+async def list_rules(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    stmt = select(AlertRule)
+    # Filter by tenant unless global admin
+    if current_user.tenant_id != 1:
+        stmt = stmt.where(AlertRule.tenant_id == current_user.tenant_id)
+    result = await db.execute(stmt)
+    return [serialize_rule(r) for r in result.scalars().all()]
+
+@router.post("/rules", status_code=201)
+async def create_rule(
+    payload: AlertRuleCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_manager)
+):
+    if payload.rule_type not in RULE_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported alert type. Use one of: {', '.join(RULE_TYPES)}")
+    if payload.rule_type == "speed" and payload.threshold is None:
+        raise HTTPException(status_code=400, detail="Speed alerts need a threshold (km/h)")
+
+    tenant_id = current_user.tenant_id
+    if payload.device_id:
+        result = await db.execute(select(Device).where(Device.id == payload.device_id))
+        device = result.scalars().first()
+        if not device:
+            raise HTTPException(status_code=404, detail="Device not found")
+        # Enforce tenant isolation
+        if current_user.tenant_id != 1 and device.tenant_id != current_user.tenant_id:
+            raise HTTPException(status_code=403, detail="Not authorized to add alerts for this device")
+        tenant_id = device.tenant_id
+
+    rule = AlertRule(
+        tenant_id=tenant_id,
+        device_id=payload.device_id,
+        rule_type=payload.rule_type,
+        threshold=payload.threshold,
+        duration_seconds=payload.duration_seconds,
+        is_active=True,
+        created_by=current_user.id
+    )
+    db.add(rule)
+    await db.commit()
+    await db.refresh(rule)
+
+    alert_engine.add_rule(rule)
+    await alert_engine.rules_changed()
+    return serialize_rule(rule)
+
+@router.delete("/rules/{rule_id}")
+async def delete_rule(
+    rule_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_manager)
+):
+    result = await db.execute(select(AlertRule).where(AlertRule.id == rule_id))
+    rule = result.scalars().first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    if current_user.tenant_id != 1 and rule.tenant_id != current_user.tenant_id:
+        raise HTTPException(status_code=403, detail="Not authorized to delete this alert rule")
+
+    await db.delete(rule)
+    await db.commit()
+
+    alert_engine.remove_rule(rule_id)
+    await alert_engine.rules_changed()
+    return {"message": "Alert rule deleted"}
+
+@router.get("/")
+async def list_alerts(
+    limit: int = 50,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    stmt = select(Alert)
+    if current_user.tenant_id != 1:
+        stmt = stmt.where(Alert.tenant_id == current_user.tenant_id)
+    result = await db.execute(stmt.order_by(desc(Alert.triggered_at)).limit(limit))
+    return [
+        {
+            "id": a.id,
+            "rule_id": a.rule_id,
+            "device_id": a.device_id,
+            "alert_type": a.alert_type,
+            "message": a.message,
+            "details": a.details,
+            "triggered_at": a.triggered_at
+        }
+        for a in result.scalars().all()
+    ]
@@ -1,16 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import desc
-from app.db import get_db
+from sqlalchemy import desc, tuple_
+from app.db import get_db, AsyncSessionLocal
 from app.models import User, AuditLog
 from app.auth_middleware import require_admin, get_current_user
 from pydantic import BaseModel
 from datetime import datetime
 from typing import List, Optional, Any
+import base64
+import csv
+import io
+import json
 
 router = APIRouter(prefix="/audit-logs", tags=["Audit Logs"])
 
+EXPORT_CHUNK_ROWS = 1000
+
 class AuditLogOut(BaseModel):
     id: int
     user_id: Optional[int]
@@ -23,30 +30,73 @@ class AuditLogOut(BaseModel):
     class Config:
         from_attributes = True
 
-@router.get("/", response_model=List[AuditLogOut])
-async def get_audit_logs(
-    skip: int = 0, 
-    limit: int = 50, 
-    current_user: User = Depends(get_current_user), 
-    db: AsyncSession = Depends(get_db)
-):
-    """List audit logs (Admin only, or scoped to tenant)"""
+def encode_cursor(timestamp: datetime, log_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{log_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        ts, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(log_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def check_access(current_user: User):
     # Enforce access: only admins of Tenant 1 see all, others see their tenant
-    # Normal users (viewer/manager) can't see audit logs usually, 
+    # Normal users (viewer/manager) can't see audit logs usually,
     # but we'll scope it by tenant if they have permission
     if current_user.role != "admin" and current_user.tenant_id != 1:
          # Optionally allow managers to see their tenant's logs
          if current_user.role != "manager":
              raise HTTPException(status_code=403, detail="Not authorized")
+
+def filtered_query(current_user: User, action, user_id, start, end):
+    """Audit rows visible to current_user, newest first (matches the composite indexes)"""
     # Join with User to get email
     query = select(AuditLog, User.email).outerjoin(User, AuditLog.user_id == User.id)
-    
+
     if current_user.tenant_id != 1:
         query = query.where(AuditLog.tenant_id == current_user.tenant_id)
-        
-    query = query.order_by(desc(AuditLog.timestamp)).offset(skip).limit(limit)
-    result = await db.execute(query)
-    
+    if action:
+        query = query.where(AuditLog.action == action)
+    if user_id:
+        query = query.where(AuditLog.user_id == user_id)
+    if start:
+        query = query.where(AuditLog.timestamp >= start)
+    if end:
+        query = query.where(AuditLog.timestamp <= end)
+
+    return query.order_by(desc(AuditLog.timestamp), desc(AuditLog.id))
+
+@router.get("/", response_model=List[AuditLogOut])
+async def get_audit_logs(
+    response: Response,
+    skip: int = 0,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    List audit logs (Admin only, or scoped to tenant).
+    Keyset pagination: pass the X-Next-Cursor header of the previous page as `cursor`.
+    `skip` is kept for old clients and is ignored when a cursor is given.
+    """
+    check_access(current_user)
+    limit = max(1, min(limit, 500))
+    query = filtered_query(current_user, action, user_id, start, end)
+
+    if cursor:
+        cursor_ts, cursor_id = decode_cursor(cursor)
+        query = query.where(tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(cursor_ts, cursor_id))
+    elif skip:
+        query = query.offset(skip)
+
+    result = await db.execute(query.limit(limit))
+
     logs = []
     for row in result:
         log, email = row
@@ -60,5 +110,53 @@ async def get_audit_logs(
             "user_email": email
         }
         logs.append(log_dict)
-        
+
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1]["timestamp"], logs[-1]["id"])
+
     return logs
+
+@router.get("/export.csv")
+async def export_audit_logs(
+    action: Optional[str] = None,
+    user_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Stream every matching audit row as CSV (server-side cursor, constant memory)"""
+    check_access(current_user)
+    query = filtered_query(current_user, action, user_id, start, end)
+
+    async def rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "timestamp", "action", "user_id", "user_email", "tenant_id", "ip_address", "details"])
+        # The session lives inside the generator so it stays open for the whole stream
+        async with AsyncSessionLocal() as db:
+            result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+            count = 0
+            async for log, email in result:
+                writer.writerow([
+                    log.id,
+                    log.timestamp.isoformat() if log.timestamp else "",
+                    log.action,
+                    log.user_id,
+                    email,
+                    log.tenant_id,
+                    log.ip_address,
+                    json.dumps(log.details, default=str)
+                ])
+                count += 1
+                if count % EXPORT_CHUNK_ROWS == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+        yield buffer.getvalue()
+
+    filename = f"audit_logs_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv"
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
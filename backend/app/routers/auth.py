@@ -1,10 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File, Form, Request
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import get_db
-from app.models import User, Tenant, AuditLog
+from app.config import settings
+from app.models import User, Tenant
+from app.services.audit import audit_sink
+from app.services.frames import MODES as FRAME_MODES, frame_policy
 from datetime import datetime
-from app.security import hash_password, verify_password, create_access_token
-from app.auth_middleware import require_admin, get_current_user, get_current_user_optional
+from app.security import hash_password_async, verify_password_async, create_access_token, login_limiter
+from app.auth_middleware import require_admin, get_current_user, get_current_user_optional, invalidate_user
 from pydantic import BaseModel, EmailStr
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
@@ -150,6 +153,9 @@ async def get_tenants(
 
 class UpdateTenantRequest(BaseModel):
     name: Optional[str] = None
+    # Raw tracker frames: "compressed", "inline" or "off"; retention in days (0 = forever)
+    raw_frames: Optional[str] = None
+    raw_frame_retention_days: Optional[int] = None
 
 @router.patch("/tenants/{tenant_id}")
 async def update_tenant(
@@ -165,8 +171,21 @@ async def update_tenant(
         raise HTTPException(status_code=404, detail="Company not found")
     if data.name:
         tenant.name = data.name
+    if data.raw_frames is not None:
+        if data.raw_frames not in FRAME_MODES:
+            raise HTTPException(status_code=400, detail=f"raw_frames must be one of {', '.join(FRAME_MODES)}")
+        tenant.raw_frames = data.raw_frames
+    if data.raw_frame_retention_days is not None:
+        if data.raw_frame_retention_days < 0:
+            raise HTTPException(status_code=400, detail="raw_frame_retention_days must be 0 or more")
+        tenant.raw_frame_retention_days = data.raw_frame_retention_days
     await db.commit()
-    return {"id": tenant.id, "name": tenant.name, "logo": tenant.logo_url}
+    # Cached principals carry their tenant (company name / theme)
+    invalidate_user()
+    frame_policy.invalidate(tenant.id)
+    return {"id": tenant.id, "name": tenant.name, "logo": tenant.logo_url,
+            "raw_frames": tenant.raw_frames or settings.RAW_FRAME_STORAGE,
+            "raw_frame_retention_days": tenant.raw_frame_retention_days}
 
 @router.delete("/tenants/{tenant_id}", status_code=204)
 async def delete_tenant(
@@ -181,6 +200,7 @@ async def delete_tenant(
         raise HTTPException(status_code=404, detail="Company not found")
     await db.delete(tenant)
     await db.commit()
+    invalidate_user()
 
 
 
@@ -190,6 +210,18 @@ async def login(data: LoginRequest, request: Request, db: AsyncSession = Depends
     if not getattr(request.app.state, "db_ready", False):
         raise HTTPException(status_code=503, detail="Database is initializing. Please try again in a few seconds.")
 
+    # Throttle failed attempts per client and per account (password guessing);
+    # successful logins are not counted, so an office behind one NAT can all sign in at shift change
+    client_ip = request.client.host if request.client else "unknown"
+    limit_keys = (("ip", client_ip), ("email", data.email.lower()))
+    retry_after = max(login_limiter.retry_after(key) for key in limit_keys)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts. Please wait and try again.",
+            headers={"Retry-After": str(int(retry_after) + 1)}
+        )
+
     try:
         # Python 3.10: Use wait_for instead of timeout context manager
         result = await asyncio.wait_for(
@@ -210,7 +242,7 @@ async def login(data: LoginRequest, request: Request, db: AsyncSession = Depends
                 detail="User does not belong to this company"
             )
         
-        if not verify_password(data.password, user.hashed_password):
+        if not await verify_password_async(data.password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials"
@@ -224,21 +256,28 @@ async def login(data: LoginRequest, request: Request, db: AsyncSession = Depends
         
         # Update last_login
         user.last_login = datetime.utcnow()
+        await db.commit()
         
         # Audit Log
-        audit = AuditLog(
+        await audit_sink.record(
             user_id=user.id,
             action="LOGIN",
             details={"email": user.email},
             ip_address="127.0.0.1" 
         )
-        db.add(audit)
-        await db.commit()
+    except HTTPException as e:
+        if e.status_code == status.HTTP_401_UNAUTHORIZED:
+            for key in limit_keys:
+                login_limiter.hit(key)
+        raise
     except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Database connection timed out")
     except Exception as e:
         print(f"Login error: {e}")
         raise HTTPException(status_code=500, detail="An internal error occurred during login")
+
+    # Earlier typos of this account no longer count (the client IP's failures still do)
+    login_limiter.reset(limit_keys[1])
     
     token = create_access_token({
         "sub": user.email,
@@ -289,7 +328,7 @@ async def setup_account(data: SetupAccountRequest, db: AsyncSession = Depends(ge
         )
     
     # Set password and activate account
-    user.hashed_password = hash_password(data.password)
+    user.hashed_password = await hash_password_async(data.password)
     user.is_active = True
     user.setup_token = None  # Invalidate token
     
@@ -319,7 +358,6 @@ async def setup_account(data: SetupAccountRequest, db: AsyncSession = Depends(ge
 @router.post("/create-user", response_model=UserResponse)
 async def create_user(
     data: CreateUserRequest,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(require_admin)
 ):
@@ -362,12 +400,9 @@ async def create_user(
     )
     
     db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
     
-    # Send Invitation Email
-    from app.services.email import send_email
-    from app.config import settings
+    # Invitation Email (queued in the same transaction, delivered by the email worker)
+    from app.services.email import queue_email
     
     # Check if we are in production or local to determine the link
     # We can use a setting or a hardcoded fallback if domain is not set
@@ -388,8 +423,9 @@ async def create_user(
     </div>
     """
     
-    # Send email in background to avoid blocking the UI
-    background_tasks.add_task(send_email, new_user.email, subject, html_content)
+    queue_email(db, new_user.email, subject, html_content)
+    await db.commit()
+    await db.refresh(new_user)
 
     return {
         "id": new_user.id,
@@ -478,6 +514,7 @@ async def update_user(
         
     await db.commit()
     await db.refresh(user)
+    invalidate_user(user.id)
     return user
 
 @router.delete("/users/{user_id}")
@@ -498,5 +535,6 @@ async def delete_user(
         
     await db.delete(user)
     await db.commit()
+    invalidate_user(user_id)
     
     return {"message": "User deleted successfully"}
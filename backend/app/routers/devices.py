@@ -5,6 +5,8 @@ from app.models import Device, Tenant, User
 from app.auth_middleware import require_admin, require_manager, get_current_user
 from pydantic import BaseModel
 from sqlalchemy.future import select
+from app.services.clustering import cluster_index
+from app.services.audit import audit_sink
 
 router = APIRouter(prefix="/devices")
 
@@ -44,19 +46,17 @@ async def create_device(
     )
     db.add(device)
     
-    # Audit Log
-    from app.models import AuditLog
-    audit = AuditLog(
+    await db.commit()
+    await db.refresh(device)
+
+    # Audit Log (written asynchronously by the audit sink)
+    await audit_sink.record(
         user_id=current_user.id,
         tenant_id=current_user.tenant_id,
         action="CREATE_DEVICE",
         details={"imei": device.imei, "tenant_id": target_tenant_id},
         ip_address="127.0.0.1"
     )
-    db.add(audit)
-    
-    await db.commit()
-    await db.refresh(device)
     return {"id": device.id, "imei": device.imei}
 
 @router.get("/")
@@ -100,19 +100,18 @@ async def delete_device(
     if current_user.tenant_id != 1 and device.tenant_id != current_user.tenant_id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this device")
     
+    await db.delete(device)
+    await db.commit()
+    cluster_index.remove(device_id)
+
     # Audit Log
-    from app.models import AuditLog
-    audit = AuditLog(
+    await audit_sink.record(
         user_id=current_user.id,
         tenant_id=current_user.tenant_id,
         action="DELETE_DEVICE",
         details={"imei": device.imei, "id": device_id},
         ip_address="127.0.0.1"
     )
-    db.add(audit)
-    
-    await db.delete(device)
-    await db.commit()
     
     return {"message": f"Device {device.imei} deleted successfully"}
 
@@ -139,18 +138,16 @@ async def update_device(
     if payload.driver_name is not None:
         device.driver_name = payload.driver_name
         
+    await db.commit()
+    await db.refresh(device)
+
     # Audit Log
-    from app.models import AuditLog
-    audit = AuditLog(
+    await audit_sink.record(
         user_id=current_user.id,
         tenant_id=current_user.tenant_id,
         action="UPDATE_DEVICE",
         details={"id": device_id, "imei": device.imei},
         ip_address="127.0.0.1"
     )
-    db.add(audit)
-        
-    await db.commit()
-    await db.refresh(device)
     
     return {"id": device.id, "imei": device.imei, "name": device.name, "driver_name": device.driver_name}
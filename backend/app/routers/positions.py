@@ -1,11 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, Header, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import get_db
-from app.models import Position, Device, User
+from app.models import Position, PositionFrame, Device, User, DeviceTrack
 from app.schemas import PositionCreate, PositionOut
 from app.auth_middleware import get_current_user
+from app.services.pipeline import position_saved
+from app.services.clustering import cluster_index
+from app.services.geocoder import geocoder
+from app.utils.geo import point_geography, parse_bbox
+from app.services.tracks import clean_track
+from app.services.position_store import device_history, path_distance_km
+from app.services.frames import decompress, frame_policy, frame_row
+from app.services.tiles import invalidate_late_fixes
+from app.config import settings
+from app.metrics import FRAMES
+from app.tracing import tracer
+from app.responses import FastJSONResponse
 from sqlalchemy.future import select
-from datetime import datetime
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/positions")
 
@@ -23,7 +36,8 @@ async def create_position(payload: PositionCreate, db: AsyncSession = Depends(ge
         speed=payload.speed,
         course=payload.course,
         timestamp=payload.timestamp or datetime.utcnow(),
-        raw=payload.raw
+        raw=payload.raw,
+        geom=point_geography(payload.latitude, payload.longitude)
     )
     db.add(pos)
     await db.commit()
@@ -31,11 +45,16 @@ async def create_position(payload: PositionCreate, db: AsyncSession = Depends(ge
     db.add(pos)
     await db.commit()
     await db.refresh(pos)
-    # publish to redis (realtime) - omitted here; call publish_position(pos)
+    await invalidate_late_fixes([pos.timestamp])
+    position_saved(device, pos)
     return pos
 
 @router.post("/ingest")
-async def ingest_position(payload: dict, db: AsyncSession = Depends(get_db)):
+async def ingest_position(
+    payload: dict,
+    db: AsyncSession = Depends(get_db),
+    traceparent: str | None = Header(None)
+):
     """
     Ingest Raw Data from Gateway
     Payload: {"raw_hex": "...", "source_ip": "..."}
@@ -52,36 +71,55 @@ async def ingest_position(payload: dict, db: AsyncSession = Depends(get_db)):
     except:
         raise HTTPException(400, "Invalid hex")
         
-    # Attempt Decode (Simple MVP: Try GPS103)
-    decoder = GPS103Decoder() # In future, factory pattern based on protocol
-    data = await decoder.decode(raw_bytes)
-    
-    if "imei" in data and "latitude" in data:
-        # Save to DB
-        # Find Device
-        device_q = await db.execute(select(Device).where(Device.imei == data["imei"]))
-        device = device_q.scalars().first()
-        
-        if not device:
-            # Auto-create? Or Log Warning?
-            # For Safety: Log Warning and return 200 (so Gateway doesn't retry)
-            print(f"Unknown Device Ingested: {data['imei']}")
-            return {"status": "unknown_device", "imei": data["imei"]}
-            
-        pos = Position(
-            device_id=device.id,
-            latitude=data["latitude"],
-            longitude=data["longitude"],
-            speed=data.get("speed", 0),
-            course=data.get("course", 0),
-            timestamp=datetime.utcnow(),
-            raw=payload.get("raw_hex")
-        )
-        db.add(pos)
-        await db.commit()
-        return {"status": "ok", "id": pos.id}
-        
-    return {"status": "ignored", "reason": "no_gps_data"}
+    # Continues the gateway's trace (traceparent header) when there is one
+    span = tracer.start_span("ingest.http", parent=traceparent or payload.get("traceparent") or False,
+                             kind="server", attributes={"net.peer": payload.get("source_ip", "")})
+    with span:
+        # Attempt Decode (Simple MVP: Try GPS103)
+        decoder = GPS103Decoder() # In future, factory pattern based on protocol
+        FRAMES.labels(protocol=decoder.name, stage="received").inc()
+        with tracer.start_span("decode", attributes={"protocol": decoder.name}):
+            data = await decoder.decode(raw_bytes)
+
+        if "imei" in data and "latitude" in data:
+            FRAMES.labels(protocol=decoder.name, stage="decoded").inc()
+            # Save to DB
+            # Find Device
+            device_q = await db.execute(select(Device).where(Device.imei == data["imei"]))
+            device = device_q.scalars().first()
+
+            if not device:
+                # Auto-create? Or Log Warning?
+                # For Safety: Log Warning and return 200 (so Gateway doesn't retry)
+                print(f"Unknown Device Ingested: {data['imei']}")
+                return {"status": "unknown_device", "imei": data["imei"]}
+
+            # Raw frame per the tenant's raw_frames mode: inline hex, compressed side table, or dropped
+            frame_mode = await frame_policy.mode(db, device.tenant_id)
+            pos = Position(
+                device_id=device.id,
+                latitude=data["latitude"],
+                longitude=data["longitude"],
+                speed=data.get("speed"),
+                course=data.get("course", 0),
+                timestamp=datetime.utcnow(),
+                geom=point_geography(data["latitude"], data["longitude"])
+            )
+            if frame_mode == "inline":
+                pos.raw = raw_hex
+            db.add(pos)
+            if frame_mode == "compressed":
+                await db.flush()  # assigns pos.id
+                db.add(PositionFrame(**frame_row(pos.id, device.tenant_id, raw_bytes, datetime.now(timezone.utc))))
+            with tracer.start_span("db.commit", kind="client"):
+                await db.commit()
+            FRAMES.labels(protocol=decoder.name, stage="persisted").inc()
+            await invalidate_late_fixes([pos.timestamp])
+            position_saved(device, pos, data)
+            return {"status": "ok", "id": pos.id}
+
+        FRAMES.labels(protocol=decoder.name, stage="rejected").inc()
+        return {"status": "ignored", "reason": "no_gps_data"}
 
 @router.get("/latest/{imei}", response_model=PositionOut)
 async def latest_position(
@@ -101,13 +139,21 @@ async def latest_position(
         raise HTTPException(404, "No positions")
     return pos
 
-@router.get("/snapshot")
+@router.get("/snapshot", response_class=FastJSONResponse)
 async def get_fleet_snapshot(
+    bbox: str = None,
+    zoom: int = None,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get the latest position for ALL devices in one query"""
-    from sqlalchemy import func
+    """
+    Get the latest position for ALL devices in one query.
+    Optional bbox ('west,south,east,north') limits the result to vehicles in the viewport;
+    below SNAPSHOT_DETAIL_ZOOM the rows are trimmed to what a marker needs.
+    Selects plain columns (no ORM hydration) and renders them with FastJSONResponse.
+    """
+    from sqlalchemy import func, cast
+    from geoalchemy2 import Geography
     
     # Subquery to find max timestamp per device
     subq = (
@@ -116,8 +162,14 @@ async def get_fleet_snapshot(
         .subquery()
     )
     
-    # Join to get full position details
-    query = select(Position).join(Device).join(
+    detail = zoom is None or zoom >= settings.SNAPSHOT_DETAIL_ZOOM
+    columns = [Position.id, Position.device_id, Position.latitude, Position.longitude,
+               Position.speed, Position.timestamp]
+    if detail:
+        columns += [Position.course, Position.raw]
+
+    # Join to get the position columns
+    query = select(*columns).select_from(Position).join(Device).join(
         subq, 
         (Position.device_id == subq.c.device_id) & (Position.timestamp == subq.c.max_ts)
     )
@@ -125,32 +177,73 @@ async def get_fleet_snapshot(
     # Filter by tenant unless global admin
     if current_user.tenant_id != 1:
         query = query.where(Device.tenant_id == current_user.tenant_id)
+
+    # Viewport filter (GiST index on positions.geom)
+    if bbox:
+        west, south, east, north = parse_bbox(bbox)
+        envelope = cast(func.ST_MakeEnvelope(west, south, east, north, 4326), Geography)
+        query = query.where(func.ST_Intersects(Position.geom, envelope))
     
     result = await db.execute(query)
-    positions = result.scalars().all()
-    
-    return [
+    rows = result.all()
+
+    if not detail:
+        return FastJSONResponse([
+            {
+                "id": id_,
+                "device_id": device_id,
+                "latitude": lat,
+                "longitude": lon,
+                "speed": speed,
+                "timestamp": ts
+            }
+            for id_, device_id, lat, lon, speed, ts in rows
+        ])
+
+    return FastJSONResponse([
         {
-            "id": p.id,
-            "device_id": p.device_id,
-            "latitude": p.latitude,
-            "longitude": p.longitude,
-            "speed": p.speed,
-            "timestamp": p.timestamp,
-            "course": p.course,
-            "raw": p.raw
+            "id": id_,
+            "device_id": device_id,
+            "latitude": lat,
+            "longitude": lon,
+            "speed": speed,
+            "timestamp": ts,
+            "course": course,
+            "raw": raw
         }
-        for p in positions
-    ]
+        for id_, device_id, lat, lon, speed, ts, course, raw in rows
+    ])
 
-@router.get("/")
+@router.get("/clusters")
+async def get_fleet_clusters(
+    bbox: str,
+    zoom: int,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Server-side marker clusters for the viewport, served from the live-state grid
+    (no DB query). Clusters of one carry the device_id so the map can draw a marker.
+    """
+    west, south, east, north = parse_bbox(bbox)
+    tenant_id = None if current_user.tenant_id == 1 else current_user.tenant_id
+    clusters = cluster_index.query(tenant_id, west, south, east, north, zoom)
+    return {
+        "zoom": zoom,
+        "clusters": clusters,
+        "total_vehicles": sum(c["count"] for c in clusters)
+    }
+
+@router.get("/", response_class=FastJSONResponse)
 async def list_positions(
     device_id: int = None, 
     limit: int = 10, 
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    query = select(Position).join(Device)
+    query = select(
+        Position.id, Position.device_id, Position.latitude, Position.longitude,
+        Position.speed, Position.timestamp, Position.raw
+    ).select_from(Position).join(Device)
     
     # Filter by tenant unless global admin
     if current_user.tenant_id != 1:
@@ -162,30 +255,33 @@ async def list_positions(
     query = query.order_by(Position.timestamp.desc()).limit(limit)
     
     result = await db.execute(query)
-    positions = result.scalars().all()
     
-    return [
+    return FastJSONResponse([
         {
-            "id": p.id,
-            "device_id": p.device_id,
-            "latitude": p.latitude,
-            "longitude": p.longitude,
-            "speed": p.speed,
-            "timestamp": p.timestamp,
-            "raw": p.raw
+            "id": id_,
+            "device_id": device_id,
+            "latitude": lat,
+            "longitude": lon,
+            "speed": speed,
+            "timestamp": ts,
+            "raw": raw
         }
-        for p in positions
-    ]
+        for id_, device_id, lat, lon, speed, ts, raw in result.all()
+    ])
 
-@router.get("/routes/{device_id}")
+@router.get("/routes/{device_id}", response_class=FastJSONResponse)
 async def get_device_route(
     device_id: int,
     start_date: str = None,
     end_date: str = None,
+    cleaned: bool = False,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get route data for a device with optional date filtering"""
+    """
+    Get route data for a device with optional date filtering.
+    cleaned=true returns the jitter-filtered, smoothed track with detected stops.
+    """
     # Verify access to device
     device_q = await db.execute(select(Device).where(Device.id == device_id))
     device = device_q.scalars().first()
@@ -197,56 +293,30 @@ async def get_device_route(
 
     from datetime import datetime
     
-    query = select(Position).where(Position.device_id == device_id)
-    
     # Add date filtering
-    if start_date:
-        start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        query = query.where(Position.timestamp >= start_dt)
-    
-    if end_date:
-        end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-        query = query.where(Position.timestamp <= end_dt)
+    start_dt = datetime.fromisoformat(start_date.replace('Z', '+00:00')) if start_date else None
+    end_dt = datetime.fromisoformat(end_date.replace('Z', '+00:00')) if end_date else None
     
-    query = query.order_by(Position.timestamp.asc())
-    
-    result = await db.execute(query)
-    positions = result.scalars().all()
-    
-    # Calculate route with distance
-    route_points = []
-    total_distance = 0
-    
-    for i, p in enumerate(positions):
-        point = {
-            "lat": p.latitude,
-            "lng": p.longitude,
-            "timestamp": p.timestamp.isoformat(),
-            "speed": p.speed or 0
-        }
-        
-        # Calculate distance from previous point
-        if i > 0:
-            from math import radians, cos, sin, asin, sqrt
-            prev = positions[i-1]
-            
-            # Haversine formula for distance
-            lon1, lat1, lon2, lat2 = map(radians, [prev.longitude, prev.latitude, p.longitude, p.latitude])
-            dlon = lon2 - lon1
-            dlat = lat2 - lat1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * asin(sqrt(a))
-            km = 6371 * c  # Radius of earth in kilometers
-            total_distance += km
-        
-        route_points.append(point)
+    # Column-only TrackPoints, no ORM instances; archived months are read from Parquet
+    positions = await device_history(db, device, start_dt, end_dt)
+    total_distance = path_distance_km(positions)
+
+    # CPU-bound over the whole history: keep it off the event loop
+    track = await asyncio.to_thread(clean_track, positions)
+    # Timestamps stay datetimes; FastJSONResponse renders them as ISO 8601
+    route_points = [
+        {"lat": lat, "lng": lng, "timestamp": ts, "speed": speed}
+        for ts, lat, lng, speed in (track["points"] if cleaned else positions)
+    ]
     
-    return {
+    return FastJSONResponse({
         "device_id": device_id,
         "points": route_points,
         "total_distance_km": round(total_distance, 2),
+        "cleaned_distance_km": round(track["distance_km"], 2),
+        "stops": track["stops"],
         "total_points": len(route_points)
-    }
+    })
 
 @router.get("/trips/{device_id}")
 async def get_device_trips(
@@ -269,13 +339,8 @@ async def get_device_trips(
     
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    query = select(Position).where(
-        Position.device_id == device_id,
-        Position.timestamp >= start_date
-    ).order_by(Position.timestamp.asc())
-    
-    result = await db.execute(query)
-    positions = result.scalars().all()
+    # Column-only TrackPoints (same attribute names as Position), archive included
+    positions = await device_history(db, device, start_date)
     
     if not positions:
         return {"device_id": device_id, "trips": [], "total_trips": 0}
@@ -309,20 +374,9 @@ async def get_device_trips(
         end_pos = trip_positions[-1]
         duration = (end_pos.timestamp - start_pos.timestamp).total_seconds() / 60  # minutes
         
-        # Calculate distance
-        total_distance = 0
-        for i in range(1, len(trip_positions)):
-            from math import radians, cos, sin, asin, sqrt
-            prev = trip_positions[i-1]
-            curr = trip_positions[i]
-            
-            lon1, lat1, lon2, lat2 = map(radians, [prev.longitude, prev.latitude, curr.longitude, curr.latitude])
-            dlon = lon2 - lon1
-            dlat = lat2 - lat1
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * asin(sqrt(a))
-            km = 6371 * c
-            total_distance += km
+        # Distance over the cleaned track (parked jitter and GPS spikes removed)
+        track = await asyncio.to_thread(clean_track, trip_positions)
+        total_distance = track["distance_km"]
         
         trip_summaries.append({
             "start_time": start_pos.timestamp.isoformat(),
@@ -331,7 +385,10 @@ async def get_device_trips(
             "distance_km": round(total_distance, 2),
             "start_location": {"lat": start_pos.latitude, "lng": start_pos.longitude},
             "end_location": {"lat": end_pos.latitude, "lng": end_pos.longitude},
-            "points_count": len(trip_positions)
+            "start_address": geocoder.label(start_pos.latitude, start_pos.longitude),
+            "end_address": geocoder.label(end_pos.latitude, end_pos.longitude),
+            "points_count": len(trip_positions),
+            "stops": len(track["stops"])
         })
     
     return {
@@ -340,3 +397,90 @@ async def get_device_trips(
         "total_trips": len(trip_summaries),
         "period_days": days
     }
+
+@router.get("/tracks/{device_id}")
+async def get_device_tracks(
+    device_id: int,
+    days: int = 7,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Stored daily cleaned tracks (odometer, moving time, stops) produced by the track processor"""
+    device_q = await db.execute(select(Device).where(Device.id == device_id))
+    device = device_q.scalars().first()
+    if not device:
+        raise HTTPException(404, "Device not found")
+
+    if current_user.tenant_id != 1 and device.tenant_id != current_user.tenant_id:
+        raise HTTPException(403, "Not authorized to view this device's tracks")
+
+    from datetime import timedelta
+
+    since = datetime.utcnow().date() - timedelta(days=days)
+    result = await db.execute(
+        select(DeviceTrack)
+        .where(DeviceTrack.device_id == device_id, DeviceTrack.day >= since)
+        .order_by(DeviceTrack.day.asc())
+    )
+    tracks = result.scalars().all()
+
+    return {
+        "device_id": device_id,
+        "odometer_km": round(sum(t.distance_km or 0 for t in tracks), 2),
+        "days": [
+            {
+                "day": t.day.isoformat(),
+                "distance_km": t.distance_km,
+                "moving_minutes": round((t.moving_seconds or 0) / 60, 1),
+                "stop_count": t.stop_count,
+                "stops": t.stops,
+                "raw_points": t.raw_points,
+                "rejected_points": t.rejected_points
+            }
+            for t in tracks
+        ]
+    }
+
+@router.get("/{position_id}/frame")
+async def get_position_frame(
+    position_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Original tracker frame of one fix: from position_frames, or positions.raw for inline tenants.
+    Frames are looked up on their own (tenant checked through PositionFrame.tenant_id), so they
+    stay readable after the position itself moved to the cold archive.
+    """
+    frame_query = select(PositionFrame.codec, PositionFrame.payload).where(PositionFrame.position_id == position_id)
+    # Filter by tenant unless global admin
+    if current_user.tenant_id != 1:
+        frame_query = frame_query.where(PositionFrame.tenant_id == current_user.tenant_id)
+    stored = (await db.execute(frame_query)).first()
+
+    if stored is None:
+        query = select(Position.raw).join(Device).where(Position.id == position_id)
+        if current_user.tenant_id != 1:
+            query = query.where(Device.tenant_id == current_user.tenant_id)
+        row = (await db.execute(query)).first()
+        if not row:
+            raise HTTPException(404, "Position not found")
+        if row.raw is None:
+            raise HTTPException(404, "No frame stored for this position (retention expired or storage off)")
+        return {"position_id": position_id, "storage": "inline", "raw": row.raw}
+
+    codec, payload = stored
+    frame = decompress(codec, payload)
+    try:
+        text = frame.decode()
+    except UnicodeDecodeError:
+        text = None
+    return {
+        "position_id": position_id,
+        "storage": "compressed",
+        "codec": codec,
+        "size": len(frame),
+        "stored_bytes": len(payload),
+        "text": text,
+        "hex": frame.hex()
+    }
@@ -0,0 +1,122 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text
+from app.db import get_db
+from app.models import User
+from app.auth_middleware import get_current_user
+from app.services.tiles import cache_path, read_cached, write_cached
+from datetime import datetime, date, timedelta
+
+router = APIRouter(prefix="/tiles", tags=["Tiles"])
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+LAYERS = ("tracks", "heatmap")
+EXTENT = 4096
+BUFFER = 64
+HEATMAP_CELLS = 64  # Heatmap bins per tile edge
+# Tracks read fixes this many tile widths around the tile, so a segment that crosses
+# the edge has both ends and ST_AsMVTGeom clips it instead of it being dropped
+TRACK_MARGIN_TILES = 1
+
+TRACKS_SQL = """
+WITH bounds AS (SELECT ST_TileEnvelope(:z, :x, :y) AS geom),
+lines AS (
+    SELECT p.device_id,
+           count(*) AS points,
+           ST_MakeLine(ST_Transform(p.geom::geometry, 3857) ORDER BY p.timestamp) AS geom
+    FROM positions p
+    JOIN devices d ON d.id = p.device_id, bounds
+    WHERE p.timestamp >= :start AND p.timestamp < :end
+      AND p.geom && ST_Transform(ST_Expand(bounds.geom, :margin), 4326)::geography
+      {filters}
+    GROUP BY p.device_id
+),
+mvt AS (
+    SELECT device_id, points,
+           ST_AsMVTGeom(lines.geom, bounds.geom, :extent, :buffer, true) AS geom
+    FROM lines, bounds
+)
+SELECT ST_AsMVT(mvt, 'tracks', :extent, 'geom') FROM mvt WHERE geom IS NOT NULL
+"""
+
+HEATMAP_SQL = """
+WITH bounds AS (SELECT ST_TileEnvelope(:z, :x, :y) AS geom),
+bins AS (
+    SELECT count(*) AS weight,
+           ST_SnapToGrid(ST_Transform(p.geom::geometry, 3857), :cell) AS geom
+    FROM positions p
+    JOIN devices d ON d.id = p.device_id, bounds
+    WHERE p.timestamp >= :start AND p.timestamp < :end
+      AND p.geom && ST_Transform(bounds.geom, 4326)::geography
+      {filters}
+    GROUP BY 2
+),
+mvt AS (
+    SELECT weight, ST_AsMVTGeom(bins.geom, bounds.geom, :extent, 0, true) AS geom
+    FROM bins, bounds
+)
+SELECT ST_AsMVT(mvt, 'heatmap', :extent, 'geom') FROM mvt WHERE geom IS NOT NULL
+"""
+
+# World width of EPSG:3857 in metres
+WEB_MERCATOR_WIDTH = 40075016.68557849
+
+
+@router.get("/{z}/{x}/{y}.mvt")
+async def get_tile(
+    z: int,
+    x: int,
+    y: int,
+    layer: str = "tracks",
+    day: date = None,
+    device_id: int = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Historical tracks or density heatmap for one UTC day as a Mapbox Vector Tile"""
+    if layer not in LAYERS:
+        raise HTTPException(400, f"layer must be one of: {', '.join(LAYERS)}")
+    if not (0 <= z <= 22) or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise HTTPException(400, "Tile coordinates out of range")
+
+    day = day or datetime.utcnow().date()
+    # Filter by tenant unless global admin
+    tenant_id = None if current_user.tenant_id == 1 else current_user.tenant_id
+
+    path = cache_path(tenant_id, layer, day, device_id, z, x, y)
+    tile = read_cached(path, day)
+    headers = {"Cache-Control": "private, max-age=60"}
+    if tile is not None:
+        headers["X-Tile-Cache"] = "hit"
+        return Response(content=tile, media_type=MVT_MEDIA_TYPE, headers=headers)
+
+    filters = []
+    tile_width = WEB_MERCATOR_WIDTH / (2 ** z)
+    params = {
+        "z": z, "x": x, "y": y,
+        "start": datetime.combine(day, datetime.min.time()),
+        "end": datetime.combine(day + timedelta(days=1), datetime.min.time()),
+        "extent": EXTENT,
+        "buffer": BUFFER,
+        "margin": tile_width * TRACK_MARGIN_TILES,
+        "cell": tile_width / HEATMAP_CELLS,
+    }
+    if tenant_id is not None:
+        filters.append("AND d.tenant_id = :tenant_id")
+        params["tenant_id"] = tenant_id
+    if device_id:
+        filters.append("AND p.device_id = :device_id")
+        params["device_id"] = device_id
+
+    sql = (TRACKS_SQL if layer == "tracks" else HEATMAP_SQL).format(filters=" ".join(filters))
+    result = await db.execute(text(sql), params)
+    tile = result.scalar() or b""
+    tile = bytes(tile)
+
+    try:
+        write_cached(path, tile)
+    except OSError as e:
+        print(f"Tile cache write failed: {e}")
+
+    headers["X-Tile-Cache"] = "miss"
+    return Response(content=tile, media_type=MVT_MEDIA_TYPE, headers=headers)
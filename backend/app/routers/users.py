@@ -3,13 +3,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.db import get_db
 from app.models import User, Tenant, AuditLog
-from app.auth_middleware import require_admin, get_current_user
+from app.auth_middleware import require_admin, get_current_user, invalidate_user
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 from typing import List, Optional
 import secrets
 from app.security import hash_password
-from app.services.email import send_email
+from app.services.audit import audit_sink
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -100,19 +100,17 @@ async def create_user(
         raise HTTPException(status_code=403, detail="Cannot create users for other companies")
 
     db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Audit Log
-    audit = AuditLog(
+    await audit_sink.record(
         user_id=current_user.id,
         tenant_id=current_user.tenant_id,
         action="CREATE_USER",
         details={"email": new_user.email, "role": new_user.role},
         ip_address="127.0.0.1" # TODO: Extract from request
     )
-    db.add(audit)
-    
-    await db.commit()
-    await db.refresh(new_user)
     
     # Send Invite Email (Mock for now, or use Resend if configured)
     # background_tasks.add_task(send_invite_email, new_user.email, setup_token)
@@ -153,18 +151,18 @@ async def update_user(
     if user_update.tenant_id is not None:
         user.tenant_id = user_update.tenant_id
         
+    await db.commit()
+    await db.refresh(user)
+    invalidate_user(user_id)
+
     # Audit Log
-    audit = AuditLog(
+    await audit_sink.record(
         user_id=current_user.id,
         tenant_id=current_user.tenant_id,
         action="UPDATE_USER",
         details={"target_user_id": user_id, "changes": user_update.dict(exclude_unset=True)},
         ip_address="127.0.0.1"
     )
-    db.add(audit)
-        
-    await db.commit()
-    await db.refresh(user)
     return user
 
 @router.delete("/{user_id}")
@@ -189,16 +187,15 @@ async def delete_user(
     )
     
     await db.delete(user)
+    await db.commit()
+    invalidate_user(user_id)
     
     # Audit Log
-    audit = AuditLog(
+    await audit_sink.record(
         user_id=current_user.id,
         tenant_id=current_user.tenant_id,
         action="DELETE_USER",
         details={"target_user_id": user_id, "email": user.email},
         ip_address="127.0.0.1"
     )
-    db.add(audit)
-    
-    await db.commit()
     return {"message": "User deleted"}
@@ -0,0 +1,174 @@
+"""
+Production runtime profile and event-loop health.
+
+    python -m app.serve        # uvicorn with this profile (Docker CMD)
+
+LoopMonitor samples event-loop lag into a histogram and, from a watchdog
+thread, names the coroutine that is holding the loop when it stalls.
+"""
+import asyncio
+import bisect
+import inspect
+import sys
+import threading
+import time
+from app.config import settings
+from app.metrics import LOOP_LAG_SECONDS
+
+# Lag histogram bucket upper bounds, in milliseconds
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float("inf"))
+
+
+def install_uvloop():
+    """Use uvloop for every loop created from here on. Returns False when it is not installed."""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    uvloop.install()
+    return True
+
+
+def uvicorn_options(**overrides):
+    """uvicorn.run() keyword arguments for the production profile"""
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    options = {
+        "host": settings.WEB_HOST,
+        "port": settings.PORT,
+        "loop": loop,
+        "http": http,
+        "workers": settings.WEB_WORKERS,
+        "backlog": settings.WEB_BACKLOG,
+        "timeout_keep_alive": settings.WEB_KEEPALIVE,
+        "proxy_headers": True,
+        "forwarded_allow_ips": settings.FORWARDED_ALLOW_IPS,
+    }
+    options.update(overrides)
+    return options
+
+
+class LagHistogram:
+    def __init__(self, buckets=LAG_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, lag_ms: float):
+        self.counts[bisect.bisect_left(self.buckets, lag_ms)] += 1
+        self.count += 1
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-th sample"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound if bound != float("inf") else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "samples": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 1),
+            "buckets": {("+Inf" if b == float("inf") else f"le_{b:g}"): n for b, n in zip(self.buckets, self.counts)},
+        }
+
+
+def describe_stack(frame, limit: int = 4):
+    """Innermost call and the coroutines awaiting it: 'module.func (file:line) <- module.coro (...)'"""
+    parts = []
+    innermost = True
+    while frame is not None and len(parts) < limit + 1:
+        code = frame.f_code
+        is_coroutine = code.co_flags & (inspect.CO_COROUTINE | inspect.CO_ITERABLE_COROUTINE | inspect.CO_ASYNC_GENERATOR)
+        if innermost or is_coroutine:
+            parts.append(f"{frame.f_globals.get('__name__', '?')}.{code.co_name} "
+                         f"({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        innermost = False
+        frame = frame.f_back
+    return " <- ".join(parts) or "?"
+
+
+class LoopMonitor:
+    """
+    A coroutine wakes every `interval` and records how late it was (loop lag).
+    A watchdog thread checks the same heartbeat; when the loop has not come back
+    for `slow_ms`, it captures the loop thread's stack and logs which coroutine is
+    blocking it - this works with uvloop, where asyncio's debug mode does not.
+    """
+    def __init__(self, interval: float = None, slow_ms: float = None):
+        self.interval = interval or settings.LOOP_MONITOR_INTERVAL
+        self.slow_ms = slow_ms or settings.SLOW_CALLBACK_MS
+        self.histogram = LagHistogram()
+        self.slow_callbacks = 0
+        self.heartbeat = time.monotonic()
+        self._loop_thread = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    async def sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.heartbeat = time.monotonic()
+            lag = max(0.0, loop.time() - expected)
+            self.histogram.observe(lag * 1000)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def watch(self):
+        reported = None  # heartbeat of the stall already logged
+        while not self._stopped.wait(self.slow_ms / 2000):
+            heartbeat = self.heartbeat
+            blocked_ms = (time.monotonic() - heartbeat) * 1000 - self.interval * 1000
+            if blocked_ms < self.slow_ms or reported == heartbeat:
+                continue
+            reported = heartbeat
+            self.slow_callbacks += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            print(f"WARNING: event loop blocked for {blocked_ms:.0f} ms (so far) in {describe_stack(frame) if frame else '?'}")
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self.sample())
+        self._watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def report(self):
+        return {**self.histogram.snapshot(), "slow_callbacks": self.slow_callbacks, "slow_threshold_ms": self.slow_ms}
+
+
+loop_monitor = LoopMonitor()
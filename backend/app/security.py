@@ -1,10 +1,18 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
 from jose import jwt
 from passlib.context import CryptContext
 from app.config import settings
+import asyncio
+import time
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt (~200 ms per call) releases the GIL, so a small thread pool keeps it off the event loop
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_slots = None
+
 def hash_password(password: str):
     return pwd_context.hash(password)
 
@@ -18,6 +26,66 @@ def verify_password(plain, hashed):
         print(f"Password verification error: {e}")
         return False
 
+async def _run_hashing(fn, *args):
+    """Run a bcrypt call in the pool; at most PASSWORD_HASH_CONCURRENCY calls queue at once"""
+    global _hash_slots
+    if _hash_slots is None:
+        _hash_slots = asyncio.Semaphore(settings.PASSWORD_HASH_CONCURRENCY)
+    async with _hash_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, fn, *args)
+
+async def hash_password_async(password: str):
+    """hash_password for async handlers (never blocks the event loop)"""
+    return await _run_hashing(hash_password, password)
+
+async def verify_password_async(plain, hashed):
+    """verify_password for async handlers (never blocks the event loop)"""
+    return await _run_hashing(verify_password, plain, hashed)
+
+class RateLimiter:
+    """In-process sliding-window limiter: at most `limit` hits per `window` seconds per key"""
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.hits = {}
+
+    def hit(self, key) -> float:
+        """Record an attempt. Returns 0 if allowed, otherwise seconds until the next slot frees up."""
+        now = time.monotonic()
+        bucket = self.hits.get(key)
+        if bucket is None:
+            bucket = self.hits[key] = deque()
+            if len(self.hits) > 10000:
+                self._purge(now)
+        while bucket and bucket[0] <= now - self.window:
+            bucket.popleft()
+        if len(bucket) >= self.limit:
+            return bucket[0] + self.window - now
+        bucket.append(now)
+        return 0
+
+    def retry_after(self, key) -> float:
+        """Like hit() without recording anything: 0 while the key is under its limit"""
+        now = time.monotonic()
+        bucket = self.hits.get(key)
+        if not bucket:
+            return 0
+        while bucket and bucket[0] <= now - self.window:
+            bucket.popleft()
+        if len(bucket) >= self.limit:
+            return bucket[0] + self.window - now
+        return 0
+
+    def reset(self, key):
+        self.hits.pop(key, None)
+
+    def _purge(self, now):
+        for key in [k for k, b in self.hits.items() if not b or b[-1] <= now - self.window]:
+            del self.hits[key]
+
+login_limiter = RateLimiter(settings.LOGIN_RATE_LIMIT, settings.LOGIN_RATE_WINDOW)
+
 def create_access_token(data: dict, expires_minutes: int = 60*24*7):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=expires_minutes)
@@ -0,0 +1,47 @@
+"""
+Run the API with the production runtime profile (uvloop, httptools, workers, backlog).
+
+    python -m app.serve                 # settings: PORT, WEB_WORKERS, WEB_BACKLOG, WEB_KEEPALIVE
+    python -m app.serve --reload        # local development
+"""
+import argparse
+import glob
+import os
+import tempfile
+import uvicorn
+from app.config import settings
+from app.runtime import uvicorn_options
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inferth Mapping API server")
+    parser.add_argument("--reload", action="store_true", help="restart on code changes (single worker)")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.workers:
+        overrides["workers"] = args.workers
+    if args.reload:
+        overrides.update(reload=True, workers=1)
+    options = uvicorn_options(**overrides)
+
+    if options["workers"] > 1 and settings.INGEST_MODE != "external":
+        # Every worker runs the lifespan: only one can bind the tracker port
+        print("Warning: WEB_WORKERS > 1 with embedded ingest; set INGEST_MODE=external and run app.ingest_worker")
+
+    if options["workers"] > 1:
+        # Workers publish their metrics here; /metrics on any of them renders the totals
+        if settings.METRICS_DIR:
+            for stale in glob.glob(os.path.join(settings.METRICS_DIR, "*.pickle")):
+                os.remove(stale)  # previous run's counters
+        else:
+            os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="inferth-metrics-")
+
+    print(f"Serving on {options['host']}:{options['port']} "
+          f"(loop={options['loop']}, http={options['http']}, workers={options['workers']}, backlog={options['backlog']})")
+    uvicorn.run("app.main:app", **options)
+
+
+if __name__ == "__main__":
+    main()
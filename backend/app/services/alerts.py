@@ -0,0 +1,335 @@
+import asyncio
+import json
+import math
+import os
+import socket
+import time
+from datetime import datetime
+from sqlalchemy import select
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Alert, AlertRule
+from app.realtime import manager
+from app.services.geocoder import geocoder
+
+RULE_TYPES = ("speed", "idle", "offline")
+
+# Below this speed (km/h) a vehicle counts as stationary - matches the frontend's "Moving" cut-off
+DEFAULT_IDLE_SPEED = 3.0
+
+# External ingest: seconds the alert leader's lease lasts, renewed every third of it
+LEADER_TTL = 15
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel: schedule/cancel are O(1) and each tick only
+    touches the timers that land in the current slot.
+    """
+    def __init__(self, slots: int = 3600, tick: float = 1.0):
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self.index = {}  # key -> slot number
+        self.current = int(time.monotonic() / tick)
+
+    def schedule(self, key, delay: float):
+        self.cancel(key)
+        deadline = self.current + max(1, math.ceil(delay / self.tick))
+        slot = deadline % len(self.slots)
+        self.slots[slot][key] = deadline
+        self.index[key] = slot
+
+    def cancel(self, key):
+        slot = self.index.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def advance(self, now: float = None):
+        """Move the wheel forward to `now` and return the keys that expired"""
+        target = int((now if now is not None else time.monotonic()) / self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            bucket = self.slots[self.current % len(self.slots)]
+            for key, deadline in list(bucket.items()):
+                # Timers further than one revolution away stay until their round comes up
+                if deadline <= self.current:
+                    del bucket[key]
+                    self.index.pop(key, None)
+                    expired.append(key)
+        return expired
+
+    def __len__(self):
+        return len(self.index)
+
+
+class DeviceState:
+    __slots__ = ("device_id", "tenant_id", "imei", "last_seen", "latitude", "longitude", "since", "fired")
+
+    def __init__(self, device_id, tenant_id, imei):
+        self.device_id = device_id
+        self.tenant_id = tenant_id
+        self.imei = imei
+        self.last_seen = None
+        self.latitude = None
+        self.longitude = None
+        self.since = {}    # rule_id -> monotonic time the condition started
+        self.fired = set() # rule_ids already alerted for the current episode
+
+
+class AlertEngine:
+    """
+    Streaming evaluator attached to position ingest.
+    Rules are indexed by device and tenant so each fix only looks at the
+    rules that apply to it; offline detection is driven by the timer wheel.
+
+    With INGEST_MODE=external every web worker follows the position bus, so
+    the workers elect one leader (a lease in Redis) that evaluates and
+    persists alerts and publishes them on the bus; the others only relay
+    those alert events to their WebSocket clients.
+    """
+    def __init__(self):
+        self.rules_by_device = {}
+        self.rules_by_tenant = {}
+        self.states = {}
+        self.wheel = TimerWheel()
+        self.active = False  # evaluating in this process
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = []
+
+    # --- Rule management ---
+
+    def set_rules(self, rules):
+        self.rules_by_device = {}
+        self.rules_by_tenant = {}
+        for rule in rules:
+            self.add_rule(rule)
+
+    def add_rule(self, rule):
+        if not rule.is_active:
+            return
+        if rule.device_id:
+            self.rules_by_device.setdefault(rule.device_id, []).append(rule)
+        else:
+            self.rules_by_tenant.setdefault(rule.tenant_id, []).append(rule)
+
+    def remove_rule(self, rule_id: int):
+        for index in (self.rules_by_device, self.rules_by_tenant):
+            for key, rules in list(index.items()):
+                index[key] = [r for r in rules if r.id != rule_id]
+                if not index[key]:
+                    del index[key]
+        for state in self.states.values():
+            state.since.pop(rule_id, None)
+            state.fired.discard(rule_id)
+            self.wheel.cancel((state.device_id, rule_id))
+
+    async def load_rules(self):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(AlertRule).where(AlertRule.is_active == True))
+            rules = result.scalars().all()
+        self.set_rules(rules)
+        print(f"Alert engine loaded {len(rules)} rules")
+
+    def reload_rules(self):
+        """Another process changed the rules (bus event); only the evaluating process cares"""
+        if self.active:
+            asyncio.get_running_loop().create_task(self.load_rules())
+
+    async def rules_changed(self):
+        """Tell the elected leader to reload rules changed by this process"""
+        if settings.INGEST_MODE != "external":
+            return
+        from app.services.bus import position_bus
+        try:
+            await position_bus.publish([{"type": "rules"}])
+        except Exception as e:
+            print(f"Alert rule change not published: {e}")
+
+    def rules_for(self, device_id, tenant_id):
+        return self.rules_by_device.get(device_id, []) + self.rules_by_tenant.get(tenant_id, [])
+
+    # --- Evaluation ---
+
+    def observe(self, device, speed: float = None, ignition: bool = None,
+                latitude: float = None, longitude: float = None, now: float = None):
+        """Evaluate all rules for one fix. Returns the alerts that fired."""
+        if not self.active:
+            return []
+        now = now if now is not None else time.monotonic()
+        state = self.states.get(device.id)
+        if state is None:
+            state = self.states[device.id] = DeviceState(device.id, device.tenant_id, device.imei)
+        state.last_seen = now
+        if latitude is not None and longitude is not None:
+            state.latitude, state.longitude = latitude, longitude
+
+        fired = []
+        for rule in self.rules_for(device.id, device.tenant_id):
+            if rule.rule_type == "offline":
+                # Every fix pushes the offline deadline out again
+                self.wheel.schedule((device.id, rule.id), rule.duration_seconds or 1800)
+                state.fired.discard(rule.id)
+                continue
+
+            if speed is None:
+                continue  # Protocol without speed (e.g. GPS103): neither speeding nor idling is known
+            if rule.rule_type == "speed":
+                active = speed > (rule.threshold or 0)
+            elif rule.rule_type == "idle":
+                active = speed <= (rule.threshold if rule.threshold is not None else DEFAULT_IDLE_SPEED)
+                if ignition is False:
+                    active = False  # Parked with engine off is not idling
+            else:
+                continue
+
+            if not active:
+                state.since.pop(rule.id, None)
+                state.fired.discard(rule.id)
+                continue
+
+            started = state.since.setdefault(rule.id, now)
+            if rule.id not in state.fired and now - started >= (rule.duration_seconds or 0):
+                state.fired.add(rule.id)
+                fired.append(self._build_alert(rule, state, speed=speed, held_seconds=round(now - started)))
+
+        for alert in fired:
+            self._emit(alert)
+        return fired
+
+    def expire(self, now: float = None):
+        """Fire offline alerts for every timer that ran out"""
+        if not self.active:
+            return []
+        fired = []
+        for device_id, rule_id in self.wheel.advance(now):
+            state = self.states.get(device_id)
+            rule = next((r for r in self.rules_for(device_id, state.tenant_id) if r.id == rule_id), None) if state else None
+            if not rule or rule_id in state.fired:
+                continue
+            state.fired.add(rule_id)
+            fired.append(self._build_alert(rule, state, silent_seconds=rule.duration_seconds or 1800))
+        for alert in fired:
+            self._emit(alert)
+        return fired
+
+    def _build_alert(self, rule, state, **details):
+        if rule.rule_type == "speed":
+            message = f"Tracker {state.imei} exceeded {rule.threshold:g} km/h"
+        elif rule.rule_type == "idle":
+            message = f"Tracker {state.imei} idling for {details.get('held_seconds', 0) // 60} min"
+        else:
+            message = f"Tracker {state.imei} silent for {(rule.duration_seconds or 1800) // 60} min"
+        if state.latitude is not None:
+            details["location"] = {"lat": state.latitude, "lng": state.longitude}
+            details["place"] = geocoder.label(state.latitude, state.longitude)
+        return {
+            "rule_id": rule.id,
+            "device_id": state.device_id,
+            "tenant_id": state.tenant_id,
+            "imei": state.imei,
+            "alert_type": rule.rule_type,
+            "message": message,
+            "details": details,
+            "triggered_at": datetime.utcnow(),
+        }
+
+    def _emit(self, alert: dict):
+        try:
+            asyncio.get_running_loop().create_task(self._persist_and_broadcast(alert))
+        except RuntimeError:
+            # No loop (e.g. called from a script) - nothing to deliver to
+            pass
+
+    async def _persist_and_broadcast(self, alert: dict):
+        try:
+            async with AsyncSessionLocal() as db:
+                db.add(Alert(
+                    rule_id=alert["rule_id"],
+                    device_id=alert["device_id"],
+                    tenant_id=alert["tenant_id"],
+                    alert_type=alert["alert_type"],
+                    message=alert["message"],
+                    details=alert["details"],
+                    triggered_at=alert["triggered_at"],
+                ))
+                await db.commit()
+        except Exception as e:
+            print(f"Alert persist error: {e}")
+
+        event = {"type": "alert", **alert}
+        if settings.INGEST_MODE == "external":
+            # Every web worker (this one too) relays it from the bus
+            from app.services.bus import position_bus
+            try:
+                await position_bus.publish([event])
+            except Exception as e:
+                print(f"Alert publish error: {e}")
+        else:
+            await manager.broadcast(json.dumps(event, default=str), alert["tenant_id"])
+
+    # --- Background ticking ---
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            try:
+                self.expire()
+            except Exception as e:
+                print(f"Alert engine tick error: {e}")
+
+    async def lead(self):
+        """Hold or contend for the alert lease; evaluate only while holding it"""
+        from app.services.bus import position_bus
+        while True:
+            try:
+                leading = await position_bus.hold_lease("alerts-leader", self.owner, LEADER_TTL)
+            except Exception as e:
+                print(f"Alert leader election error: {e}")
+                leading = False
+            try:
+                if leading and not self.active:
+                    await self.load_rules()
+                    self.active = True
+                    print(f"Alert engine evaluating in {self.owner}")
+                elif not leading and self.active:
+                    self._stand_down()
+                    print(f"Alert engine in {self.owner} lost the lease; relaying only")
+            except Exception as e:
+                print(f"Alert leader error: {e}")
+            await asyncio.sleep(LEADER_TTL / 3)
+
+    def _stand_down(self):
+        self.active = False
+        self.states = {}
+        self.wheel = TimerWheel()
+
+    async def start(self):
+        if self._tasks:
+            return
+        if settings.INGEST_MODE == "external":
+            self._tasks.append(asyncio.create_task(self.lead()))
+        else:
+            await self.load_rules()
+            self.active = True
+        self._tasks.append(asyncio.create_task(self.run()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self.active and settings.INGEST_MODE == "external":
+            # Hand over now instead of when the lease runs out
+            from app.services.bus import position_bus
+            try:
+                await position_bus.release_lease("alerts-leader", self.owner)
+            except Exception as e:
+                print(f"Alert lease release error: {e}")
+        self._stand_down()
+
+
+alert_engine = AlertEngine()
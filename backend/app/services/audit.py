@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import AuditLog
+
+_STOP = object()
+
+
+class AuditSink:
+    """
+    Fire-and-forget audit trail. Handlers enqueue events; a background task
+    bulk-inserts them so audit rows never share (or lengthen) the request's transaction.
+    The buffer is bounded: when it is full, record() waits for room instead of dropping events.
+    """
+    def __init__(self, max_buffer: int = None, batch_size: int = None, flush_interval: float = None):
+        self.max_buffer = max_buffer or settings.AUDIT_BUFFER_SIZE
+        self.batch_size = batch_size or settings.AUDIT_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.AUDIT_FLUSH_INTERVAL
+        self._queue = None
+        self._task = None
+
+    async def record(self, action: str, user_id: int = None, tenant_id: int = None,
+                     details: dict = None, ip_address: str = None):
+        event = {
+            "action": action,
+            "user_id": user_id,
+            "tenant_id": tenant_id,
+            "details": details or {},
+            "ip_address": ip_address,
+            # Stamped at the time of the action, not at flush time
+            "timestamp": datetime.now(timezone.utc),
+        }
+        if self._queue is None:
+            # Sink not running (scripts, startup) - write directly
+            await self._insert([event])
+            return
+        await self._queue.put(event)
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_buffer)
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Flush everything still buffered, then stop the writer"""
+        if self._task is None:
+            return
+        # A sentinel rather than cancel(): the writer finishes its current batch first
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        remaining = []
+        while not self._queue.empty():
+            event = self._queue.get_nowait()
+            if event is not _STOP:
+                remaining.append(event)
+        self._queue = None
+        for i in range(0, len(remaining), self.batch_size):
+            await self._insert(remaining[i:i + self.batch_size])
+
+    async def run(self):
+        stopping = False
+        while not stopping:
+            event = await self._queue.get()
+            if event is _STOP:
+                break
+            batch = [event]
+            # Collect whatever else arrives within the flush window, up to one batch
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+            await self._insert(batch)
+
+    async def _insert(self, batch, attempts: int = 3):
+        for attempt in range(1, attempts + 1):
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(insert(AuditLog), batch)
+                    await db.commit()
+                return
+            except Exception as e:
+                print(f"Audit flush failed (attempt {attempt}/{attempts}): {e}")
+                if attempt < attempts:
+                    await asyncio.sleep(attempt)
+        # Last resort: keep the trail in the logs rather than losing it
+        for event in batch:
+            print(f"AUDIT (unsaved): {event}")
+
+
+audit_sink = AuditSink()
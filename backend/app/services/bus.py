@@ -0,0 +1,119 @@
+import asyncio
+import json
+from app.config import settings
+from app.tracing import tracer
+
+# Renew or release a lease only while this owner still holds it
+RENEW_LEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+RELEASE_LEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class PositionBus:
+    """
+    Redis pub/sub channel from ingest workers to API processes.
+    Positions are durable in the database before they are published; the bus
+    only carries the live notification, so a missed message never loses a fix.
+    The API processes also use it for alerts and alert rule changes, and
+    elect the one process that evaluates alerts with a lease on the same Redis.
+    """
+    def __init__(self, url: str = None, channel: str = None):
+        self.url = url or settings.REDIS_URL
+        self.channel = channel or settings.INGEST_CHANNEL
+        self._redis = None
+        self._task = None
+
+    async def connect(self):
+        if self._redis is None:
+            import aioredis
+            self._redis = aioredis.from_url(self.url, decode_responses=True)
+            await self._redis.ping()
+
+    async def publish(self, events: list):
+        if not events:
+            return
+        await self.connect()
+        spans = []
+        for event in events:
+            if event.get("traceparent"):
+                span = tracer.start_span("bus.publish", parent=event["traceparent"], kind="producer",
+                                         attributes={"messaging.destination": self.channel})
+                if span.is_recording:
+                    event["traceparent"] = span.traceparent()
+                    spans.append(span)
+        # One round trip per batch
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for event in events:
+                    pipe.publish(self.channel, json.dumps(event, default=str))
+                await pipe.execute()
+        except Exception as e:
+            for span in spans:
+                span.record_exception(e)
+            raise
+        finally:
+            for span in spans:
+                span.end()
+
+    async def hold_lease(self, name: str, owner: str, ttl: int) -> bool:
+        """Take the named lease, or renew it if owner holds it; True while owner holds it"""
+        await self.connect()
+        key = f"{self.channel}:{name}"
+        if await self._redis.set(key, owner, nx=True, ex=ttl):
+            return True
+        return bool(await self._redis.eval(RENEW_LEASE, 1, key, owner, ttl))
+
+    async def release_lease(self, name: str, owner: str):
+        if self._redis is not None:
+            await self._redis.eval(RELEASE_LEASE, 1, f"{self.channel}:{name}", owner)
+
+    async def listen(self, handler):
+        """Call handler(event) for every message; reconnects with backoff until cancelled"""
+        delay = 1
+        while True:
+            pubsub = None
+            try:
+                await self.connect()
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(self.channel)
+                print(f"Subscribed to {self.channel} on {self.url}")
+                delay = 1
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        handler(json.loads(message["data"]))
+                    except Exception as e:
+                        print(f"Position event error: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Position bus error: {e}; reconnecting in {delay}s")
+                self._redis = None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.close()
+                    except Exception:
+                        pass
+
+    async def start_listening(self, handler):
+        await self.connect()
+        if self._task is None:
+            self._task = asyncio.create_task(self.listen(handler))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+position_bus = PositionBus()
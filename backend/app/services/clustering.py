@@ -0,0 +1,182 @@
+import math
+from sqlalchemy import select, func
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Position, Device
+
+TILE_SIZE = 256
+MAX_LATITUDE = 85.05112878  # Web Mercator limit
+GLOBAL = "*"  # Index key that holds every tenant (global admins)
+
+
+def project(latitude: float, longitude: float, zoom: int):
+    """WGS84 -> Web Mercator world pixel coordinates at `zoom`"""
+    lat = max(min(latitude, MAX_LATITUDE), -MAX_LATITUDE)
+    scale = TILE_SIZE * (1 << zoom)
+    x = (longitude + 180.0) / 360.0 * scale
+    sin_lat = math.sin(math.radians(lat))
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return x, y
+
+
+class Cell:
+    __slots__ = ("count", "sum_lat", "sum_lon", "members")
+
+    def __init__(self):
+        self.count = 0
+        self.sum_lat = 0.0
+        self.sum_lon = 0.0
+        self.members = set()
+
+
+class ClusterGrid:
+    """
+    Grid clusters for every zoom level, kept up to date incrementally.
+    Moving a vehicle touches one cell per zoom level, so updates cost O(zooms).
+    """
+    def __init__(self, max_zoom: int, radius: int):
+        self.max_zoom = max_zoom
+        self.radius = radius
+        self.points = {}  # device_id -> (lat, lon, [cell key per zoom])
+        self.levels = [dict() for _ in range(max_zoom + 1)]
+
+    def cell_key(self, latitude, longitude, zoom):
+        x, y = project(latitude, longitude, zoom)
+        return int(x // self.radius), int(y // self.radius)
+
+    def update(self, device_id, latitude, longitude):
+        keys = [self.cell_key(latitude, longitude, z) for z in range(self.max_zoom + 1)]
+        old = self.points.get(device_id)
+        for z, key in enumerate(keys):
+            if old:
+                old_key = old[2][z]
+                old_cell = self.levels[z][old_key]
+                old_cell.sum_lat -= old[0]
+                old_cell.sum_lon -= old[1]
+                if old_key != key:
+                    old_cell.count -= 1
+                    old_cell.members.discard(device_id)
+                    if old_cell.count == 0:
+                        del self.levels[z][old_key]
+            cell = self.levels[z].get(key)
+            if cell is None:
+                cell = self.levels[z][key] = Cell()
+            if not old or old[2][z] != key:
+                cell.count += 1
+                cell.members.add(device_id)
+            cell.sum_lat += latitude
+            cell.sum_lon += longitude
+        self.points[device_id] = (latitude, longitude, keys)
+
+    def remove(self, device_id):
+        old = self.points.pop(device_id, None)
+        if not old:
+            return
+        for z, key in enumerate(old[2]):
+            cell = self.levels[z][key]
+            cell.count -= 1
+            cell.sum_lat -= old[0]
+            cell.sum_lon -= old[1]
+            cell.members.discard(device_id)
+            if cell.count == 0:
+                del self.levels[z][key]
+
+    def query(self, west, south, east, north, zoom):
+        zoom = max(0, min(zoom, self.max_zoom))
+        x0, y0 = project(north, west, zoom)
+        x1, y1 = project(south, east, zoom)
+        last = int(TILE_SIZE * (1 << zoom) // self.radius)  # longitude 180 lands in this column
+        clamp = lambda value: max(0, min(int(value // self.radius), last))
+        cy0, cy1 = clamp(y0), clamp(y1)
+        if west <= east:
+            columns = [(clamp(x0), clamp(x1))]
+        else:
+            columns = [(clamp(x0), last), (0, clamp(x1))]  # viewport crosses the antimeridian
+
+        cells = self.levels[zoom]
+        area = sum(c1 - c0 + 1 for c0, c1 in columns) * (cy1 - cy0 + 1)
+        if area < len(cells):
+            # Viewport smaller than the fleet's footprint: look up its cells
+            found = (
+                cells.get((cx, cy))
+                for c0, c1 in columns for cx in range(c0, c1 + 1) for cy in range(cy0, cy1 + 1)
+            )
+            found = [cell for cell in found if cell is not None]
+        else:
+            found = [
+                cell for (cx, cy), cell in cells.items()
+                if cy0 <= cy <= cy1 and any(c0 <= cx <= c1 for c0, c1 in columns)
+            ]
+
+        clusters = []
+        for cell in found:
+            item = {
+                "latitude": cell.sum_lat / cell.count,
+                "longitude": cell.sum_lon / cell.count,
+                "count": cell.count,
+            }
+            if cell.count == 1:
+                item["device_id"] = next(iter(cell.members))
+            clusters.append(item)
+        return clusters
+
+
+class ClusterIndex:
+    """Live-state cluster grids, one per tenant plus a global one"""
+    def __init__(self, max_zoom: int = None, radius: int = None):
+        self.max_zoom = max_zoom if max_zoom is not None else settings.CLUSTER_MAX_ZOOM
+        self.radius = radius or settings.CLUSTER_RADIUS_PX
+        self.grids = {}
+        self.tenant_of = {}
+
+    def grid(self, key):
+        grid = self.grids.get(key)
+        if grid is None:
+            grid = self.grids[key] = ClusterGrid(self.max_zoom, self.radius)
+        return grid
+
+    def update(self, tenant_id, device_id, latitude, longitude):
+        if latitude is None or longitude is None:
+            return
+        previous = self.tenant_of.get(device_id)
+        if previous is not None and previous != tenant_id:
+            self.grid(previous).remove(device_id)
+        self.tenant_of[device_id] = tenant_id
+        self.grid(tenant_id).update(device_id, latitude, longitude)
+        self.grid(GLOBAL).update(device_id, latitude, longitude)
+
+    def remove(self, device_id):
+        tenant_id = self.tenant_of.pop(device_id, None)
+        if tenant_id is not None:
+            self.grid(tenant_id).remove(device_id)
+        self.grid(GLOBAL).remove(device_id)
+
+    def query(self, tenant_id, west, south, east, north, zoom):
+        """tenant_id=None returns clusters over every tenant"""
+        key = GLOBAL if tenant_id is None else tenant_id
+        if key not in self.grids:
+            return []
+        return self.grids[key].query(west, south, east, north, zoom)
+
+    async def warm(self):
+        """Seed the grids from the latest stored position of each device"""
+        async with AsyncSessionLocal() as db:
+            subq = (
+                select(Position.device_id, func.max(Position.timestamp).label("max_ts"))
+                .group_by(Position.device_id)
+                .subquery()
+            )
+            query = select(Device.tenant_id, Position.device_id, Position.latitude, Position.longitude).join(
+                Device, Device.id == Position.device_id
+            ).join(
+                subq,
+                (Position.device_id == subq.c.device_id) & (Position.timestamp == subq.c.max_ts)
+            )
+            result = await db.execute(query)
+            rows = result.all()
+        for tenant_id, device_id, latitude, longitude in rows:
+            self.update(tenant_id, device_id, latitude, longitude)
+        print(f"Cluster index warmed with {len(rows)} devices")
+
+
+cluster_index = ClusterIndex()
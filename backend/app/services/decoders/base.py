@@ -1,5 +1,7 @@
 from typing import Dict, Any
 
 class BaseDecoder:
+    name = "unknown"  # protocol label in metrics
+
     async def decode(self, raw: bytes) -> Dict[str, Any]:
         raise NotImplementedError("Decoder must implement decode")
@@ -3,9 +3,9 @@ from typing import Dict, Any
 import re
 
 class GPS103Decoder(BaseDecoder):
+    name = "gps103"
+
     async def decode(self, raw: bytes) -> Dict[str, Any]:
-        with open("/app/debug.log", "a") as f:
-            f.write(f"DEBUG: GPS103Decoder decoding: {raw}\n")
         text = raw.decode(errors="ignore").strip()
         # Example: "+RESP:GTFRI,imei:359710048216253,tracker,120101,120002,A,12.3456,N,34.5678,E,0.0,0.0"
         # This parser is illustrative. Real decoders must be adjusted per device protocol.
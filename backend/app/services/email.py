@@ -1,79 +1,191 @@
 from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import EmailOutbox
+from sqlalchemy import select, update, func, event
+from datetime import datetime, timedelta, timezone
+import asyncio
 import logging
-# import socket (unused)
-# import ssl (unused)
-# import smtplib (unused)
-import logging
-import socket
-import ssl
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
-def send_email(to_email: str, subject: str, html_content: str):
+# Resend accepts up to 100 messages per batch call
+RESEND_BATCH_LIMIT = 100
+# A row still 'sending' this long after its claim belongs to a process that died mid-send
+STALE_SENDING = timedelta(minutes=5)
+
+
+def sender_address():
+    # If "From" is just an email, Resend requires a verified domain.
+    # Unverified domains cannot send FROM gmail.com/etc, so fall back to Resend's test sender.
+    from_email = settings.SMTP_EMAIL
+    if not from_email or "gmail.com" in from_email or "yahoo.com" in from_email:
+        from_email = "onboarding@resend.dev"
+    return "Inferth Mapping <" + from_email + ">"  # Friendly name
+
+
+def queue_email(db, to_email: str, subject: str, html_content: str):
+    """
+    Add an email to the outbox inside the caller's transaction.
+    The worker is woken once the caller commits; nothing is sent on the request path.
+    """
+    db.add(EmailOutbox(to_email=to_email, subject=subject, html_content=html_content))
+    event.listen(db.sync_session, "after_commit", lambda session: email_worker.wake(), once=True)
+
+
+async def enqueue_email(to_email: str, subject: str, html_content: str):
+    """Outbox insert for callers without a request session (e.g. alert notifications)"""
+    async with AsyncSessionLocal() as db:
+        queue_email(db, to_email, subject, html_content)
+        await db.commit()
+
+
+class EmailWorker:
     """
-    Sends an email using the configured SMTP server.
+    Delivers the outbox in batches with bounded concurrency.
+    Failed sends are retried with exponential backoff up to EMAIL_MAX_ATTEMPTS.
     """
-    if settings.RESEND_API_KEY:
-        # Use Resend API (HTTP over Port 443 - Firewall Friendly)
+    def __init__(self):
+        self._wakeup = None
+        self._task = None
+        self._client = None
+        self._slots = None
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        if self._task is not None:
+            return
         import httpx
-        
-        try:
-            logger.info(f"Sending email via Resend API to {to_email}...")
-            
-            # If "From" is just an email, Resend requires a verified domain.
-            # Unverified domains cannot send FROM gmail.com/etc.
-            # We force 'onboarding@resend.dev' if we detect a specific API key or just for safety during testing phase.
-            # Only use settings.SMTP_EMAIL if it's NOT a gmail/yahoo/hotmail address, or if we trust the user knows what they are doing.
-            
-            from_email = settings.SMTP_EMAIL
-            if not from_email or "gmail.com" in from_email or "yahoo.com" in from_email:
-                from_email = "onboarding@resend.dev"
-                logger.info(f"Using test sender {from_email} because configured email is generic provider.")
-            
-            url = "https://api.resend.com/emails"
-            headers = {
-                "Authorization": f"Bearer {settings.RESEND_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            payload = {
-                "from": "Inferth Mapping <" + from_email + ">", # Friendly name
-                "to": [to_email],
-                "subject": subject,
-                "html": html_content
-            }
-            
-            # Use sync call since this function is currently sync in auth.py
-            # But httpx is async by default, so we use httpx.post
-            response = httpx.post(url, json=payload, headers=headers, timeout=10.0)
-            
-            if response.status_code == 200:
-                logger.info(f"Resend API Success: {response.json()}")
-                return True
-            else:
-                logger.error(f"Resend API Failed: {response.status_code} - {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Resend API Exception: {e}")
-            return False
-
-    # Fallback to SMTP if RESEND_API_KEY is not set (e.g. local dev)
-    if not settings.SMTP_HOST or not settings.SMTP_EMAIL or not settings.SMTP_PASSWORD:
-        logger.warning("SMTP/Resend not configured. Email not sent.")
-        print(f"--- MOCK EMAIL TO {to_email} ---\nSubject: {subject}\n{html_content}\n-----------------------------")
-        return False
-
-    # ... Existing SMTP Logic (kept as fallback for local dev) ...
-    # Debug: Check what config we actually loaded
-    pass_len = len(settings.SMTP_PASSWORD) if settings.SMTP_PASSWORD else 0
-    # ... rest of SMTP logic ...
-    
-    # We will just return False for now if Resend is missing to force decision, 
-    # OR we can keep the SMTP logic below. 
-    # Let's keep the SMTP logic but wrapped in an "else".
-    
-    # Actually, simpler to just replace the whole function with a clean Resend implementation
-    # since user explicitly chose to switch.
-    
-    return False 
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(settings.EMAIL_MAX_CONCURRENCY)
+        self._client = httpx.AsyncClient(base_url=settings.EMAIL_API_URL, timeout=settings.EMAIL_SEND_TIMEOUT)
+        await self._recover_stale()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def run(self):
+        last_recovery = time.monotonic()
+        while True:
+            try:
+                # Another process (web or worker replica) may crash while this one keeps running
+                if time.monotonic() - last_recovery >= STALE_SENDING.total_seconds():
+                    last_recovery = time.monotonic()
+                    await self._recover_stale()
+                while await self.drain_once():
+                    pass
+            except Exception as e:
+                logger.error(f"Email worker error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.EMAIL_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _recover_stale(self):
+        """Rows left in 'sending' by a crashed process go back to the queue"""
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.status == "sending",
+                       EmailOutbox.next_attempt_at < func.now() - STALE_SENDING)
+                .values(status="pending")
+            )
+            await db.commit()
+
+    async def _claim(self):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(EmailOutbox)
+                .where(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= func.now())
+                .order_by(EmailOutbox.id)
+                .limit(settings.EMAIL_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            rows = result.scalars().all()
+            for row in rows:
+                row.status = "sending"
+                row.next_attempt_at = datetime.now(timezone.utc)
+            await db.commit()
+            return rows
+
+    async def drain_once(self):
+        """Claim and deliver one batch. Returns the number of rows handled."""
+        rows = await self._claim()
+        if not rows:
+            return 0
+        chunks = [rows[i:i + RESEND_BATCH_LIMIT] for i in range(0, len(rows), RESEND_BATCH_LIMIT)]
+        results = await asyncio.gather(*(self._send_chunk(chunk) for chunk in chunks))
+        await self._record(rows, [r for chunk_result in results for r in chunk_result])
+        return len(rows)
+
+    async def _send_chunk(self, rows):
+        """Returns one (status, error) per row"""
+        if not settings.RESEND_API_KEY:
+            for row in rows:
+                logger.warning("Resend not configured. Email not sent.")
+                print(f"--- MOCK EMAIL TO {row.to_email} ---\nSubject: {row.subject}\n{row.html_content}\n-----------------------------")
+            return [("skipped", "Email delivery not configured")] * len(rows)
+
+        payload = [
+            {"from": sender_address(), "to": [row.to_email], "subject": row.subject, "html": row.html_content}
+            for row in rows
+        ]
+        headers = {"Authorization": f"Bearer {settings.RESEND_API_KEY}"}
+        async with self._slots:
+            try:
+                response = await self._client.post("/emails/batch", json=payload, headers=headers)
+            except Exception as e:
+                logger.error(f"Resend API Exception: {e}")
+                return [("retry", str(e))] * len(rows)
+
+        if response.status_code == 200:
+            logger.info(f"Resend API Success: {len(rows)} emails")
+            return [("sent", None)] * len(rows)
+        error = f"{response.status_code} - {response.text[:200]}"
+        logger.error(f"Resend API Failed: {error}")
+        # 4xx (other than rate limiting) will not succeed on retry
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            if len(rows) > 1 and response.status_code not in (401, 403):
+                # The batch is rejected as a whole: split it until only the bad rows fail
+                middle = len(rows) // 2
+                halves = await asyncio.gather(self._send_chunk(rows[:middle]), self._send_chunk(rows[middle:]))
+                return halves[0] + halves[1]
+            return [("failed", error)] * len(rows)
+        return [("retry", error)] * len(rows)
+
+    async def _record(self, rows, outcomes):
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            for row, (status, error) in zip(rows, outcomes):
+                values = {"attempts": row.attempts + 1, "last_error": error}
+                if status == "retry":
+                    if row.attempts + 1 >= settings.EMAIL_MAX_ATTEMPTS:
+                        values["status"] = "failed"
+                    else:
+                        delay = settings.EMAIL_RETRY_BASE_SECONDS * (2 ** row.attempts)
+                        values["status"] = "pending"
+                        values["next_attempt_at"] = now + timedelta(seconds=delay * random.uniform(1.0, 1.25))
+                else:
+                    values["status"] = status
+                    if status == "sent":
+                        values["sent_at"] = now
+                await db.execute(update(EmailOutbox).where(EmailOutbox.id == row.id).values(**values))
+            await db.commit()
+
 
+email_worker = EmailWorker()
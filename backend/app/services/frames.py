@@ -0,0 +1,147 @@
+"""
+Raw tracker frames, kept out of the positions table.
+
+Each tenant picks what happens to the original frame of a fix
+(tenants.raw_frames, RAW_FRAME_STORAGE when unset):
+
+    compressed   bytea in position_frames (zstd, zlib without the zstandard module),
+                 deleted after the tenant's retention window
+    inline       legacy: positions.raw JSON on the row itself
+    off          not stored
+
+position_frames is keyed by position_id and carries tenant_id and
+received_at, so the retention sweep is one indexed delete per tenant and
+never touches positions. Frames are compressed one at a time; when that
+does not make a frame smaller it is stored as is (codec "none").
+"""
+import asyncio
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, or_, select, true
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import PositionFrame, Tenant
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MODES = ("compressed", "inline", "off")
+SWEEP_BATCH = 10000
+
+_compressor = zstandard.ZstdCompressor(level=3) if zstandard is not None else None
+_decompressor = zstandard.ZstdDecompressor() if zstandard is not None else None
+
+
+def compress(frame: bytes):
+    """(codec, payload) for one frame"""
+    if _compressor is not None:
+        codec, payload = "zstd", _compressor.compress(frame)
+    else:
+        codec, payload = "zlib", zlib.compress(frame, 6)
+    if len(payload) >= len(frame):
+        return "none", frame
+    return codec, payload
+
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    if codec == "none":
+        return payload
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    if codec == "zstd":
+        if _decompressor is None:
+            raise RuntimeError("This frame is zstd-compressed; install zstandard to read it")
+        return _decompressor.decompress(payload)
+    raise ValueError(f"Unknown frame codec {codec!r}")
+
+
+def frame_row(position_id: int, tenant_id, frame: bytes, received_at: datetime):
+    codec, payload = compress(frame)
+    return {"position_id": position_id, "tenant_id": tenant_id, "received_at": received_at,
+            "codec": codec, "size": len(frame), "payload": payload}
+
+
+class FramePolicy:
+    """tenant_id -> storage mode, cached like the ingest device cache"""
+    def __init__(self, ttl: int = None):
+        self.ttl = ttl if ttl is not None else settings.INGEST_DEVICE_CACHE_TTL
+        self._modes = {}  # tenant_id -> (mode, cached at)
+
+    async def modes(self, db, tenant_ids):
+        now = time.monotonic()
+        found = {}
+        for tenant_id in tenant_ids:
+            cached = self._modes.get(tenant_id)
+            if cached and now - cached[1] < self.ttl:
+                found[tenant_id] = cached[0]
+        missing = {t for t in tenant_ids if t not in found and t is not None}
+        if missing:
+            result = await db.execute(select(Tenant.id, Tenant.raw_frames).where(Tenant.id.in_(missing)))
+            for tenant_id, mode in result.all():
+                found[tenant_id] = mode if mode in MODES else settings.RAW_FRAME_STORAGE
+            for tenant_id in missing:
+                found.setdefault(tenant_id, settings.RAW_FRAME_STORAGE)
+                self._modes[tenant_id] = (found[tenant_id], now)
+        if None in tenant_ids:
+            found[None] = settings.RAW_FRAME_STORAGE  # devices not assigned to a tenant yet
+        return found
+
+    async def mode(self, db, tenant_id):
+        return (await self.modes(db, {tenant_id}))[tenant_id]
+
+    def invalidate(self, tenant_id=None):
+        if tenant_id is None:
+            self._modes.clear()
+        else:
+            self._modes.pop(tenant_id, None)
+
+
+frame_policy = FramePolicy()
+
+
+async def sweep_expired(now: datetime = None):
+    """Delete frames past their tenant's retention window, in short batches. Returns rows deleted."""
+    now = now or datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(Tenant.id, Tenant.raw_frame_retention_days)
+                                  .where(Tenant.raw_frame_retention_days.isnot(None)))
+        overrides = dict(result.all())
+
+    windows = [(PositionFrame.tenant_id == tenant_id, days) for tenant_id, days in overrides.items()]
+    # Everyone else, including frames of unassigned devices, gets the default
+    default_scope = true()
+    if overrides:
+        default_scope = or_(PositionFrame.tenant_id.notin_(list(overrides)), PositionFrame.tenant_id.is_(None))
+    windows.append((default_scope, settings.RAW_FRAME_RETENTION_DAYS))
+    deleted = 0
+    for scope, days in windows:
+        if not days or days <= 0:
+            continue  # kept forever
+        expired = select(PositionFrame.position_id).where(
+            scope, PositionFrame.received_at < now - timedelta(days=days)
+        ).limit(SWEEP_BATCH)
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    delete(PositionFrame).where(PositionFrame.position_id.in_(expired))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+            deleted += result.rowcount
+            if result.rowcount < SWEEP_BATCH:
+                break
+    return deleted
+
+
+async def run_frame_sweeper():
+    while True:
+        try:
+            count = await sweep_expired()
+            if count:
+                print(f"Frame retention removed {count} raw frames")
+        except Exception as e:
+            print(f"Frame retention error: {e}")
+        await asyncio.sleep(settings.RAW_FRAME_SWEEP_INTERVAL)
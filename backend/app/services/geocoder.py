@@ -0,0 +1,130 @@
+import math
+import os
+from collections import OrderedDict
+from app.config import settings
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def to_unit_vector(latitude: float, longitude: float):
+    """Points on the unit sphere: straight-line (chord) distance orders the same as great-circle distance"""
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord: float):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class KDTree:
+    """Static 3-d tree over unit vectors, nearest-neighbour lookups only"""
+    def __init__(self, points):
+        self.points = points
+        # node: (point index, axis, left node, right node)
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indices, depth):
+        if not indices:
+            return None
+        axis = depth % 3
+        indices.sort(key=lambda i: self.points[i][axis])
+        mid = len(indices) // 2
+        return (
+            indices[mid],
+            axis,
+            self._build(indices[:mid], depth + 1),
+            self._build(indices[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, target):
+        best_index, best_dist = None, float("inf")
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            index, axis, left, right = node
+            point = self.points[index]
+            dist = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if dist < best_dist:
+                best_index, best_dist = index, dist
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Only cross the splitting plane if it is closer than the best match so far
+            if diff * diff < best_dist:
+                stack.append(far)
+            stack.append(near)
+        return best_index, math.sqrt(best_dist)
+
+
+class ReverseGeocoder:
+    """
+    Offline reverse geocoding from a GeoNames extract (e.g. cities1000.txt).
+    Lookups never touch the network; results are cached by rounded coordinate.
+    """
+    def __init__(self, path: str = None, cache_size: int = None, precision: int = None, max_km: float = None):
+        self.path = path if path is not None else settings.GAZETTEER_PATH
+        self.cache_size = cache_size or settings.GEOCODER_CACHE_SIZE
+        self.precision = precision if precision is not None else settings.GEOCODER_PRECISION
+        self.max_km = max_km or settings.GEOCODER_MAX_KM
+        # (tree, places, cache), swapped as one: load() runs in a thread while lookups continue
+        self.index = (None, [], OrderedDict())
+
+    @property
+    def ready(self):
+        return self.index[0] is not None
+
+    def load(self):
+        """Parse the gazetteer and build the index. Blocking - run it in a thread."""
+        if not self.path or not os.path.exists(self.path):
+            print(f"Gazetteer not found ({self.path}); reverse geocoding disabled")
+            return
+        places, vectors = [], []
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                cols = line.rstrip("\n").split("\t")
+                # GeoNames columns: 1 name, 4 latitude, 5 longitude, 8 country code, 10 admin1 code
+                if len(cols) < 11:
+                    continue
+                try:
+                    lat, lon = float(cols[4]), float(cols[5])
+                except ValueError:
+                    continue
+                places.append((cols[1], cols[10], cols[8]))
+                vectors.append(to_unit_vector(lat, lon))
+        self.index = (KDTree(vectors), places, OrderedDict())
+        print(f"Gazetteer loaded: {len(places)} places from {self.path}")
+
+    def reverse(self, latitude: float, longitude: float):
+        """Nearest place as {"name", "admin1", "country", "distance_km"} or None"""
+        tree, places, cache = self.index
+        if tree is None or latitude is None or longitude is None:
+            return None
+        key = (round(latitude, self.precision), round(longitude, self.precision))
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+        index, chord = tree.nearest(to_unit_vector(*key))
+        result = None
+        if index is not None:
+            distance_km = chord_to_km(chord)
+            if distance_km <= self.max_km:
+                name, admin1, country = places[index]
+                result = {"name": name, "admin1": admin1, "country": country, "distance_km": round(distance_km, 1)}
+
+        cache[key] = result
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return result
+
+    def label(self, latitude: float, longitude: float):
+        """Short display label, e.g. 'Harare, ZW' or 'Near Ruwa, ZW'"""
+        place = self.reverse(latitude, longitude)
+        if not place:
+            return None
+        prefix = "Near " if place["distance_km"] >= 2 else ""
+        return f"{prefix}{place['name']}, {place['country']}"
+
+
+geocoder = ReverseGeocoder()
@@ -0,0 +1,229 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from sqlalchemy import select, insert, null
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.config import settings
+from app.metrics import FRAMES, INGEST_FLUSH_SECONDS, INGEST_BATCH_SIZE, INGEST_BACKLOG
+from app.tracing import tracer
+from app.db import AsyncSessionLocal
+from app.models import Device, Position, PositionFrame
+from app.services.tiles import invalidate_late_fixes
+from app.services.frames import frame_policy, frame_row
+from app.services.pipeline import DeviceRef
+from app.utils.geo import point_geography
+
+_STOP = object()
+
+
+class BatchWriter:
+    """
+    Turns decoded tracker frames into positions rows, one multi-row INSERT per batch.
+    on_saved(events) runs after each commit: in the API it updates live state
+    directly, in a standalone ingest worker it publishes to the position bus.
+    """
+    def __init__(self, on_saved=None, batch_size: int = None, flush_interval: float = None,
+                 max_buffer: int = None):
+        self.on_saved = on_saved
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.INGEST_FLUSH_INTERVAL
+        self.max_buffer = max_buffer or settings.INGEST_BUFFER_SIZE
+        self.devices = {}  # imei -> (DeviceRef, cached at)
+        self.stats = {"received": 0, "written": 0, "batches": 0, "failed": 0, "devices_created": 0}
+        self._queue = None
+        self._task = None
+
+    async def submit(self, decoded: dict, protocol: str = "unknown", trace=None):
+        """
+        Queue one decoded fix. Waits when the buffer is full; TCPTrackerProtocol
+        pauses reading its socket while too many of its frames wait here.
+        trace: the frame's span; its trace continues through the flush and the publish.
+        """
+        fix = {
+            "imei": decoded["imei"],
+            "latitude": decoded["latitude"],
+            "longitude": decoded["longitude"],
+            "speed": decoded.get("speed"),  # None: the protocol does not report it
+            "course": decoded.get("course"),
+            # Stamped on receipt, not at flush time
+            "timestamp": decoded.get("timestamp") or datetime.utcnow(),
+            # Stored per the tenant's raw_frames mode (services/frames.py)
+            "frame": decoded.get("raw_text"),
+            "ignition": decoded.get("ignition"),
+            "protocol": protocol,
+            "trace": trace.context if trace is not None and trace.is_recording else None,
+        }
+        self.stats["received"] += 1
+        await self._queue.put(fix)
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_buffer)
+            self._task = asyncio.create_task(self.run())
+            INGEST_BACKLOG.set_function(lambda: self.backlog)
+
+    async def stop(self):
+        """Write everything still buffered, then stop"""
+        if self._task is None:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def run(self):
+        stopping = False
+        while not stopping:
+            fix = await self._queue.get()
+            if fix is _STOP:
+                break
+            batch = [fix]
+            # Collect whatever else arrives within the flush window, up to one batch
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    fix = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if fix is _STOP:
+                    stopping = True
+                    break
+                batch.append(fix)
+            await self.flush(batch)
+
+    async def flush(self, batch, attempts: int = 3):
+        # One span per traced fix: the batch's INSERT + commit, inside each frame's own trace
+        spans = [tracer.start_span("ingest.flush", parent=fix["trace"], kind="client",
+                                   attributes={"batch.size": len(batch)})
+                 for fix in batch if fix["trace"] is not None]
+        error = None
+        for attempt in range(1, attempts + 1):
+            try:
+                with INGEST_FLUSH_SECONDS.time():
+                    events = await self._write(batch, [span.traceparent() for span in spans])
+                break
+            except Exception as e:
+                error = e
+                print(f"Ingest flush failed (attempt {attempt}/{attempts}, {len(batch)} fixes): {e}")
+                if attempt < attempts:
+                    await asyncio.sleep(attempt)
+        else:
+            self.stats["failed"] += len(batch)
+            for span in spans:
+                span.set_attribute("attempts", attempts)
+                span.record_exception(error)
+                span.end()
+            return
+        for span in spans:
+            span.set_attribute("attempts", attempt)
+            span.end()
+
+        self.stats["written"] += len(events)
+        self.stats["batches"] += 1
+        INGEST_BATCH_SIZE.observe(len(batch))
+        persisted = {}
+        for fix in batch:
+            persisted[fix["protocol"]] = persisted.get(fix["protocol"], 0) + 1
+        for protocol, count in persisted.items():
+            FRAMES.labels(protocol=protocol, stage="persisted").inc(count)
+        if self.on_saved and events:
+            try:
+                result = self.on_saved(events)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                print(f"Ingest publish error: {e}")
+
+    async def _write(self, batch, traceparents=()):
+        async with AsyncSessionLocal() as db:
+            devices = await self._resolve_devices(db, {fix["imei"] for fix in batch})
+            modes = await frame_policy.modes(db, {device.tenant_id for device in devices.values()})
+            rows = [
+                {
+                    "device_id": devices[fix["imei"]].id,
+                    "latitude": fix["latitude"],
+                    "longitude": fix["longitude"],
+                    "speed": fix["speed"],
+                    "course": fix["course"],
+                    "timestamp": fix["timestamp"],
+                    # null(): a plain None would be stored as the JSON value null
+                    "raw": {"text": fix["frame"]} if modes[devices[fix["imei"]].tenant_id] == "inline" else null(),
+                    "geom": point_geography(fix["latitude"], fix["longitude"]),
+                }
+                for fix in batch
+            ]
+            result = await db.execute(insert(Position).values(rows).returning(Position.id))
+            ids = result.scalars().all()
+            stored_at = datetime.now(timezone.utc)
+            frames = [
+                frame_row(position_id, devices[fix["imei"]].tenant_id, fix["frame"].encode(), stored_at)
+                for position_id, fix in zip(ids, batch)
+                if fix["frame"] and modes[devices[fix["imei"]].tenant_id] == "compressed"
+            ]
+            if frames:
+                await db.execute(insert(PositionFrame).values(frames))
+            await db.commit()
+        # Late fixes (e.g. a tracker's offline buffer) change closed days' cached tiles
+        await invalidate_late_fixes(fix["timestamp"] for fix in batch)
+
+        events = []
+        traceparents = iter(traceparents)
+        for position_id, fix in zip(ids, batch):
+            device = devices[fix["imei"]]
+            event = {
+                "type": "position",
+                "id": position_id,
+                "device_id": device.id,
+                "tenant_id": device.tenant_id,
+                "imei": device.imei,
+                "latitude": fix["latitude"],
+                "longitude": fix["longitude"],
+                "speed": fix["speed"],
+                "course": fix["course"],
+                "timestamp": fix["timestamp"].isoformat(),
+                "ignition": fix["ignition"],
+            }
+            if fix["trace"] is not None:
+                event["traceparent"] = next(traceparents, None)
+            events.append(event)
+        return events
+
+    async def _resolve_devices(self, db, imeis):
+        """imei -> DeviceRef, from the cache, the devices table, or a new auto-created row"""
+        now = time.monotonic()
+        found = {}
+        for imei in imeis:
+            cached = self.devices.get(imei)
+            # Short TTL so tenant reassignments reach live state without a restart
+            if cached and now - cached[1] < settings.INGEST_DEVICE_CACHE_TTL:
+                found[imei] = cached[0]
+
+        missing = imeis - found.keys()
+        if missing:
+            query = select(Device.id, Device.tenant_id, Device.imei).where(Device.imei.in_(missing))
+            for row in (await db.execute(query)).all():
+                found[row.imei] = DeviceRef(row.id, row.tenant_id, row.imei)
+
+            unknown = missing - found.keys()
+            if unknown:
+                # Other workers may register the same tracker concurrently
+                await db.execute(
+                    pg_insert(Device)
+                    .values([{"imei": imei, "name": f"Tracker {imei}", "device_metadata": {}} for imei in unknown])
+                    .on_conflict_do_nothing(index_elements=["imei"])
+                )
+                self.stats["devices_created"] += len(unknown)
+                print(f"Registered new trackers: {', '.join(sorted(unknown))}")
+                query = select(Device.id, Device.tenant_id, Device.imei).where(Device.imei.in_(unknown))
+                for row in (await db.execute(query)).all():
+                    found[row.imei] = DeviceRef(row.id, row.tenant_id, row.imei)
+
+            for imei in missing:
+                self.devices[imei] = (found[imei], now)
+        return found
+
+    @property
+    def backlog(self):
+        return self._queue.qsize() if self._queue is not None else 0
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from collections import namedtuple
+from app.config import settings
+from app.realtime import manager
+from app.services.alerts import alert_engine
+from app.services.clustering import cluster_index
+from app.tracing import current_span
+
+# What the live-state consumers need to know about a device
+DeviceRef = namedtuple("DeviceRef", "id tenant_id imei")
+
+
+def position_event(device, position, decoded: dict = None):
+    """Serialisable description of a stored fix (what the ingest bus carries)"""
+    decoded = decoded or {}
+    event = {
+        "type": "position",
+        "id": position.id,
+        "device_id": device.id,
+        "tenant_id": device.tenant_id,
+        "imei": device.imei,
+        "latitude": position.latitude,
+        "longitude": position.longitude,
+        "speed": position.speed,
+        "course": position.course,
+        "timestamp": position.timestamp.isoformat() if position.timestamp else None,
+        "ignition": decoded.get("ignition"),
+    }
+    span = current_span.get()
+    if span is not None and span.is_recording:
+        event["traceparent"] = span.traceparent()
+    return event
+
+
+def apply_position_events(events: list):
+    """Feed stored fixes to the in-memory live-state consumers and the WebSocket clients"""
+    for event in events:
+        device = DeviceRef(event["device_id"], event["tenant_id"], event["imei"])
+        cluster_index.update(device.tenant_id, device.id, event["latitude"], event["longitude"])
+        alert_engine.observe(
+            device,
+            speed=event.get("speed"),
+            ignition=event.get("ignition"),
+            latitude=event["latitude"],
+            longitude=event["longitude"]
+        )
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    for event in events:
+        loop.create_task(manager.broadcast(json.dumps(event, default=str), event["tenant_id"], event.get("traceparent")))
+
+
+def apply_position_event(event: dict):
+    apply_position_events([event])
+
+
+def apply_bus_event(event: dict):
+    """Handler for the position bus: stored fixes, alerts raised by the alert leader, rule and user changes"""
+    kind = event.get("type")
+    if kind == "alert":
+        try:
+            asyncio.get_running_loop().create_task(
+                manager.broadcast(json.dumps(event, default=str), event.get("tenant_id"))
+            )
+        except RuntimeError:
+            pass
+    elif kind == "rules":
+        alert_engine.reload_rules()
+    elif kind == "principal":
+        from app.auth_middleware import drop_principal
+        drop_principal(event.get("user_id"))
+    else:
+        apply_position_event(event)
+
+
+def position_saved(device, position, decoded: dict = None):
+    """
+    Announce a fix stored by this API process. With external ingest the API
+    follows the bus, so the fix goes through it like every other one.
+    """
+    event = position_event(device, position, decoded)
+    if settings.INGEST_MODE == "external":
+        from app.services.bus import position_bus
+        try:
+            asyncio.get_running_loop().create_task(position_bus.publish([event]))
+        except RuntimeError:
+            pass
+    else:
+        apply_position_event(event)
@@ -0,0 +1,99 @@
+"""
+Column-only reads of position history.
+
+select(Position) hydrates a full ORM instance per fix: every column
+including the raw JSON payload, the instance state and an identity-map
+entry. The history readers (routes and playback, trips, the track
+processor) only use timestamp, latitude, longitude and speed, so they
+fetch those four columns as TrackPoint named tuples, roughly a tenth of
+the memory per point.
+
+TrackPoint keeps the attribute names of Position and the tuple shape
+clean_track() works on. With numpy installed, to_array() packs a track
+into one structured array and path_distance_km() is vectorised.
+
+device_history() also reads the Parquet cold archive (app/archive.py)
+when the requested range reaches into archived months, and merges it
+with the fixes still in PostgreSQL.
+"""
+import asyncio
+from collections import namedtuple
+from app import archive
+from app.models import Position
+from app.utils.geo import haversine_km
+from sqlalchemy import select
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TrackPoint = namedtuple("TrackPoint", "timestamp latitude longitude speed")
+
+# timestamp as epoch seconds: numpy has no timezone-aware datetime64
+TRACK_DTYPE = [("timestamp", "f8"), ("latitude", "f8"), ("longitude", "f8"), ("speed", "f4")]
+
+
+def track_query(device_id: int, *criteria):
+    """Time-ordered fixes of one device with a position; criteria are extra where() clauses"""
+    return (
+        select(Position.timestamp, Position.latitude, Position.longitude, Position.speed)
+        .where(Position.device_id == device_id, Position.latitude.isnot(None), Position.longitude.isnot(None),
+               *criteria)
+        .order_by(Position.timestamp.asc())
+    )
+
+
+async def track_points(db, device_id: int, *criteria):
+    """[TrackPoint] for one device, speed None read as 0"""
+    result = await db.execute(track_query(device_id, *criteria))
+    return [TrackPoint(ts, lat, lon, speed or 0) for ts, lat, lon, speed in result]
+
+
+async def device_history(db, device, start=None, end=None):
+    """[TrackPoint] of one device in [start, end], archived and hot fixes together"""
+    criteria = []
+    if start is not None:
+        criteria.append(Position.timestamp >= start)
+    if end is not None:
+        criteria.append(Position.timestamp <= end)
+    points = await track_points(db, device.id, *criteria)
+    if device.tenant_id is None:
+        return points
+    parts = await archive.archived_parts(db, device.tenant_id, start, end)
+    if not parts:
+        return points
+    table = await asyncio.to_thread(
+        archive.read_track, parts, device.id, start, end, ("timestamp", "latitude", "longitude", "speed")
+    )
+    cold = [
+        TrackPoint(ts, lat, lon, speed or 0)
+        for ts, lat, lon, speed in zip(*(table.column(i).to_pylist() for i in range(4)))
+        if lat is not None and lon is not None
+    ]
+    merged = cold + points
+    # Late fixes archived in a later part, or still hot, can interleave
+    if any(a.timestamp > b.timestamp for a, b in zip(merged, merged[1:])):
+        merged.sort(key=lambda p: p.timestamp)
+    return merged
+
+
+def to_array(points):
+    """TrackPoints as a numpy structured array (TRACK_DTYPE)"""
+    if numpy is None:
+        raise RuntimeError("numpy is not installed")
+    return numpy.array([(p[0].timestamp(), p[1], p[2], p[3]) for p in points], dtype=TRACK_DTYPE)
+
+
+def path_distance_km(points):
+    """Great-circle length of a time-ordered track, unfiltered"""
+    if len(points) < 2:
+        return 0.0
+    if numpy is None:
+        return sum(haversine_km(a[1], a[2], b[1], b[2]) for a, b in zip(points, points[1:]))
+    track = points if isinstance(points, numpy.ndarray) else to_array(points)
+    lat = numpy.radians(track["latitude"])
+    lon = numpy.radians(track["longitude"])
+    a = (numpy.sin(numpy.diff(lat) / 2) ** 2
+         + numpy.cos(lat[:-1]) * numpy.cos(lat[1:]) * numpy.sin(numpy.diff(lon) / 2) ** 2)
+    return float((6371 * 2 * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))).sum())
@@ -1,92 +1,100 @@
 import asyncio
 from app.config import settings
+from app.metrics import FRAMES
+from app.tracing import tracer
 from app.services.decoders.gps103 import GPS103Decoder
-from app.routers.positions import create_position
-import json
-from datetime import datetime
-from app.db import AsyncSessionLocal
-from app.models import Position, Device
-from sqlalchemy import select
-import sys
 
 decoder = GPS103Decoder()
+RECEIVED = FRAMES.labels(protocol=decoder.name, stage="received")
+DECODED = FRAMES.labels(protocol=decoder.name, stage="decoded")
+REJECTED = FRAMES.labels(protocol=decoder.name, stage="rejected")
+
+# Frames one connection may have in flight; beyond that the socket stops being read
+# until they are queued (BatchWriter.submit waits while its buffer is full)
+MAX_PENDING_FRAMES = 8
+
+# Per-process listener counters (the ingest supervisor sums them across workers)
+stats = {"connections_open": 0, "connections_total": 0, "frames": 0, "frames_ignored": 0, "frame_errors": 0,
+         "read_pauses": 0}
+
 
 class TCPTrackerProtocol(asyncio.Protocol):
-    def __init__(self, app_state):
-        self.app_state = app_state
+    """
+    One tracker connection. Frames are decoded and handed to a BatchWriter,
+    which stores them in bulk; nothing here touches the database directly.
+    When the writer's buffer is full, frames stay pending and reading pauses,
+    so the backlog ends up in the kernel socket buffer and the tracker's TCP window.
+    """
+    def __init__(self, writer):
+        self.writer = writer
         self.transport = None
         self.peer = None
+        self.pending = 0
+        self.paused = False
 
     def connection_made(self, transport):
         self.transport = transport
         self.peer = transport.get_extra_info('peername')
-        with open("/app/debug.log", "a") as f:
-            f.write(f"DEBUG: Connection made from {self.peer}\n")
+        stats["connections_open"] += 1
+        stats["connections_total"] += 1
+
+    def connection_lost(self, exc):
+        stats["connections_open"] -= 1
 
     def data_received(self, data):
-        with open("/app/debug.log", "a") as f:
-            f.write(f"DEBUG: Data received: {data}\n")
+        stats["frames"] += 1
+        RECEIVED.inc()
+        # Root of the frame's trace; ends once the fix is queued for the writer
+        span = tracer.start_span("tcp.data_received", parent=False, kind="server",
+                                 attributes={"net.peer": str(self.peer), "bytes": len(data)})
         try:
             loop = asyncio.get_running_loop()
-            loop.create_task(self.handle(data))
-            with open("/app/debug.log", "a") as f:
-                f.write("DEBUG: Task created\n")
+            loop.create_task(self.handle(data, span))
         except Exception as e:
-            with open("/app/debug.log", "a") as f:
-                f.write(f"ERROR creating task: {e}\n")
+            print(f"TCP ingest: could not schedule frame from {self.peer}: {e}")
+            return
+        self.pending += 1
+        if self.pending >= MAX_PENDING_FRAMES and not self.paused:
+            self.paused = True
+            stats["read_pauses"] += 1
+            self.transport.pause_reading()
 
-    async def handle(self, data: bytes):
-        with open("/app/debug.log", "a") as f:
-            f.write("DEBUG: Inside handle\n")
-        try:
-            # decode using pluggable decoder
-            decoded = await decoder.decode(data)
-            with open("/app/debug.log", "a") as f:
-                f.write(f"DEBUG: Decoded data: {decoded}\n")
-            
-            # if we find coordinates and imei: create a position
-            if decoded.get("imei") and decoded.get("latitude") and decoded.get("longitude"):
-                payload = {
-                    "imei": decoded["imei"],
-                    "latitude": decoded["latitude"],
-                    "longitude": decoded["longitude"],
-                    "raw": {"text": decoded.get("raw_text")}
-                }
-                
-                async with AsyncSessionLocal() as db:
-                    try:
-                        # Find or create device
-                        result = await db.execute(select(Device).filter(Device.imei == decoded["imei"]))
-                        device = result.scalars().first()
-                        
-                        if not device:
-                            with open("/app/debug.log", "a") as f:
-                                f.write(f"DEBUG: Creating new device {decoded['imei']}\n")
-                            device = Device(imei=decoded['imei'], name=f"Tracker {decoded['imei']}")
-                            db.add(device)
-                            await db.commit()
-                            await db.refresh(device)
-                        
-                        # Create position
-                        position = Position(
-                            device_id=device.id,
-                            latitude=decoded["latitude"],
-                            longitude=decoded["longitude"],
-                            speed=0.0, # Default or extract if available
-                            timestamp=datetime.utcnow(),
-                            raw=payload["raw"]
-                        )
-                        db.add(position)
-                        await db.commit()
-                        with open("/app/debug.log", "a") as f:
-                            f.write(f"SUCCESS: Saved position for device {device.imei}\n")
-                    except Exception as e:
-                        with open("/app/debug.log", "a") as f:
-                            f.write(f"ERROR saving position: {e}\n")
-            else:
-                with open("/app/debug.log", "a") as f:
-                    f.write(f"DEBUG: Missing required fields in decoded data: {decoded}\n")
+    def _frame_done(self):
+        self.pending -= 1
+        if self.paused and self.pending <= MAX_PENDING_FRAMES // 2:
+            self.paused = False
+            if not self.transport.is_closing():
+                self.transport.resume_reading()
+
+    async def handle(self, data: bytes, span=None):
+        with span or tracer.start_span("tcp.data_received", parent=False):
+            try:
+                # decode using pluggable decoder
+                with tracer.start_span("decode", attributes={"protocol": decoder.name}):
+                    decoded = await decoder.decode(data)
+
+                # if we find coordinates and imei: queue a position
+                if decoded.get("imei") and decoded.get("latitude") and decoded.get("longitude"):
+                    DECODED.inc()
+                    await self.writer.submit(decoded, protocol=decoder.name, trace=span)
+                else:
+                    stats["frames_ignored"] += 1
+                    REJECTED.inc()
+                    print(f"TCP ingest: missing required fields from {self.peer}: {decoded.get('raw_text', '')[:80]}")
+            except Exception as e:
+                stats["frame_errors"] += 1
+                REJECTED.inc()
+                print(f"TCP ingest: error handling frame from {self.peer}: {e}")
+            finally:
+                self._frame_done()
+
+
+async def start_tcp_server(writer, host: str = None, port: int = None, **options):
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(
+        lambda: TCPTrackerProtocol(writer),
+        host=host or settings.TCP_LISTEN_ADDR,
+        port=port if port is not None else settings.TCP_PORT,
+        **options
+    )
 
-        except Exception as e:
-             with open("/app/debug.log", "a") as f:
-                f.write(f"ERROR in handle: {e}\n")
@@ -0,0 +1,75 @@
+"""
+Disk cache for vector tiles, one directory per UTC day partition.
+
+Tiles of a closed day are kept until that day receives late fixes, which
+drop its partition (invalidate_late_fixes, called by ingest). Tiles of the
+open day, or rendered shortly after it ended, live TILE_CACHE_LIVE_TTL.
+"""
+import asyncio
+import os
+import shutil
+import time
+from datetime import datetime, date, timedelta, timezone
+from pathlib import Path
+from app.config import settings
+
+
+def cache_path(tenant_id, layer, day: date, device_id, z, x, y) -> Path:
+    """Tiles are grouped by time partition (UTC day) so a whole day can be dropped at once"""
+    return (
+        Path(settings.TILE_CACHE_DIR)
+        / f"tenant_{tenant_id or 'all'}"
+        / layer
+        / day.isoformat()
+        / f"device_{device_id or 'all'}"
+        / str(z) / str(x) / f"{y}.mvt"
+    )
+
+
+def read_cached(path: Path, day: date):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    # A tile rendered well after its day ended is final (later late fixes invalidate the partition);
+    # one rendered earlier, today's included, may miss fixes still arriving, so it only lives briefly
+    day_end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc).timestamp()
+    if stat.st_mtime < day_end + settings.TILE_CACHE_GRACE and time.time() - stat.st_mtime > settings.TILE_CACHE_LIVE_TTL:
+        return None
+    return path.read_bytes()
+
+
+def write_cached(path: Path, tile: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(tile)
+    os.replace(tmp, path)
+
+
+def invalidate_partition(day: date):
+    """Drop every cached tile for one UTC day (all tenants, layers and devices)"""
+    root = Path(settings.TILE_CACHE_DIR)
+    for partition in root.glob(f"tenant_*/*/{day.isoformat()}"):
+        shutil.rmtree(partition, ignore_errors=True)
+
+
+def closed_days(timestamps):
+    """UTC days before today among the timestamps of stored fixes (naive timestamps are UTC)"""
+    today = datetime.utcnow().date()
+    days = set()
+    for ts in timestamps:
+        if ts is None:
+            continue
+        day = ts.astimezone(timezone.utc).date() if ts.tzinfo else ts.date()
+        if day < today:
+            days.add(day)
+    return days
+
+
+async def invalidate_late_fixes(timestamps):
+    """Drop the cached partitions of closed days that just received fixes; never raises"""
+    for day in closed_days(timestamps):
+        try:
+            await asyncio.to_thread(invalidate_partition, day)
+        except OSError as e:
+            print(f"Tile cache invalidation failed for {day}: {e}")
@@ -0,0 +1,254 @@
+import asyncio
+import math
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, func, cast, literal_column, Date as SqlDate
+from app.config import settings
+from app.db import AsyncSessionLocal
+from app.models import Position, DeviceTrack
+from app.services.position_store import track_points
+from app.utils.geo import haversine_km
+
+METERS_PER_DEGREE = 111320.0
+
+
+def _speed(a, b):
+    """m/s from fix a to fix b, None when b is not later than a"""
+    dt = (b[0] - a[0]).total_seconds()
+    if dt <= 0:
+        return None
+    return haversine_km(a[1], a[2], b[1], b[2]) * 1000 / dt
+
+
+def reject_outliers(points, max_speed_kmh: float = None, max_accel: float = None, reanchor_after: int = None):
+    """
+    Drop fixes that imply an impossible jump from the last accepted fix.
+    points: time-ordered (timestamp, lat, lon, speed) tuples. Returns (kept, rejected_count).
+    When reanchor_after fixes in a row are rejected but agree with each other, the
+    anchor is the odd one out (a spike, or a real jump after a GPS outage): the
+    run is accepted and becomes the new anchor, and a lone first fix is dropped.
+    """
+    max_speed_kmh = max_speed_kmh or settings.TRACK_MAX_SPEED_KMH
+    max_accel = max_accel or settings.TRACK_MAX_ACCEL
+    reanchor_after = max(reanchor_after or settings.TRACK_REANCHOR_AFTER, 2)
+    kept, run, rejected = [], [], 0
+    last_speed = None  # m/s between the last two accepted fixes, seeded by the first pair
+    for point in points:
+        if not kept:
+            kept.append(point)
+            continue
+        prev = kept[-1]
+        speed = _speed(prev, point)
+        if speed is None:
+            rejected += 1  # Duplicate or out-of-order timestamp
+            continue
+        dt = (point[0] - prev[0]).total_seconds()
+        if speed * 3.6 <= max_speed_kmh and (last_speed is None or abs(speed - last_speed) / dt <= max_accel):
+            kept.append(point)
+            last_speed = speed
+            run = []
+            continue
+        rejected += 1
+        # Rejected fixes that agree with each other build up a run
+        step = _speed(run[-1], point) if run else None
+        if run and (step is None or step * 3.6 > max_speed_kmh):
+            run = []
+        run.append(point)
+        if len(run) >= reanchor_after:
+            if len(kept) == 1:
+                kept.pop()  # The first fix disagreed with everything after it
+                rejected += 1
+            kept.extend(run)
+            rejected -= len(run)
+            last_speed = _speed(run[-2], run[-1])
+            run = []
+    return kept, rejected
+
+
+def kalman_smooth(points, measurement_noise_m: float = None, process_noise: float = None):
+    """
+    Random-walk Kalman filter per axis followed by a Rauch-Tung-Striebel backward pass.
+    Uncertainty grows with the time between fixes, so sparse fixes are trusted more.
+    """
+    if len(points) < 3:
+        return list(points)
+    measurement_noise_m = measurement_noise_m or settings.TRACK_GPS_NOISE_M
+    process_noise = process_noise or settings.TRACK_PROCESS_NOISE
+    lat0 = math.radians(points[0][1])
+    scales = (METERS_PER_DEGREE, METERS_PER_DEGREE * max(math.cos(lat0), 0.01))
+
+    smoothed_axes = []
+    for axis, scale in zip((1, 2), scales):
+        r = (measurement_noise_m / scale) ** 2
+        q = process_noise / scale ** 2  # degrees^2 per second
+        x, p = points[0][axis], r
+        xs, ps, pps = [x], [p], [p]
+        for i in range(1, len(points)):
+            dt = (points[i][0] - points[i - 1][0]).total_seconds()
+            p_pred = p + q * max(dt, 1.0)
+            k = p_pred / (p_pred + r)
+            x = x + k * (points[i][axis] - x)
+            p = (1 - k) * p_pred
+            xs.append(x)
+            ps.append(p)
+            pps.append(p_pred)
+        # Backward pass (offline data, so use the future as well)
+        for i in range(len(points) - 2, -1, -1):
+            c = ps[i] / pps[i + 1]
+            xs[i] = xs[i] + c * (xs[i + 1] - xs[i])
+        smoothed_axes.append(xs)
+
+    return [
+        (p[0], lat, lon) + tuple(p[3:])
+        for p, lat, lon in zip(points, smoothed_axes[0], smoothed_axes[1])
+    ]
+
+
+def detect_stops(points, radius_m: float = None, min_duration_s: float = None):
+    """
+    Spatial-temporal clustering: consecutive fixes that stay within radius_m of
+    their running centroid for at least min_duration_s form a stop.
+    Returns a list of (start index, end index, centroid lat, centroid lon).
+    """
+    radius_km = (radius_m or settings.TRACK_STOP_RADIUS_M) / 1000
+    min_duration_s = min_duration_s or settings.TRACK_STOP_MIN_SECONDS
+    stops = []
+    start, sum_lat, sum_lon = 0, 0.0, 0.0
+    for i, point in enumerate(points + [None]):
+        if point is not None and i > start:
+            n = i - start
+            if haversine_km(sum_lat / n, sum_lon / n, point[1], point[2]) <= radius_km:
+                sum_lat += point[1]
+                sum_lon += point[2]
+                continue
+        # Cluster [start, i) ended
+        if i > start and (points[i - 1][0] - points[start][0]).total_seconds() >= min_duration_s:
+            n = i - start
+            stops.append((start, i - 1, sum_lat / n, sum_lon / n))
+        if point is not None:
+            start, sum_lat, sum_lon = i, point[1], point[2]
+    return stops
+
+
+def clean_track(points):
+    """
+    Full cleaning pipeline for one time-ordered list of (timestamp, lat, lon, speed):
+    outlier rejection -> smoothing -> stop detection. Fixes inside a stop are
+    collapsed onto the stop centroid so parked jitter adds no distance.
+    """
+    kept, rejected = reject_outliers(points)
+    smoothed = kalman_smooth(kept)
+    stops = detect_stops(smoothed)
+
+    cleaned = list(smoothed)
+    for first, last, lat, lon in stops:
+        for i in range(first, last + 1):
+            cleaned[i] = (cleaned[i][0], lat, lon) + tuple(cleaned[i][3:])
+
+    distance_km = 0.0
+    moving_seconds = 0.0
+    in_stop = set()
+    for first, last, _, _ in stops:
+        in_stop.update(range(first + 1, last + 1))
+    for i in range(1, len(cleaned)):
+        step = haversine_km(cleaned[i - 1][1], cleaned[i - 1][2], cleaned[i][1], cleaned[i][2])
+        distance_km += step
+        if i not in in_stop and step > 0:
+            moving_seconds += (cleaned[i][0] - cleaned[i - 1][0]).total_seconds()
+
+    return {
+        "points": cleaned,
+        "stops": [
+            {
+                "start_time": cleaned[first][0].isoformat(),
+                "end_time": cleaned[last][0].isoformat(),
+                "duration_minutes": round((cleaned[last][0] - cleaned[first][0]).total_seconds() / 60, 1),
+                "location": {"lat": lat, "lng": lon},
+            }
+            for first, last, lat, lon in stops
+        ],
+        "distance_km": distance_km,
+        "moving_seconds": int(moving_seconds),
+        "rejected_points": rejected,
+    }
+
+
+def compact_points(points):
+    """Drop consecutive duplicates (collapsed stops) before storing a cleaned track"""
+    out = []
+    for p in points:
+        if out and out[-1][0] == round(p[1], 6) and out[-1][1] == round(p[2], 6):
+            continue
+        out.append([round(p[1], 6), round(p[2], 6), p[0].isoformat()])
+    return out
+
+
+async def process_device_day(db, device_id: int, day: date, last_position_id: int = None):
+    """Clean one device-day of raw fixes and upsert its DeviceTrack row"""
+    start = datetime.combine(day, datetime.min.time())
+    day_range = (Position.timestamp >= start, Position.timestamp < start + timedelta(days=1))
+    if last_position_id is None:
+        result = await db.execute(select(func.max(Position.id)).where(Position.device_id == device_id, *day_range))
+        last_position_id = result.scalar()
+    points = await track_points(db, device_id, *day_range)
+    summary = await asyncio.to_thread(clean_track, points)
+
+    existing = await db.execute(select(DeviceTrack).where(DeviceTrack.device_id == device_id, DeviceTrack.day == day))
+    track = existing.scalars().first() or DeviceTrack(device_id=device_id, day=day)
+    track.distance_km = round(summary["distance_km"], 3)
+    track.moving_seconds = summary["moving_seconds"]
+    track.stop_count = len(summary["stops"])
+    track.stops = summary["stops"]
+    track.points = compact_points(summary["points"])
+    track.raw_points = len(points)
+    track.rejected_points = summary["rejected_points"]
+    track.last_position_id = last_position_id
+    db.add(track)
+    await db.commit()
+    return track
+
+
+async def process_pending_days():
+    """
+    Process every closed (past) device-day in the lookback window that has no
+    cleaned track yet, or got fixes after it was cleaned: a fix stored with a
+    past timestamp (POST /positions, or a decoder that reports device time)
+    gets a newer id than the ones the day was cleaned with
+    """
+    today = datetime.utcnow().date()
+    since = today - timedelta(days=settings.TRACK_PROCESS_LOOKBACK_DAYS)
+    processed = 0
+    async with AsyncSessionLocal() as db:
+        # UTC day, like process_device_day's bounds (a bare cast uses the session time zone)
+        day_col = cast(func.timezone(literal_column("'UTC'"), Position.timestamp), SqlDate)
+        result = await db.execute(
+            select(Position.device_id, day_col, func.max(Position.id))
+            .where(Position.timestamp >= datetime.combine(since, datetime.min.time()),
+                   Position.timestamp < datetime.combine(today, datetime.min.time()))
+            .group_by(Position.device_id, day_col)
+        )
+        candidates = result.all()
+        done = await db.execute(
+            select(DeviceTrack.device_id, DeviceTrack.day, DeviceTrack.last_position_id).where(DeviceTrack.day >= since)
+        )
+        cleaned = {(device_id, day): last_id for device_id, day, last_id in done.all()}
+        for device_id, day, last_id in candidates:
+            if (device_id, day) in cleaned and (cleaned[device_id, day] or 0) >= last_id:
+                continue
+            try:
+                await process_device_day(db, device_id, day, last_id)
+                processed += 1
+            except Exception as e:
+                await db.rollback()
+                print(f"Track processing failed for device {device_id} on {day}: {e}")
+    return processed
+
+
+async def run_track_processor():
+    while True:
+        try:
+            count = await process_pending_days()
+            if count:
+                print(f"Track processor cleaned {count} device-days")
+        except Exception as e:
+            print(f"Track processor error: {e}")
+        await asyncio.sleep(settings.TRACK_PROCESS_INTERVAL)
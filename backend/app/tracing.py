@@ -0,0 +1,358 @@
+"""
+Lightweight tracing on OpenTelemetry's data model, stdlib only (the gateway
+and ingest workers use it without the web stack).
+
+A tracker frame becomes one trace:
+
+    gateway.data_received -> gateway.forward -> ingest.http / tcp.data_received
+      -> decode -> ingest.flush -> bus.publish -> ws.send
+
+Context crosses processes as a W3C `traceparent` (HTTP header from the
+gateway, a field on position events over the Redis bus), so spans line up
+in any OpenTelemetry backend. Exporters: "otlp" (OTLP/HTTP JSON to a
+collector), "console" (one JSON line per span) and "memory" for tests:
+
+    exporter = InMemorySpanExporter()
+    tracer.configure(exporter=exporter, sample_rate=1.0)
+    ...
+    [span.name for span in exporter.get_finished_spans()]
+
+Unsampled frames get a shared no-op span, so tracing costs next to nothing
+when TRACE_SAMPLE_RATE is 0 (the default).
+"""
+import contextvars
+import json
+import queue
+import random
+import threading
+import time
+import urllib.request
+from collections import namedtuple
+
+# Parent of spans started without an explicit one
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class SpanContext(namedtuple("SpanContext", "trace_id span_id sampled")):
+    __slots__ = ()
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value):
+    """SpanContext from a W3C traceparent header, or None when absent/invalid"""
+    if not value or not isinstance(value, str):
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return SpanContext(parts[1], parts[2], bool(flags & 1))
+
+
+class Span:
+    __slots__ = ("tracer", "name", "context", "parent_id", "kind", "start_ns", "end_ns",
+                 "attributes", "status", "links", "_token")
+
+    def __init__(self, tracer, name, context, parent_id=None, kind="internal", attributes=None,
+                 start_ns=None, links=None):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = None  # None = unset, else error description
+        self.links = links or []
+        self._token = None
+
+    is_recording = True
+
+    def traceparent(self):
+        return self.context.traceparent()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        self.status = f"{type(exc).__name__}: {exc}"
+
+    def end(self, end_ns=None):
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            self.tracer._finish(self)
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        current_span.reset(self._token)
+        self.end()
+
+    def to_otlp(self):
+        """OTLP/JSON span object"""
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": _OTLP_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.links:
+            span["links"] = [{"traceId": link.trace_id, "spanId": link.span_id} for link in self.links]
+        if self.status:
+            span["status"] = {"code": 2, "message": self.status}
+        return span
+
+    def to_dict(self):
+        return {
+            "name": self.name, "trace_id": self.context.trace_id, "span_id": self.context.span_id,
+            "parent_id": self.parent_id, "kind": self.kind, "service": self.tracer.service_name,
+            "duration_ms": round(((self.end_ns or self.start_ns) - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes, "status": self.status,
+        }
+
+
+class _NoopSpan:
+    """Stand-in for unsampled work: every method is a no-op"""
+    __slots__ = ()
+    is_recording = False
+    context = None
+
+    def traceparent(self):
+        return None
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, exc):
+        pass
+
+    def end(self, end_ns=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class _UnsampledSpan(_NoopSpan):
+    """Sampled-out span: records nothing, but keeps its children unsampled too"""
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self._token)
+
+
+# Returned while no exporter is configured
+NOOP_SPAN = _NoopSpan()
+
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3, "producer": 4, "consumer": 5}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class InMemorySpanExporter:
+    """Keeps finished spans in a list (tests, benchmarks)"""
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def get_finished_spans(self):
+        with self._lock:
+            return list(self.spans)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def shutdown(self):
+        pass
+
+
+class ConsoleSpanExporter:
+    def export(self, spans):
+        for span in spans:
+            print(f"TRACE {json.dumps(span.to_dict(), default=str)}")
+
+    def shutdown(self):
+        pass
+
+
+class OTLPHttpExporter:
+    """
+    Batches spans on a daemon thread and POSTs them as OTLP/JSON to
+    <endpoint>/v1/traces (an OpenTelemetry collector, Jaeger, Tempo...).
+    Drops spans rather than blocking the caller when the collector is slow.
+    """
+    def __init__(self, endpoint: str, service_name: str = "inferth", max_queue: int = 10000,
+                 batch_size: int = 512, interval: float = 2.0, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, spans):
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._stopped.wait(self.interval)
+            self._drain()
+
+    def _drain(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._post(batch)
+
+    def _post(self, spans):
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+        }]}
+        request = urllib.request.Request(self.url, data=json.dumps(body).encode(),
+                                         headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except Exception as e:
+            self.dropped += len(spans)
+            print(f"Trace export to {self.url} failed ({len(spans)} spans): {e}")
+
+    def shutdown(self):
+        self._stopped.set()
+        self._thread.join(timeout=self.timeout)
+        self._drain()
+
+
+def make_exporter(kind: str, endpoint: str = None, service_name: str = "inferth"):
+    if kind == "otlp":
+        return OTLPHttpExporter(endpoint or "http://localhost:4318", service_name=service_name)
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "memory":
+        return InMemorySpanExporter()
+    return None
+
+
+def configure_from_settings(service_name: str):
+    """Apply TRACE_* settings to the process tracer (API and ingest workers)"""
+    from app.config import settings
+    tracer.configure(service_name=service_name, sample_rate=settings.TRACE_SAMPLE_RATE,
+                     exporter=make_exporter(settings.TRACE_EXPORTER, settings.TRACE_OTLP_ENDPOINT, service_name))
+
+
+class Tracer:
+    def __init__(self, service_name: str = "inferth", sample_rate: float = 0.0, exporter=None):
+        self.service_name = service_name
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+
+    def configure(self, service_name: str = None, sample_rate: float = None, exporter=None):
+        if service_name is not None:
+            self.service_name = service_name
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if exporter is not None:
+            if self.exporter is not None:
+                self.exporter.shutdown()
+            self.exporter = exporter
+
+    def start_span(self, name: str, parent=None, kind: str = "internal", attributes=None,
+                   start_ns=None, links=None):
+        """
+        parent: a Span, SpanContext or traceparent string; defaults to the
+        current span, False starts a new trace. Children follow the parent's
+        sampling decision, new traces are sampled at sample_rate.
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+        if parent is None:
+            parent = current_span.get()
+        elif parent is False:
+            parent = None
+        if isinstance(parent, str):
+            parent = parse_traceparent(parent)
+        elif parent is not None and not isinstance(parent, SpanContext):
+            if not parent.is_recording:
+                return _UnsampledSpan()
+            parent = parent.context
+
+        if parent is not None:
+            if not parent.sampled:
+                return _UnsampledSpan()
+            context = SpanContext(parent.trace_id, _new_id(64), True)
+            parent_id = parent.span_id
+        else:
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return _UnsampledSpan()
+            context = SpanContext(_new_id(128), _new_id(64), True)
+            parent_id = None
+        return Span(self, name, context, parent_id, kind, attributes, start_ns, links)
+
+    def _finish(self, span):
+        try:
+            self.exporter.export([span])
+        except Exception as e:
+            print(f"Trace export error: {e}")
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def _new_id(bits: int):
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+tracer = Tracer()
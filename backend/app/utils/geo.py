@@ -0,0 +1,30 @@
+from fastapi import HTTPException
+from geoalchemy2.elements import WKTElement
+
+def point_geography(latitude: float, longitude: float):
+    """WKT point for the positions.geom geography column (lon/lat order, WGS84)"""
+    if latitude is None or longitude is None:
+        return None
+    return WKTElement(f"POINT({longitude} {latitude})", srid=4326)
+
+def parse_bbox(bbox: str):
+    """Parse a 'west,south,east,north' query string into floats"""
+    try:
+        west, south, east, north = [float(v) for v in bbox.split(",")]
+    except (ValueError, AttributeError):
+        raise HTTPException(400, "bbox must be 'west,south,east,north'")
+    if not (-180 <= west <= 180 and -180 <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(400, "bbox out of range")
+    if west > east:
+        # Viewports crossing the antimeridian are not supported yet
+        raise HTTPException(400, "bbox west must be less than east")
+    return west, south, east, north
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two WGS84 points in kilometres"""
+    from math import radians, cos, sin, asin, sqrt
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    return 6371 * 2 * asin(sqrt(a))  # Radius of earth in kilometers
@@ -0,0 +1 @@
+"""Load generators and benchmark suites (python -m benchmarks.<name>)"""
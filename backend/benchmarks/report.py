@@ -0,0 +1,150 @@
+"""
+Benchmark reports: one JSON document per run, comparable between releases.
+
+    python -m benchmarks.report compare results/ingest-old.json results/ingest-new.json
+
+A report is {"benchmark", "created_at", "environment", "config", "results"}.
+compare() walks the numeric leaves of "results" and judges the ones whose
+name says which direction is better (*_ms, *_bytes, *_per_fix, *amplification* lower;
+*_per_s, *_ratio higher); everything else is shown without a verdict.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+LOWER_IS_BETTER = ("_ms", "_bytes", "_per_fix")
+HIGHER_IS_BETTER = ("_per_s", "_ratio")
+
+
+def percentile(sorted_values, q: float):
+    """Linear interpolation between closest ranks; sorted_values must be sorted"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(values, unit: str = "ms"):
+    """count / mean / p50 / p90 / p99 / max of a list of samples"""
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        f"mean_{unit}": round(sum(values) / len(values), 3),
+        f"p50_{unit}": round(percentile(values, 0.50), 3),
+        f"p90_{unit}": round(percentile(values, 0.90), 3),
+        f"p99_{unit}": round(percentile(values, 0.99), 3),
+        f"max_{unit}": round(values[-1], 3),
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True,
+                                text=True, timeout=5, cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def write_report(benchmark: str, config: dict, results: dict, out: str = None):
+    report = {
+        "benchmark": benchmark,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": environment(),
+        "config": config,
+        "results": results,
+    }
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f"{benchmark}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    return out
+
+
+def load_report(path: str):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _leaves(node, prefix=""):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _leaves(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, node
+
+
+def _direction(path: str):
+    name = path.rsplit(".", 1)[-1]
+    if "amplification" in name or name.endswith(LOWER_IS_BETTER):
+        return -1
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    return 0
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.10):
+    """[(metric, old, new, change, verdict)], verdict is 'better', 'worse', 'same' or ''"""
+    old = dict(_leaves(baseline.get("results", {})))
+    rows = []
+    for path, new_value in _leaves(current.get("results", {})):
+        if path not in old:
+            continue
+        old_value = old[path]
+        change = (new_value - old_value) / old_value if old_value else None
+        direction = _direction(path)
+        verdict = ""
+        if direction and change is not None:
+            if abs(change) <= tolerance:
+                verdict = "same"
+            else:
+                verdict = "better" if change * direction > 0 else "worse"
+        rows.append((path, old_value, new_value, change, verdict))
+    return rows
+
+
+def print_comparison(rows, baseline_name: str = "baseline", current_name: str = "current"):
+    print(f"{'metric':<48} {baseline_name[:14]:>14} {current_name[:14]:>14} {'change':>9}")
+    for path, old_value, new_value, change, verdict in rows:
+        shown = f"{change * 100:+.1f}%" if change is not None else "n/a"
+        print(f"{path:<48} {old_value:>14.6g} {new_value:>14.6g} {shown:>9} {verdict}")
+    worse = [row for row in rows if row[4] == "worse"]
+    print(f"{len(worse)} regression(s) beyond tolerance" if worse else "No regressions beyond tolerance")
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cmp_parser = sub.add_parser("compare")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("current")
+    cmp_parser.add_argument("--tolerance", type=float, default=0.10, help="relative change treated as noise")
+    args = parser.parse_args()
+
+    baseline, current = load_report(args.baseline), load_report(args.current)
+    if baseline.get("benchmark") != current.get("benchmark"):
+        print(f"Warning: comparing {baseline.get('benchmark')} with {current.get('benchmark')}")
+    worse = print_comparison(compare(baseline, current, args.tolerance),
+                             os.path.basename(args.baseline), os.path.basename(args.current))
+    sys.exit(1 if worse else 0)
+
+
+if __name__ == "__main__":
+    main()
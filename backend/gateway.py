@@ -1,8 +1,11 @@
 import asyncio
 import os
 import logging
+import time
 import httpx # Changed from none to httpx
 from dotenv import load_dotenv
+from app.metrics import GATEWAY_FORWARDS, GATEWAY_FORWARD_SECONDS, start_metrics_server
+from app.tracing import tracer, make_exporter
 
 # Setup Logging
 logging.basicConfig(
@@ -19,6 +22,13 @@ LISTEN_HOST = '0.0.0.0'
 LISTEN_PORT = int(os.getenv('GATEWAY_PORT', 9000))
 PRIMARY_DESTINATION = os.getenv('PRIMARY_DESTINATION', 'http://localhost:8000') # Defaults to local
 SECONDARY_DESTINATION = os.getenv('SECONDARY_DESTINATION')
+METRICS_PORT = int(os.getenv('GATEWAY_METRICS_PORT', 9100))  # 0 disables /metrics
+# Tracing: same TRACE_* variables as the backend; the trace id travels to the API as `traceparent`
+tracer.configure(
+    service_name="inferth-gateway",
+    sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', 0)),
+    exporter=make_exporter(os.getenv('TRACE_EXPORTER', 'none'), os.getenv('TRACE_OTLP_ENDPOINT'), "inferth-gateway"),
+)
 
 # TCP Targets (Secondary)
 TARGETS = []
@@ -48,12 +58,23 @@ class ProxyClient:
             return False
 
     async def send(self, data):
+        started = time.perf_counter()
+        with tracer.start_span("gateway.forward", kind="client",
+                               attributes={"target": "secondary", "peer": f"{self.host}:{self.port}"}) as span:
+            ok = await self._send(data)
+            span.set_attribute("outcome", "ok" if ok else "error")
+        outcome = "ok" if ok else "error"
+        GATEWAY_FORWARDS.labels(target="secondary", outcome=outcome).inc()
+        GATEWAY_FORWARD_SECONDS.labels(target="secondary").observe(time.perf_counter() - started)
+
+    async def _send(self, data):
         if not self.writer:
             if not await self.connect():
-                return
+                return False
         try:
             self.writer.write(data)
             await self.writer.drain()
+            return True
         except:
             # Simple retry logic
             self.writer = None
@@ -61,8 +82,10 @@ class ProxyClient:
                try:
                    self.writer.write(data)
                    await self.writer.drain()
+                   return True
                except:
                    pass
+            return False
 
     async def close(self):
         if self.writer:
@@ -80,14 +103,25 @@ async def forward_to_primary(data: bytes, source_ip: str):
         "source_ip": source_ip
     }
     
+    started = time.perf_counter()
+    outcome = "error"
+    span = tracer.start_span("gateway.forward", kind="client", attributes={"target": "primary", "url": url})
+    headers = {"traceparent": span.traceparent()} if span.is_recording else None
     async with httpx.AsyncClient() as client:
         try:
             # We fire and forget mostly, but logging errors is good
-            resp = await client.post(url, json=payload, timeout=5.0)
+            resp = await client.post(url, json=payload, headers=headers, timeout=5.0)
+            span.set_attribute("http.status_code", resp.status_code)
             if resp.status_code != 200:
                 logger.warning(f"Primary Ingest Failed: {resp.status_code} - {resp.text}")
+            else:
+                outcome = "ok"
         except Exception as e:
+            span.record_exception(e)
             logger.error(f"Error forwarding to Primary ({url}): {e}")
+    span.end()
+    GATEWAY_FORWARDS.labels(target="primary", outcome=outcome).inc()
+    GATEWAY_FORWARD_SECONDS.labels(target="primary").observe(time.perf_counter() - started)
 
 async def handle_tracker(reader, writer):
     """Handles incoming connection from a GPS Tracker."""
@@ -110,12 +144,15 @@ async def handle_tracker(reader, writer):
 
             logger.info(f"Recv {len(data)}B from {source_ip} | {data.hex()[:20]}...")
 
-            # 1. Forward to Primary (Inferth Mapping API)
-            asyncio.create_task(forward_to_primary(data, source_ip))
+            # One trace per frame; the forwarding tasks inherit it as their parent
+            with tracer.start_span("gateway.data_received", parent=False, kind="server",
+                                   attributes={"net.peer": source_ip, "bytes": len(data)}):
+                # 1. Forward to Primary (Inferth Mapping API)
+                asyncio.create_task(forward_to_primary(data, source_ip))
 
-            # 2. Forward to Secondary (Legacy TCP)
-            for client in upstream_clients:
-                asyncio.create_task(client.send(data))
+                # 2. Forward to Secondary (Legacy TCP)
+                for client in upstream_clients:
+                    asyncio.create_task(client.send(data))
 
     except Exception as e:
         logger.error(f"Error handling {addr}: {e}")
@@ -131,6 +168,9 @@ async def main():
     )
     logger.info(f"Universal Gateway Listening on {LISTEN_HOST}:{LISTEN_PORT}")
     logger.info(f"Primary Destination: {PRIMARY_DESTINATION}")
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+        logger.info(f"Metrics on :{METRICS_PORT}/metrics")
 
     async with server:
         await server.serve_forever()
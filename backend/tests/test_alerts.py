@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+from app.services.alerts import AlertEngine
+from app.services.pipeline import DeviceRef
+
+DEVICE = DeviceRef(7, 3, "864000000000007")
+
+
+def rule(rule_id, rule_type, threshold=None, duration_seconds=0):
+    return SimpleNamespace(id=rule_id, tenant_id=3, device_id=None, rule_type=rule_type,
+                           threshold=threshold, duration_seconds=duration_seconds, is_active=True)
+
+
+def engine(*rules):
+    alerts = AlertEngine()
+    alerts.set_rules(rules)
+    alerts.active = True
+    return alerts
+
+
+def test_fixes_without_speed_fire_neither_idle_nor_speed():
+    alerts = engine(rule(1, "idle", duration_seconds=300), rule(2, "speed", threshold=80))
+    for second in range(0, 3600, 30):
+        assert alerts.observe(DEVICE, speed=None, latitude=-17.8, longitude=31.0, now=second) == []
+    assert alerts.states[DEVICE.id].since == {}
+
+
+def test_fixes_with_speed_still_evaluate():
+    alerts = engine(rule(1, "idle", duration_seconds=300), rule(2, "speed", threshold=80))
+    assert [a["alert_type"] for a in alerts.observe(DEVICE, speed=95.0, now=0)] == ["speed"]
+    alerts.observe(DEVICE, speed=0.0, now=10)
+    assert [a["alert_type"] for a in alerts.observe(DEVICE, speed=0.0, now=400)] == ["idle"]
+
+
+def test_missing_speed_keeps_an_idle_episode_open():
+    alerts = engine(rule(1, "idle", duration_seconds=300))
+    alerts.observe(DEVICE, speed=0.0, now=0)
+    alerts.observe(DEVICE, speed=None, now=200)
+    assert [a["alert_type"] for a in alerts.observe(DEVICE, speed=1.0, now=301)] == ["idle"]
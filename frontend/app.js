@@ -59,10 +59,34 @@ window.triggerReportAction = function () {
     alert('Downloading CSV Report for ' + (selectedVehicle.name || selectedVehicle.imei) + '...');
 };
 
-window.triggerAlertAction = function () {
-    const type = prompt('Set Alert Type (speed, geofence, offline):', 'speed');
-    if (type) {
-        alert('Alert for ' + type + ' configured successfully!');
+window.triggerAlertAction = async function () {
+    const type = prompt('Set Alert Type (speed, idle, offline):', 'speed');
+    if (!type) return;
+
+    const rule = { rule_type: type.trim().toLowerCase(), device_id: selectedVehicle ? selectedVehicle.id : null };
+    if (rule.rule_type === 'speed') {
+        const limit = prompt('Speed limit (km/h):', '80');
+        if (limit === null) return;
+        rule.threshold = parseFloat(limit);
+    } else {
+        const minutes = prompt(rule.rule_type === 'offline' ? 'Alert after silent for (minutes):' : 'Alert after idling for (minutes):', rule.rule_type === 'offline' ? '30' : '10');
+        if (minutes === null) return;
+        rule.duration_seconds = Math.round(parseFloat(minutes) * 60);
+    }
+
+    try {
+        const response = await window.AuthManager.fetchAPI('/alerts/rules', {
+            method: 'POST',
+            body: JSON.stringify(rule)
+        });
+        if (!response.ok) {
+            const err = await response.json();
+            throw new Error(err.detail || 'Failed to save alert');
+        }
+        alert('Alert for ' + rule.rule_type + ' configured successfully!');
+    } catch (e) {
+        console.error(e);
+        alert('Error: ' + e.message);
     }
 };
 
@@ -1583,7 +1607,8 @@ function showRoutePolyline(points) {
 
 // Connect to WebSocket
 function connectWebSocket() {
-    ws = new WebSocket(WS_URL);
+    // The server only sends this user's tenant; browsers cannot set headers on a WebSocket
+    ws = new WebSocket(WS_URL + '?token=' + encodeURIComponent(window.AuthManager.token || ''));
 
     ws.onopen = () => {
         console.log('WebSocket connected');
@@ -1593,6 +1618,10 @@ function connectWebSocket() {
     ws.onmessage = (event) => {
         try {
             const data = JSON.parse(event.data);
+            if (data.type === 'alert') {
+                addAlert(data.alert_type === 'offline' ? 'danger' : 'warning', data.alert_type.toUpperCase() + ' Alert', data.message);
+                return;
+            }
             if (data.imei && data.latitude && data.longitude) {
                 // Find device and update
                 const deviceId = Object.keys(markers).find(id => {